@@ -0,0 +1,611 @@
+#!/usr/bin/env python3.6
+
+"""
+Benchmarks for lint65.
+
+Generates synthetic ca65 sources that resemble the real source tree
+and times LinkerConfig, Tokenizer, TokenStore, and Linter separately at several input sizes.
+Results can be saved as a JSON baseline and later runs can be compared against it.
+
+Also checks that Tokenizer.lex splits lines exactly like LINE_REGEX,
+that tokenizing time grows linearly with the size of the source,
+and that files split into shards lint exactly like whole files.
+"""
+
+import argparse
+import io
+import json
+import os
+import random
+import re
+import sys
+import time
+
+import lint65
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+TOP_DIR = os.path.dirname(TOOLS_DIR)
+
+# linker config used for every benchmark.
+LINKER_CONFIG_PATH = os.path.join(TOP_DIR, 'conf', 'ld.cfg')
+
+# default number of lines in each generated source.
+SIZES = [1000, 10000, 100000]
+
+# default number of times to repeat each measurement. the fastest run is kept.
+REPEAT = 3
+
+# default source sizes in lines for --check-scaling.
+SCALING_SIZES = [1000, 10000, 100000, 1000000]
+
+# smaller sources for --check-scaling are tokenized repeatedly until about this many lines
+# have been tokenized so that timer noise doesn't dominate their times.
+SCALING_LINES = 100000
+
+# allowed growth of the time per line relative to the smallest source for --check-scaling.
+# memory caches and the garbage collector make big sources up to about 2 times slower per line.
+# anything worse than linear grows at least 10 times for every 10 times more lines.
+SCALING_TOLERANCE = 4.0
+
+# lengths of the adversarial lines that Tokenizer.lex and LINE_REGEX are timed on.
+ADVERSARIAL_WIDTHS = [1000, 4000, 16000]
+
+# number of random lines for --check-lexer.
+CHECK_COUNT = 100000
+
+# size in lines of the generated sources for --check-shards and the number of shards to split into.
+SHARD_CHECK_SIZE = 10000
+SHARD_CHECK_COUNT = 4
+
+# regex for the lines that shards start after. --check-shards also tries them with comments.
+SHARD_END_REGEX = re.compile(r'^(\.end(?:proc|scope))$', re.MULTILINE)
+
+# characters that random lines for --check-lexer are made of.
+CHECK_CHARS = ['a', 'Z', '_', '1', '.', '@', ':', ';', '"', '"', "'", "'", '\\', ' ', '\t', '\r', '\n', '=', '$', '\u00e9']
+
+# default allowed slowdown relative to a baseline before a result counts as a regression.
+TOLERANCE = 0.25
+
+# some words to build identifiers from.
+WORDS = [
+    'add', 'adc', 'byte', 'carry', 'decode', 'exec', 'fetch', 'flag', 'group', 'imm',
+    'io', 'jump', 'load', 'mem', 'modrm', 'mov', 'offset', 'pop', 'port', 'push',
+    'reg', 'rep', 'seg', 'shift', 'stack', 'store', 'sub', 'word', 'write', 'xchg',
+]
+
+
+def snake_name(rng):
+    """Return a random snake_case identifier."""
+    return '_'.join(rng.choice(WORDS) for _ in range(rng.randint(2, 4)))
+
+
+def pascal_name(rng):
+    """Return a random PascalCase identifier."""
+    return ''.join(rng.choice(WORDS).capitalize() for _ in range(rng.randint(1, 3)))
+
+
+def generate_procs(rng, size):
+    """
+    Generate a procedure heavy source like src/x86/execute.s.
+
+    Arguments:
+    rng -- random.Random instance.
+    size -- approximate number of lines to generate.
+    """
+
+    lines = [
+        '',
+        '.include "x86/execute.inc"',
+        '',
+        '.segment "ZEROPAGE"',
+        '',
+        'zbTemp: .res 1',
+        '',
+        '.segment "CODE"',
+        '',
+    ]
+
+    while len(lines) < size:
+        if rng.random() < 0.05:
+            lines += [
+                '; ' + '=' * 78,
+                f'; {snake_name(rng).replace("_", " ")} handlers',
+                '; ' + '=' * 78,
+                '',
+            ]
+
+        name = snake_name(rng)
+        lines += [f'; {name.replace("_", " ")}.', f'.proc {name}']
+
+        for _ in range(rng.randint(3, 20)):
+            roll = rng.random()
+
+            if roll < 0.1:
+                lines.append(f'{snake_name(rng)}:')
+            elif roll < 0.2:
+                lines.append(f'    ; {snake_name(rng).replace("_", " ")}')
+            elif roll < 0.3:
+                lines.append('')
+            elif roll < 0.4:
+                lines.append(f'    bne {snake_name(rng)} ; branch if not zero.')
+            elif roll < 0.5:
+                lines.append(f'    jsr {snake_name(rng)}')
+            elif roll < 0.7:
+                lines.append(f'    lda Reg::zw{pascal_name(rng)}, x')
+            elif roll < 0.8:
+                lines.append(f'    cmp #${rng.randint(0, 255):02x}')
+            else:
+                lines.append(f'    sta zbTemp')
+
+        ending = rng.random()
+
+        if ending < 0.4:
+            lines += ['    rts', '.endproc', '', '']
+        elif ending < 0.7:
+            lines += [f'    jmp {snake_name(rng)}', '    ; [tail_jump]', '.endproc', '', '']
+        elif ending < 0.85:
+            lines += [f'    beq {snake_name(rng)}', '    ; [tail_branch]', '.endproc', '']
+        else:
+            lines += ['    clc', '    ; [fall_through]', '.endproc', '']
+
+    return lines
+
+
+def generate_defines(rng, size):
+    """
+    Generate long continued ".define" lists like DECODE_FUNCS in src/x86/decode.s.
+
+    Arguments:
+    rng -- random.Random instance.
+    size -- approximate number of lines to generate.
+    """
+
+    lines = ['', '.linecont +', '']
+
+    while len(lines) < size:
+        name = pascal_name(rng).upper()
+        count = rng.randint(50, 300)
+        lines.append(f'.define {name}_FUNCS \\')
+        lines += [f'{snake_name(rng)}, \\' for _ in range(count - 1)]
+        lines += [
+            snake_name(rng),
+            '',
+            '.segment "RODATA"',
+            '',
+            f'rba{pascal_name(rng)}Lo:',
+            f'lo_return_bytes {{{name}_FUNCS}}',
+            f'rba{pascal_name(rng)}Hi:',
+            f'hi_return_bytes {{{name}_FUNCS}}',
+            '',
+        ]
+
+    return lines
+
+
+def generate_enum(rng, size):
+    """
+    Generate a header with large ".enum" blocks like include/x86/opcode.inc.
+
+    Arguments:
+    rng -- random.Random instance.
+    size -- approximate number of lines to generate.
+    """
+
+    lines = [
+        '',
+        '.ifndef _BENCH_',
+        '    _BENCH_ = 1',
+        '',
+        '    .scope Bench',
+        '',
+    ]
+
+    while len(lines) < size:
+        lines.append('        .enum')
+
+        for i in range(rng.randint(100, 500)):
+            if i % 16 == 0:
+                lines.append(f'            ; ${i:02X}')
+            lines.append(f'            {pascal_name(rng).upper()}_{i}')
+
+        lines += ['        .endenum', '']
+
+    lines += ['    .endscope', '', '.endif', '']
+    return lines
+
+
+def generate_comments(rng, size):
+    """
+    Generate a comment heavy source with multi-line TODO and NOTE comments.
+
+    Arguments:
+    rng -- random.Random instance.
+    size -- approximate number of lines to generate.
+    """
+
+    lines = ['']
+
+    while len(lines) < size:
+        kind = rng.choice(['TODO', 'NOTE', ''])
+        text = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(4, 12)))
+        lines.append(f'; {kind}: {text}' if kind else f'; {text}')
+
+        for _ in range(rng.randint(0, 8)):
+            text = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(4, 12)))
+            lines.append(f';       {text}')
+
+        lines.append('')
+
+        if rng.random() < 0.2:
+            name = snake_name(rng)
+            lines += [f'; {name}', f'.proc {name}', '    rts', '.endproc', '', '']
+
+    return lines
+
+
+# generators for each kind of synthetic source.
+GENERATORS = {
+    'procs': generate_procs,
+    'defines': generate_defines,
+    'enum': generate_enum,
+    'comments': generate_comments,
+}
+
+
+def generate(kind, size, seed=0):
+    """
+    Return the text of a synthetic ca65 source.
+
+    Arguments:
+    kind -- key of GENERATORS.
+    size -- approximate number of lines to generate.
+    seed -- random seed. the same seed always generates the same source.
+    """
+    lines = GENERATORS[kind](random.Random(f'{kind}:{size}:{seed}'), size)
+    return '\n'.join(lines) + '\n'
+
+
+def generate_adversarial(width):
+    """
+    Return a line full of double quotes that can't be closed because every other one is escaped.
+    LINE_REGEX searches to the end of the line for each of them.
+
+    Arguments:
+    width -- approximate length of the line.
+    """
+    return '    .byte "' + '\\"' * (width // 2) + '\n'
+
+
+def measure(func, repeat):
+    """
+    Return the fastest time in seconds of several calls to a function.
+
+    Arguments:
+    func -- function to call without arguments.
+    repeat -- number of calls.
+    """
+
+    best = None
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    return best
+
+
+def run(sizes, repeat, strict=False):
+    """
+    Run every benchmark and return a dictionary of benchmark names and times in seconds.
+
+    Arguments:
+    sizes -- list of source sizes in lines.
+    repeat -- number of times to repeat each measurement.
+    strict -- Enables strict mode.
+    """
+
+    with open(LINKER_CONFIG_PATH, 'r', encoding='utf-8', newline='') as linker_file:
+        config_text = linker_file.read()
+
+    def parse_config():
+        return lint65.LinkerConfig(io.StringIO(config_text, newline=''))
+
+    segments = lint65.SegmentTable(parse_config())
+    results = {'linker_config': measure(parse_config, repeat)}
+
+    for kind in GENERATORS:
+        for size in sizes:
+            text = generate(kind, size)
+            lines = lint65.Tokenizer(io.StringIO(text, newline=''))
+
+            store = lint65.TokenStore(io.StringIO(text, newline=''))
+
+            def tokenize(text=text):
+                return lint65.Tokenizer(io.StringIO(text, newline=''))
+
+            def tokenize_per_line(text=text):
+                # how Tokenizer used to work: match line by line and read again for raw checks.
+                source_file = io.StringIO(text, newline='')
+                lines = list(lint65.Tokenizer.tokenize(source_file))
+                source_file.seek(0)
+                raw_lines = list(iter(source_file.readline, ''))
+                return lines, raw_lines
+
+            def tokenize_store(text=text):
+                return lint65.TokenStore(io.StringIO(text, newline=''))
+
+            def lint(text=text, lines=lines):
+                return lint65.Linter(segments, io.StringIO(text, newline=''), strict, lines)
+
+            def lint_store(text=text, lines=store):
+                return lint65.Linter(segments, io.StringIO(text, newline=''), strict, lines)
+
+            results[f'tokenizer/{kind}/{size}'] = measure(tokenize, repeat)
+            results[f'tokenizer_per_line/{kind}/{size}'] = measure(tokenize_per_line, repeat)
+            results[f'linter/{kind}/{size}'] = measure(lint, repeat)
+            results[f'token_store/{kind}/{size}'] = measure(tokenize_store, repeat)
+            results[f'linter_store/{kind}/{size}'] = measure(lint_store, repeat)
+
+    for width in ADVERSARIAL_WIDTHS:
+        line = generate_adversarial(width)
+        results[f'line_regex/adversarial/{width}'] = measure(
+            lambda line=line: lint65.LINE_REGEX.match(line), repeat)
+        results[f'lexer/adversarial/{width}'] = measure(
+            lambda line=line: lint65.Tokenizer.lex(line), repeat)
+
+    return results
+
+
+def check_lexer(paths, count, seed=0):
+    """
+    Compare Tokenizer.lex with LINE_REGEX and return the number of lines they split differently.
+    Each difference is printed.
+
+    Lines come from the given files, every kind of generated source, and random characters.
+
+    Arguments:
+    paths -- list of ca65 source files and directories to read lines from.
+    count -- number of random lines to check.
+    seed -- random seed for the random lines.
+    """
+
+    lines = []
+
+    for path in lint65.find_sources(paths):
+        with open(path, 'r', encoding='utf-8', newline='') as source_file:
+            lines += source_file.readlines()
+
+    for kind in GENERATORS:
+        lines += io.StringIO(generate(kind, 10000), newline='').readlines()
+
+    rng = random.Random(seed)
+
+    for _ in range(count):
+        lines.append(''.join(rng.choice(CHECK_CHARS) for _ in range(rng.randint(0, 16))))
+
+    differences = 0
+
+    for line in lines:
+        # lines are matched in place too, like Tokenizer.scan does for whole files.
+        for text, pos in ((line, 0), ('\n' + line, 1)):
+            matches = lint65.LINE_REGEX.match(line)
+            expected = [matches.span(group) for group in range(1, len(lint65.LineTokens._fields) + 1)]
+            expected = [(start + pos, end + pos) if start >= 0 else (start, end)
+                        for start, end in expected]
+            actual = lint65.Tokenizer.lex(text, pos).spans
+
+            if actual != expected:
+                differences += 1
+                print(f'{line!r}: {actual} != {expected}')
+
+    print(f'{len(lines)} lines checked, {differences} differences.')
+    return differences
+
+
+def check_scaling(sizes, tolerance):
+    """
+    Tokenize every kind of generated source at several sizes
+    and return a list of the sources whose time grew faster than linearly.
+    Times are printed as they are measured.
+
+    Arguments:
+    sizes -- list of source sizes in lines, smallest first.
+    tolerance -- allowed growth of the time per line as a multiple of the time per line
+                 of the smallest source of the same kind. see SCALING_TOLERANCE.
+    """
+
+    failures = []
+
+    for kind in GENERATORS:
+        for name, tokenizer in (('tokenizer', lint65.Tokenizer),
+                                ('token_store', lint65.TokenStore)):
+            smallest = None
+
+            for size in sizes:
+                text = generate(kind, size)
+                lines = len(text.splitlines())
+
+                def tokenize(text=text, tokenizer=tokenizer):
+                    return tokenizer(io.StringIO(text, newline=''))
+
+                per_line = measure(tokenize, max(1, SCALING_LINES // size)) / lines
+                smallest = smallest or per_line
+                ratio = per_line / smallest
+                label = f'{name}/{kind}/{size}'
+                flag = ''
+
+                if ratio > tolerance:
+                    failures.append(label)
+                    flag = ' NOT LINEAR'
+
+                print(f'{label:32} {per_line * 1e6:10.3f} us/line {ratio:6.2f}x{flag}', flush=True)
+
+    return failures
+
+
+def check_shards(strict=False):
+    """
+    Lint every kind of generated source split into shards and in one piece
+    and return the number of sources whose warnings differ. Each difference is printed.
+
+    Shards that don't end in the state that the next shard starts in also count as a difference.
+    lint65 would quietly lint those files in one piece and waste the work on the shards.
+
+    Arguments:
+    strict -- Enables strict mode.
+    """
+
+    with open(LINKER_CONFIG_PATH, 'r', encoding='utf-8', newline='') as linker_file:
+        segments = lint65.SegmentTable(lint65.LinkerConfig(linker_file))
+
+    differences = 0
+
+    for kind in GENERATORS:
+        text = generate(kind, SHARD_CHECK_SIZE)
+
+        for name, source in (('plain', text), ('comments', SHARD_END_REGEX.sub(r'\1 ; end', text))):
+            shards = lint65.find_shards(source, SHARD_CHECK_COUNT)
+            results = [
+                lint65.lint_shard(segments, source[shard.start:shard.end], shard,
+                    shard.stop == len(source), strict)
+                for shard in shards
+            ]
+            merged = lint65.merge_shards(results, shards)
+            expected = lint65.Linter(segments, io.StringIO(source, newline=''), strict).warnings
+
+            if merged is None:
+                differences += 1
+                print(f'{kind}/{name}: {len(shards)} shards did not end in the next one\'s state')
+            elif merged != expected:
+                differences += 1
+                print(f'{kind}/{name}: {len(shards)} shards have different warnings')
+            else:
+                print(f'{kind}/{name}: {len(shards)} shards')
+
+    return differences
+
+
+def compare(results, baseline, tolerance):
+    """
+    Print results next to a baseline and return a list of regressed benchmark names.
+
+    Arguments:
+    results -- dictionary of benchmark names and times in seconds.
+    baseline -- dictionary of benchmark names and times in seconds.
+    tolerance -- allowed slowdown as a fraction of the baseline time.
+    """
+
+    regressions = []
+
+    for name, seconds in results.items():
+        base = baseline.get(name)
+
+        if not base:
+            print(f'{name:32} {seconds * 1000:10.2f} ms')
+            continue
+
+        ratio = seconds / base
+        flag = ''
+
+        if ratio > 1 + tolerance:
+            regressions.append(name)
+            flag = ' REGRESSION'
+
+        print(f'{name:32} {seconds * 1000:10.2f} ms {base * 1000:10.2f} ms {ratio:6.2f}x{flag}')
+
+    return regressions
+
+
+def main():
+    """Entry point for this script."""
+
+    parser = argparse.ArgumentParser(
+        description='Benchmark lint65 on synthetic ca65 sources.')
+
+    parser.add_argument('--sizes',
+        help='comma separated source sizes in lines '
+             f'(default: {",".join(str(size) for size in SIZES)}, '
+             f'or {",".join(str(size) for size in SCALING_SIZES)} for --check-scaling)')
+    parser.add_argument('--repeat',
+        help='number of times to repeat each measurement',
+        type=int,
+        default=REPEAT)
+    parser.add_argument('-s', '--strict',
+        help='enable stricter linting rules',
+        action='store_true')
+    parser.add_argument('--baseline',
+        help='JSON baseline to compare results against',
+        metavar='PATH')
+    parser.add_argument('--save',
+        help='save results as a JSON baseline',
+        metavar='PATH')
+    parser.add_argument('--tolerance',
+        help=f'allowed slowdown relative to the baseline (default: {TOLERANCE}, 0.25 means 25%%). '
+             'for --check-scaling, allowed growth of the time per line '
+             f'(default: {SCALING_TOLERANCE})',
+        type=float)
+    parser.add_argument('--dump',
+        help='write a generated source to stdout instead of benchmarking',
+        choices=sorted(GENERATORS))
+    parser.add_argument('--check-lexer',
+        help='check that Tokenizer.lex splits lines like LINE_REGEX instead of benchmarking',
+        nargs='*',
+        metavar='PATH')
+    parser.add_argument('--check-shards',
+        help='check that sources split into shards lint like whole sources instead of benchmarking',
+        action='store_true')
+    parser.add_argument('--check-scaling',
+        help='check that tokenizing time grows linearly with the source size '
+             'instead of benchmarking',
+        action='store_true')
+
+    args = parser.parse_args()
+    sizes = SCALING_SIZES if args.check_scaling else SIZES
+
+    if args.sizes:
+        sizes = sorted(int(size) for size in args.sizes.split(','))
+
+    if args.dump:
+        sys.stdout.write(generate(args.dump, sizes[0]))
+        return
+
+    if args.check_lexer is not None:
+        paths = args.check_lexer or [os.path.join(TOP_DIR, 'src'), os.path.join(TOP_DIR, 'include')]
+
+        if check_lexer(paths, CHECK_COUNT):
+            sys.exit('Tokenizer.lex and LINE_REGEX disagree.')
+        return
+
+    if args.check_shards:
+        if check_shards(args.strict):
+            sys.exit('Shards and whole sources lint differently.')
+        return
+
+    if args.check_scaling:
+        failures = check_scaling(sizes, args.tolerance or SCALING_TOLERANCE)
+
+        if failures:
+            sys.exit(f'{len(failures)} source(s) tokenized in worse than linear time.')
+        return
+
+    results = run(sizes, args.repeat, args.strict)
+    baseline = {}
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as baseline_file:
+            baseline = json.load(baseline_file)
+
+    regressions = compare(results, baseline, args.tolerance or TOLERANCE)
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as save_file:
+            json.dump(results, save_file, indent=4, sort_keys=True)
+
+    if regressions:
+        sys.exit(f'{len(regressions)} benchmark(s) regressed.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3.6
+
+"""
+Generate make dependency files for ca65 sources.
+
+Follows .include commands transitively and .incbin commands through the same directories
+that ca65 searches with -I and --bin-include-dir.
+Each dependency file lists every file that an object really depends on
+so that touching a header only rebuilds the objects that include it.
+
+Usage:
+deps65.py -I include --bin-include-dir binclude -t build/main.o -o build/main.d src/main.s
+"""
+
+import argparse
+import os
+import sys
+
+import lint65
+
+
+class DependencyGraph(lint65.IncludeGraph):
+    """Graph of source files, the headers that they .include, and the files that they .incbin."""
+
+    def __init__(self, include_dirs, bin_include_dirs, cwd='.'):
+        """
+        Initialize an empty graph.
+
+        Arguments:
+        include_dirs -- list of directories to search for included files like ca65's -I option.
+        bin_include_dirs -- list of directories to search for binary files
+                            like ca65's --bin-include-dir option.
+        cwd -- directory that ca65 would be run from.
+               relative include directories are relative to this directory.
+        """
+        super().__init__(include_dirs, cwd=cwd)
+        self.bin_include_dirs = [os.path.join(cwd, path) for path in bin_include_dirs]
+
+
+    def resolve_binary(self, name):
+        """
+        Return the path of a binary file.
+
+        Binary files are often generated by the build.
+        Files that can't be found yet are assumed to be generated in the first binary include
+        directory so that make still knows to rebuild the object once they exist.
+
+        Arguments:
+        name -- file name argument of an .incbin command.
+        """
+
+        # ca65 looks in the current directory before the binary include directories.
+        for directory in [self.cwd] + self.bin_include_dirs:
+            path = os.path.normpath(os.path.join(directory, name))
+
+            if os.path.isfile(path):
+                return path
+
+        if self.bin_include_dirs:
+            return os.path.normpath(os.path.join(self.bin_include_dirs[0], name))
+
+        return os.path.normpath(os.path.join(self.cwd, name))
+
+
+    def get_binaries(self, source_path):
+        """
+        Return the paths of the files that a source file .incbin's.
+
+        Arguments:
+        source_path -- path to a ca65 source file.
+        """
+
+        binaries = []
+
+        for line in self.get_source(source_path)[1]:
+            if line.type != lint65.LineType.COMMAND or line.tokens.instr.lower() != '.incbin':
+                continue
+
+            # the file name may be followed by a start offset and size.
+            matches = lint65.INCLUDE_REGEX.match(line.tokens.args)
+
+            if matches:
+                binaries.append(self.resolve_binary(matches.group(1)))
+
+        return binaries
+
+
+    def get_dependencies(self, source_path):
+        """
+        Return a list of every file that an object assembled from a source file depends on.
+        The source file comes first, then every header, then every binary file.
+
+        Conditional blocks aren't evaluated.
+        A file that is only included for some builds is a dependency of every build.
+
+        Arguments:
+        source_path -- path to a ca65 source file.
+        """
+
+        headers = [source_path]
+        binaries = []
+        seen = {os.path.realpath(source_path)}
+        index = 0
+
+        # headers can include other headers and binary files themselves.
+        while index < len(headers):
+            path = headers[index]
+            index += 1
+
+            for include_path in self.get_includes(path):
+                key = os.path.realpath(include_path)
+
+                if key not in seen:
+                    seen.add(key)
+                    headers.append(include_path)
+
+            for binary_path in self.get_binaries(path):
+                key = os.path.realpath(binary_path)
+
+                if key not in seen:
+                    seen.add(key)
+                    binaries.append(binary_path)
+
+        return headers + binaries
+
+
+def escape(path):
+    """
+    Return a path escaped for a make rule.
+
+    Arguments:
+    path -- file path.
+    """
+    return path.replace('$', '$$').replace(' ', '\\ ').replace('#', '\\#')
+
+
+def format_rules(targets, dependencies):
+    """
+    Return make rules for the dependencies of some targets.
+
+    Like "gcc -MP", every dependency also gets an empty rule of its own.
+    Otherwise make would refuse to build anything after a header is deleted or renamed.
+
+    Arguments:
+    targets -- list of target paths like the object file and the dependency file itself.
+    dependencies -- list of dependency paths. see DependencyGraph.get_dependencies.
+    """
+
+    lines = [f'{" ".join(escape(path) for path in targets)}: \\']
+    lines += [f'    {escape(path)} \\' for path in dependencies[:-1]]
+    lines += [f'    {escape(dependencies[-1])}', '']
+
+    # the source file itself is always made by a rule of its own.
+    for path in dependencies[1:]:
+        lines += [f'{escape(path)}:', '']
+
+    return '\n'.join(lines)
+
+
+def main(source_path, target, output_path=None, include_dirs=(), bin_include_dirs=()):
+    """
+    Entry point for this script.
+
+    Arguments:
+    source_path -- path to a ca65 source file.
+    target -- path of the object file that is assembled from the source file.
+    output_path -- optional path to write the dependency file to. stdout if None.
+                   the dependency file is also a target so that make regenerates it
+                   when any of the files that it lists change.
+    include_dirs -- list of directories to search for included files.
+    bin_include_dirs -- list of directories to search for binary files.
+    """
+
+    graph = DependencyGraph(include_dirs, bin_include_dirs)
+    targets = [target] if output_path is None else [target, output_path]
+    rules = format_rules(targets, graph.get_dependencies(source_path))
+
+    if output_path is None:
+        sys.stdout.write(rules)
+        return
+
+    # make reads dependency files before it gets around to making the build directories.
+    os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+
+    # write to a temporary file first so that make never includes a partial file.
+    temp_path = f'{output_path}.{os.getpid()}.tmp'
+
+    with open(temp_path, 'w', encoding='utf-8') as output_file:
+        output_file.write(rules)
+
+    os.replace(temp_path, output_path)
+
+
+def make_parser():
+    """Return the command line argument parser for this script."""
+
+    parser = argparse.ArgumentParser(
+        description='Generate a make dependency file for a ca65 source file.')
+
+    parser.add_argument('source_path',
+        help='path to a ca65 *.s source file')
+    parser.add_argument('-t', '--target',
+        help='object file that is assembled from the source (default: source with .o)')
+    parser.add_argument('-o', '--output',
+        help='dependency file to write (default: stdout)',
+        dest='output_path',
+        metavar='PATH')
+    parser.add_argument('-I', '--include-dir',
+        help='directory to search for included files like ca65 -I',
+        action='append',
+        dest='include_dirs',
+        metavar='DIR')
+    parser.add_argument('--bin-include-dir',
+        help='directory to search for binary files like ca65 --bin-include-dir',
+        action='append',
+        dest='bin_include_dirs',
+        metavar='DIR')
+
+    return parser
+
+
+if __name__ == '__main__':
+    args = make_parser().parse_args()
+
+    main(args.source_path, args.target or os.path.splitext(args.source_path)[0] + '.o',
+        args.output_path, args.include_dirs or [], args.bin_include_dirs or [])
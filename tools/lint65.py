@@ -1,7 +1,6 @@
 #!/usr/bin/env python3.6
 
 # TODO: check that macros are linted correctly.
-# TODO: return non-zero value if there are warnings
 
 """
 A poorly implemented linter for 6502 assembly with ca65 syntax.
@@ -14,9 +13,21 @@ and wasn't deliberately designed to break the linter.
 # pylint: disable=too-many-lines
 
 import argparse
+import bisect
+import concurrent.futures
+import functools
+import glob
+import hashlib
+import io
+import json
+import os
 import re
+import sqlite3
+import sys
+import time
 
-from collections import namedtuple
+from array import array
+from collections import Counter, namedtuple
 from enum import Enum, auto
 
 # code should be indented in increments of 4 spaces.
@@ -25,6 +36,31 @@ TAB_SIZE = 4
 # maximum allowed line length.
 LINE_LEN = 100
 
+# bump this when the lint cache file format changes.
+CACHE_VERSION = 1
+
+# bump this when the symbol index schema changes.
+INDEX_VERSION = 1
+
+# number of argument strings whose magic numbers are remembered for the rest of the run.
+# operands like "#$00" and "(zwPtr), y" repeat thousands of times across files.
+MAGIC_CACHE_SIZE = 4096
+
+# number of identifiers whose classification is remembered for the rest of the run.
+IDENT_CACHE_SIZE = 8192
+
+# sources with more characters than this are tokenized into a TokenStore.
+# it uses a fraction of the memory of Tokenizer but is slower to lint.
+COMPACT_SIZE = 1 << 20
+
+# cycles saved by each tail call that --fix rewrites.
+# "jsr" and "rts" take 6 cycles each where "jmp" takes 3.
+TAIL_CALL_CYCLES = 6 + 6 - 3
+
+# sources with at least twice this many bytes are split into shards
+# of at least this many bytes when linting in parallel. see find_shards.
+SHARD_SIZE = 1 << 15
+
 # all 6502 mnemonics.
 MNEMONICS = [
     'adc', 'and', 'asl', 'bcc', 'bcs', 'beq', 'bit',
@@ -207,6 +243,168 @@ COMMANDS = [
     '.zeropage ',
 ]
 
+# regex for splitting a line of ca65 assembly code into LineTokens.
+LINE_REGEX = re.compile(
+    '^'
+    '([\t ]+)?' # indent
+    '(?:(@?[a-zA-Z_\\w]+):)?' # label (colon not captured)
+    '(?:[\t ]*)?' # whitespace (not captured)
+    # instruction
+    '(?:'
+        # mnemonic, macro, control command, or symbol definition
+        '(\\.?[a-zA-Z_]\\w*)'
+        '(?:[\t ]*)?' # whitespace (not captured)
+        # arguments
+        '((?:'
+            "'[^'\r\n]'" # quoted character
+            '|'
+            '""' # empty quoted string
+            '|'
+            '".*?[^\\\\\n]"' # quoted string (may not span lines)
+            '|'
+            '[^;\r\n]' # not a comment
+        ')*)'
+        '(?:[\t ]*)?' # whitespace (not captured)
+    ')?'
+    '(;[^\r\n]*)?' # comment (semicolon captured)
+    '(\r?\n)?' # line end
+)
+
+# regexes for Tokenizer.lex, which splits lines the same way as LINE_REGEX in linear time.
+# the start of a line up to the instruction arguments.
+# nothing in it is repeated inside a repetition so it can't backtrack more than one word.
+LINE_HEAD_REGEX = re.compile(
+    '([\t ]+)?' # indent
+    '(?:(@?\\w+):)?' # label (colon not captured)
+    '[\t ]*' # whitespace (not captured)
+    '(?:(\\.?[a-zA-Z_]\\w*)[\t ]*)?' # instruction and whitespace
+)
+# instruction arguments up to the next quote, comment, or line end.
+ARGS_RUN_REGEX = re.compile('[^\'";\r\n]*')
+# comment up to the line end.
+COMMENT_RUN_REGEX = re.compile('[^\r\n]*')
+
+# index of the instruction arguments group in LINE_REGEX.
+ARGS_GROUP = 4
+
+# regexes for parsing ld65 linker configs.
+LINKER_SECTION_REGEX = re.compile('(\\w+)\n*\\{([\\s\\S]*?)\\}')
+LINKER_NAME_REGEX = re.compile('([a-zA-Z_]\\w*)\n*:\n*([\\s\\S]*?;)')
+LINKER_KEYWORD_REGEX = re.compile('(\\w+)\n*=\n*([\\s\\S]+?)[,\n;]')
+
+# regexes for identifier naming conventions.
+SNAKE_CASE_REGEX = re.compile(r'[a-z][a-z0-9_]*')
+PASCAL_CASE_REGEX = re.compile(r'(?:[A-Z0-9][A-Za-z0-9]*)+')
+UPPER_CASE_REGEX = re.compile(r'[A-Z_][A-Z0-9_]*')
+
+# regex for splitting an identifier into a prefix and name.
+PREFIX_NAME_REGEX = re.compile(r'([a-z]+)([A-Z0-9].*)')
+
+# regex for splitting text into quoted strings, quoted chars, and everything else.
+QUOTED_REGEX = re.compile(
+    '('
+        "'[^'\r\n]'" # quoted character
+        '|'
+        '""' # empty quoted string
+        '|'
+        '".*?[^\\\\]"' # quoted string
+        '|'
+        '[^\'""]+' # not quotes
+    ')'
+)
+
+# regex for splitting text into numbers and symbols.
+WORD_REGEX = re.compile(r'(?:^|[^\w%$]+)([\w%$]+)')
+
+# regex for ca65 commands that appear in instruction arguments.
+ARG_COMMAND_REGEX = re.compile(r'(\.[a-zA-Z0-9]+)')
+
+# regex for each symbol name in the arguments of an .export or .import style command.
+SYMBOL_LIST_REGEX = re.compile(r'(?:^|,)\s*(\w+)')
+
+# regex for the header of a hunk in a unified diff.
+HUNK_REGEX = re.compile(r'@@ -\d+(?:,(\d+))? \+(\d+)(?:,(\d+))? @@')
+
+# regex for each token of an .if condition.
+# a hex, binary, or decimal number, a name, or an operator.
+# anything else can't be evaluated for a build variant.
+CONDITION_TOKEN_REGEX = re.compile(
+    r'\s*(?:\$([0-9a-f]+)|%([01]+)|([0-9]+)|(\.?[a-z_]\w*)|'
+    r'(<<|>>|<=|>=|<>|&&|\|\||[-+~<>^*/&|=!()]))\s*',
+    re.IGNORECASE)
+
+# ca65 unary operators in conditions.
+CONDITION_UNARY_OPERATORS = {
+    '+': lambda value: value,
+    '-': lambda value: -value,
+    '~': lambda value: ~value, '.bitnot': lambda value: ~value,
+    '<': lambda value: value & 0xFF, '.lobyte': lambda value: value & 0xFF,
+    '>': lambda value: value >> 8 & 0xFF, '.hibyte': lambda value: value >> 8 & 0xFF,
+    '^': lambda value: value >> 16 & 0xFF, '.bankbyte': lambda value: value >> 16 & 0xFF,
+}
+
+# ca65 binary operators in conditions for each precedence level, loosest first.
+# like ca65, division rounds toward zero and shifts by negative counts shift the other way.
+CONDITION_BINARY_OPERATORS = [
+    {
+        '||': lambda left, right: int(bool(left or right)),
+        '.or': lambda left, right: int(bool(left or right)),
+    },
+    {
+        '&&': lambda left, right: int(bool(left and right)),
+        '.and': lambda left, right: int(bool(left and right)),
+        '.xor': lambda left, right: int(bool(left) != bool(right)),
+    },
+    {
+        '=': lambda left, right: int(left == right),
+        '<>': lambda left, right: int(left != right),
+        '<': lambda left, right: int(left < right),
+        '>': lambda left, right: int(left > right),
+        '<=': lambda left, right: int(left <= right),
+        '>=': lambda left, right: int(left >= right),
+    },
+    {
+        '+': lambda left, right: left + right,
+        '-': lambda left, right: left - right,
+        '|': lambda left, right: left | right, '.bitor': lambda left, right: left | right,
+    },
+    {
+        '*': lambda left, right: left * right,
+        '/': lambda left, right: divide(left, right),
+        '.mod': lambda left, right: left - right * divide(left, right),
+        '&': lambda left, right: left & right, '.bitand': lambda left, right: left & right,
+        '^': lambda left, right: left ^ right, '.bitxor': lambda left, right: left ^ right,
+        '<<': lambda left, right: shift_left(left, right),
+        '.shl': lambda left, right: shift_left(left, right),
+        '>>': lambda left, right: shift_left(left, -right),
+        '.shr': lambda left, right: shift_left(left, -right),
+    },
+]
+
+# regex for command lines that find_shards needs to track blocks and segments.
+SHARD_COMMAND_REGEX = re.compile(
+    r'^[\t ]*(?:@?\w+:)?[\t ]*(\.[a-zA-Z_]\w*)\b([^;\r\n]*)', re.MULTILINE)
+
+# regex for the next non-blank character after a block.
+SHARD_START_REGEX = re.compile(r'[^\r\n]')
+
+# regex for a "NAME:LINKER_CONFIG[:SYMBOL[=VALUE],...]" --variant argument.
+VARIANT_REGEX = re.compile(r'\w+:[^:]+(?::(?:\w+(?:=[^,:]*)?(?:,\w+(?:=[^,:]*)?)*)?)?')
+
+# regex for the file name argument of an .include command.
+INCLUDE_REGEX = re.compile(r'\s*"([^"]+)"')
+
+# regex for a physical line that only has whitespace and maybe a comment.
+# fix_tail_calls only steps over lines like this between a "jsr" and its "rts".
+TAIL_CALL_GAP_REGEX = re.compile(r'[\t ]*(?:;.*)?\r?')
+
+# regexes for comments.
+LINTER_TAG_REGEX = re.compile(r';\s*\[(\w+)\]\s*')
+TODO_REGEX = re.compile(r'^;\s*(TODO|NOTE):\s*(.*?)\s*', re.IGNORECASE)
+TODO_START_REGEX = re.compile(r'^;\s*(TODO|NOTE)', re.IGNORECASE)
+COMMENT_REGEX = re.compile(r'^;\s*(.*?)\s*')
+
+
 class SegmentType(Enum):
     """ca65 segment types."""
 
@@ -234,6 +432,13 @@ class LineType(Enum):
     MACRO = auto() # ca65 macro.
 
 
+class RuleTier(Enum):
+    """Cost tiers of linting rules. Each tier also runs the rules of the tiers before it."""
+
+    FAST = auto() # cheap rules that only look at the current line, like naming and indentation.
+    FULL = auto() # magic number extraction, multi-line comment gathering, and look-ahead.
+
+
 class LinterTag(Enum):
     """Linter tags that may appear in comments."""
 
@@ -269,6 +474,34 @@ TokenizedLine = namedtuple(
 ])
 
 
+# identifier prefix characters that are mutually exclusive and the types they stand for.
+TYPE_PREFIXES = {
+    'b': 'byte',
+    'w': 'word',
+    'd': 'double word',
+    'q': 'quad word',
+    's': 'string',
+}
+
+
+# everything the naming rules need to know about an identifier. see Linter.classify_ident.
+IdentInfo = namedtuple(
+    'IdentInfo',
+    [
+        'snake', # whole identifier is snake case.
+        'pascal', # whole identifier is pascal case.
+        'upper', # whole identifier is upper case.
+        'prefix', # lower case prefix. may be empty.
+        'name', # everything after the prefix.
+        'name_pascal', # name is pascal case.
+        'invalid', # tuple of prefix characters that aren't allowed, in order.
+        'repeated', # a prefix character appears more than once.
+        'ordered', # allowed prefix characters appear in the allowed order.
+        'types', # tuple of the TYPE_PREFIXES types in the prefix.
+        'string_array', # prefix has both string and array characters.
+])
+
+
 class LinkerConfigError(Exception):
     """Raised by LinkerConfig if a parsing error occurs."""
 
@@ -322,17 +555,15 @@ class LinkerConfig(dict):
         lines = '\n'.join(line for line in lines if line)
 
 
-        re_sections = '(\\w+)\n*\\{([\\s\\S]*?)\\}'
-        matches = re.findall(re_sections, lines)
+        matches = LINKER_SECTION_REGEX.findall(lines)
 
         if not matches:
             raise LinkerConfigError('Cannot parse linker sections.')
 
         sections = dict(matches)
 
-        re_names = '([a-zA-Z_]\\w*)\n*:\n*([\\s\\S]*?;)'
         for section, section_data in sections.items():
-            matches = re.findall(re_names, section_data)
+            matches = LINKER_NAME_REGEX.findall(section_data)
 
             if not matches:
                 raise LinkerConfigError('Cannot parse linker names.')
@@ -340,9 +571,8 @@ class LinkerConfig(dict):
             names = dict(matches)
             sections[section] = names
 
-            re_keywords = '(\\w+)\n*=\n*([\\s\\S]+?)[,\n;]'
             for name, name_data in names.items():
-                matches = re.findall(re_keywords, name_data)
+                matches = LINKER_KEYWORD_REGEX.findall(name_data)
 
                 if not matches:
                     raise LinkerConfigError('Cannot parse linker keywords.')
@@ -357,82 +587,355 @@ class TokenizerError(Exception):
     """Raised by Tokenizer if a tokenization error occurs."""
 
 
+class LineMatch:
+    """
+    Spans of the LineTokens fields of a line split by Tokenizer.lex.
+    Supports the parts of the re.Match interface that Tokenizer uses.
+    """
+
+    __slots__ = ('string', 'spans')
+
+
+    def __init__(self, string, spans):
+        """
+        Arguments:
+        string -- text that the line was found in.
+        spans -- list of (start, end) tuples for each group. (-1, -1) if the group didn't match.
+        """
+
+        self.string = string
+        self.spans = spans
+
+
+    def groups(self, default=None):
+        """Return the text of each group or default for groups that didn't match."""
+        string = self.string
+        return tuple(default if start < 0 else string[start:end] for start, end in self.spans)
+
+
+    def span(self, group):
+        """Return the (start, end) tuple of a group. Groups are 1-indexed like LINE_REGEX."""
+        return self.spans[group - 1]
+
+
+    def start(self, group):
+        """Return the start of a group. Groups are 1-indexed like LINE_REGEX."""
+        return self.spans[group - 1][0]
+
+
 class Tokenizer(list):
     """List of tokenized lines. See TokenizedLine."""
 
-    def __init__(self, file):
+    def __init__(self, file=None, text=None):
         """
         Tokenize each line of a ca65 assembly file.
 
         Arguments:
         file -- file object to read assembly code from.
+                may be None if text is given.
+        text -- text of a ca65 assembly file to tokenize instead of reading file.
         """
 
-        line_regex = (
-            '^'
-            '([\t ]+)?' # indent
-            '(?:(@?[a-zA-Z_\\w]+):)?' # label (colon not captured)
-            '(?:[\t ]*)?' # whitespace (not captured)
-            # instruction
-            '(?:'
-                # mnemonic, macro, control command, or symbol definition
-                '(\\.?[a-zA-Z_]\\w*)'
-                '(?:[\t ]*)?' # whitespace (not captured)
-                # arguments
-                '((?:'
-                    "'[^'\r\n]'" # quoted character
-                    '|'
-                    '""' # empty quoted string
-                    '|'
-                    '".*?[^\\\\]"' # quoted string
-                    '|'
-                    '[^;\r\n]' # not a comment
-                ')*)'
-                '(?:[\t ]*)?' # whitespace (not captured)
-            ')?'
-            '(;[^\r\n]*)?' # comment (semicolon captured)
-            '(\r?\n)?' # line end
-        )
+        if text is None:
+            text = file.read()
 
-        lines = []
-        enum_lines = enumerate(iter(file.readline, ''))
+        # (line, line number) tuples for lines that Linter.lint_raw_line needs to check.
+        # they are found while tokenizing so that the file doesn't need to be read again.
+        self.raw_lines = []
 
-        # recursively join continued lines into a single line.
-        # https://cc65.github.io/doc/ca65.html#line_continuations
+        # maps the line number of each line joined from continued lines
+        # to a tuple of (argument index, line number) pairs.
+        # each pair gives the index in the arguments where a following physical line starts.
+        self.line_map = {}
 
+        # the list is built exactly once from a single pass over the text.
+        super().__init__(
+            TokenizedLine(i, line_tokens, line_type)
+            for i, _, line_tokens, line_type in self.scan(text, self.raw_lines, self.line_map))
 
-        def line_cont(line):
-            if line.endswith('\\\n'):
-                try:
-                    _, next_line = next(enum_lines)
-                    line = line.rstrip('\\\n')
-                    line = line + line_cont(next_line)
-                except StopIteration:
-                    pass
-            return line
 
-        # enumerate is zero-indexed.
-        # add 1 since text editors are usually one-indexed.
-        for i, line in ((i+1, line_cont(line)) for i, line in enum_lines):
-            matches = re.match(line_regex, line)
+    @classmethod
+    def tokenize(cls, file):
+        """
+        Tokenize a ca65 assembly file one line at a time.
+        Yield a TokenizedLine for each line.
+
+        Use this instead of Tokenizer when random access to lines isn't needed.
+
+        Arguments:
+        file -- file object to read assembly code from.
+        """
+
+        for i, _, line_tokens, line_type in cls.match_lines(file):
+            yield TokenizedLine(i, line_tokens, line_type)
+
+
+    @classmethod
+    def scan(cls, text, raw_lines=None, line_map=None):
+        """
+        Tokenize the whole text of a ca65 assembly file in a single pass.
+        Yield a line number, LineMatch instance, LineTokens instance, and LineType for each line.
+
+        Match spans are relative to the LineMatch instance's string.
+        That is the text itself unless continued lines were joined into a single line.
+
+        Arguments:
+        text -- text of a ca65 assembly file.
+        raw_lines -- optional list to append (line, line number) tuples to
+                     for lines that might break rules checked by Linter.lint_raw_line.
+        line_map -- optional dictionary to add continued lines to. see Tokenizer.line_map.
+        """
+
+        # reading line by line ends lines at lone carriage returns too
+        # but matching the whole text doesn't. do it the slow way in that case.
+        if '\r' in text and text.count('\r') != text.count('\r\n'):
+            if raw_lines is not None:
+                lines = io.StringIO(text, newline='')
+                raw_lines.extend((line, i + 1) for i, line in enumerate(iter(lines.readline, '')))
+
+            yield from cls.match_lines(io.StringIO(text, newline=''), line_map)
+            return
+
+        size = len(text)
+        pos = 0
+        num = 0
+
+        # these are called for every line.
+        find = text.find
+        lex = cls.lex
+
+        while pos < size:
+            start = pos
+            num += 1
+            first = num
+            stop = find('\n', start) + 1 or size
+            parts = None
+
+            while True:
+                if raw_lines is not None:
+                    # find the end of the line without its line ending.
+                    end = stop - 1 if text[stop - 1] == '\n' else stop
+                    if end > start and text[end - 1] == '\r':
+                        end -= 1
+
+                    # these are the only lines that Linter.lint_raw_line can complain about.
+                    if stop - start > LINE_LEN or (end > start and text[end - 1] in ' \t'):
+                        raw_lines.append((text[start:stop], num))
+
+                # join continued lines into a single line.
+                # https://cc65.github.io/doc/ca65.html#line_continuations
+                if stop - start < 2 or stop == size or not text.startswith('\\\n', stop - 2):
+                    break
+
+                if parts is None:
+                    parts = []
+                    breaks = []
+                    offset = 0
+
+                parts.append(text[start:stop].rstrip('\\\n'))
+                offset += len(parts[-1])
+                breaks.append(offset)
+                start = stop
+                stop = find('\n', start) + 1 or size
+                num += 1
+
+            if parts is None:
+                matches = lex(text, start)
+            else:
+                # split joined lines on their own like reading line by line would.
+                parts.append(text[start:stop])
+                matches = lex(''.join(parts))
+
+                if matches and line_map is not None:
+                    line_map[first] = cls._map_breaks(first, matches, breaks)
+
+            pos = stop
 
             if not matches:
-                raise TokenizerError(f'Line {i} cannot be tokenized.')
+                raise TokenizerError(f'Line {first} cannot be tokenized.')
+
+            # replace None values with empty strings.
+            # this will make linting easier later.
+            line_tokens = LineTokens._make(matches.groups(''))
+            line_type = cls._get_line_type(line_tokens)
+
+            if line_type == LineType.UNKNOWN:
+                raise TokenizerError(f'Line {first} is not recognized.')
+
+            yield first, matches, line_tokens, line_type
+
+
+    @classmethod
+    def match_lines(cls, file, line_map=None):
+        """
+        Split each line of a ca65 assembly file with Tokenizer.lex.
+        Yield a line number, LineMatch instance, LineTokens instance, and LineType for each line.
+
+        Arguments:
+        file -- file object to read assembly code from.
+        line_map -- optional dictionary to add continued lines to. see Tokenizer.line_map.
+        """
 
-            groups = matches.groups()
+        for i, line, breaks in cls._join_lines(file):
+            matches = cls.lex(line)
+
+            if not matches:
+                raise TokenizerError(f'Line {i} cannot be tokenized.')
 
             # replace None values with empty strings.
             # this will make linting easier later.
-            tokens = list(token if token is not None else '' for token in groups)
-            line_tokens = LineTokens(*tokens)
-            line_type = self._get_line_type(line_tokens)
+            line_tokens = LineTokens._make(matches.groups(''))
+            line_type = cls._get_line_type(line_tokens)
 
             if line_type == LineType.UNKNOWN:
                 raise TokenizerError(f'Line {i} is not recognized.')
 
-            tokenized_line = TokenizedLine(i, line_tokens, line_type)
-            lines.append(tokenized_line)
-            super().__init__(lines)
+            if breaks and line_map is not None:
+                line_map[i] = cls._map_breaks(i, matches, breaks)
+
+            yield i, matches, line_tokens, line_type
+
+
+    @staticmethod
+    def lex(text, pos=0):
+        """
+        Split a line of ca65 assembly code into the same groups as LINE_REGEX.
+        Return a LineMatch instance.
+
+        LINE_REGEX searches to the end of the line for the end of each quoted string that
+        can't be closed, so lines with lots of stray quotes take quadratic time.
+        This finds the end of a quoted string at most once per line, so it takes linear time.
+
+        Arguments:
+        text -- text to find the line in.
+        pos -- index in text where the line starts.
+        """
+
+        eol = text.find('\n', pos)
+        if eol < 0:
+            eol = len(text)
+
+        head = LINE_HEAD_REGEX.match(text, pos, eol)
+        pos = head.end()
+        no_match = (-1, -1)
+        spans = [head.span(1), head.span(2), head.span(3), no_match, no_match, no_match]
+
+        # arguments only exist after an instruction.
+        if spans[2][0] >= 0:
+            start = pos
+            run = ARGS_RUN_REGEX.match
+            find = text.find
+            # false once a double quote without a matching end quote was found.
+            # every double quote after it can't be closed either.
+            closable = True
+
+            while True:
+                pos = run(text, pos, eol).end()
+
+                if pos >= eol:
+                    break
+
+                char = text[pos]
+
+                if char == "'":
+                    # quoted character. otherwise it's an ordinary character.
+                    if pos + 2 < eol and text[pos + 2] == "'" and text[pos + 1] not in "'\r":
+                        pos += 3
+                    else:
+                        pos += 1
+
+                elif char == '"':
+                    # empty quoted string.
+                    if text.startswith('""', pos):
+                        pos += 2
+                        continue
+
+                    # quoted string. the end quote can't be escaped by a backslash.
+                    close = find('"', pos + 2, eol) if closable else -1
+                    while close > 0 and text[close - 1] == '\\':
+                        close = find('"', close + 1, eol)
+
+                    # an unclosed quote is an ordinary character.
+                    if close < 0:
+                        closable = False
+                        pos += 1
+                    else:
+                        pos = close + 1
+
+                # comment or carriage return.
+                else:
+                    break
+
+            spans[3] = (start, pos)
+
+        if text.startswith(';', pos):
+            start = pos
+            pos = COMMENT_RUN_REGEX.match(text, pos, eol).end()
+            spans[4] = (start, pos)
+
+        if text.startswith('\n', pos):
+            spans[5] = (pos, pos + 1)
+        elif text.startswith('\r\n', pos):
+            spans[5] = (pos, pos + 2)
+
+        return LineMatch(text, spans)
+
+
+    @staticmethod
+    def _join_lines(file):
+        """
+        Read lines from a file and join continued lines into a single line.
+        Yield a line number, the joined line, and a tuple with the index in the joined line
+        where each physical line after the first one starts.
+
+        Arguments:
+        file -- file object to read assembly code from.
+        """
+
+        # enumerate is zero-indexed.
+        # start at 1 since text editors are usually one-indexed.
+        enum_lines = enumerate(iter(file.readline, ''), 1)
+
+        for i, line in enum_lines:
+            parts = [line]
+            breaks = []
+            offset = 0
+
+            # join continued lines into a single line.
+            # the parts are joined once at the end so that long lists take linear time.
+            # https://cc65.github.io/doc/ca65.html#line_continuations
+            while line.endswith('\\\n'):
+                next_line = next(enum_lines, None)
+
+                # a continued line at the end of the file is left as it is.
+                if next_line is None:
+                    break
+
+                parts[-1] = line.rstrip('\\\n')
+                offset += len(parts[-1])
+                breaks.append(offset)
+                line = next_line[1]
+                parts.append(line)
+
+            yield i, ''.join(parts), tuple(breaks)
+
+
+    @staticmethod
+    def _map_breaks(num, matches, breaks):
+        """
+        Return a Tokenizer.line_map entry for a line that was joined from continued lines.
+
+        Arguments:
+        num -- line number of the first physical line.
+        matches -- LineMatch instance of the joined line.
+        breaks -- tuple of indexes in the joined line where each following physical line starts.
+        """
+
+        args_start = max(matches.start(ARGS_GROUP), 0)
+
+        return tuple(
+            (max(offset - args_start, 0), num + i)
+            for i, offset in enumerate(breaks, 1))
 
 
     @staticmethod
@@ -495,1319 +998,4270 @@ class Tokenizer(list):
         return line_type
 
 
-class LinterError(Exception):
-    """Raised by Linter if a linting error occurs."""
+# every LineType in the order of the codes that TokenStore uses for them.
+LINE_TYPES = tuple(LineType)
 
 
-class Linter:
-    """Check that an assembly file complies with coding style guidelines."""
+class TokenView:
+    """
+    Lightweight stand-in for a TokenizedLine stored in a TokenStore.
 
-    # i don't feel like putting in the work to fix these.
-    # pylint: disable=too-many-instance-attributes
-    # pylint: disable=too-many-public-methods
+    Tokens are sliced out of the store's buffer every time they are asked for.
+    """
+
+    __slots__ = ('store', 'index')
 
-    def __init__(self, linker_config, source_file, strict=False):
+    def __init__(self, store, index):
         """
-        Initialize the linter and lint a tokenized assembly file.
+        Initialize a view of a single line.
 
         Arguments:
-        linker_config -- LinkerConfig instance.
-        source_file -- file object to read assembly code from.
-        strict -- Enables strict mode.
-                  Strict mode enforces some additional linting rules.
-                  These rules are suggestions and don't need to be followed.
+        store -- TokenStore instance.
+        index -- index of the line in the store.
         """
+        self.store = store
+        self.index = index
 
-        self.lines = Tokenizer(source_file)
-        self.strict = strict
-        self.segments = {}
-        self.index = -1
-        self.warnings = []
-        self.blocks = []
-        self.segment = None
-        self.segment_type = None
 
-        # the data we need is in the "SEGMENTS" section.
-        if 'SEGMENTS' not in linker_config:
-            raise LinterError('Linker config is missing a "SEGMENTS" section.')
+    @property
+    def num(self):
+        """Return the line number (1-indexed)."""
+        return self.store.nums[self.index]
 
-        # build a dictionary of segments and their type.
-        # linting rules depend on the type of section we are linting.
-        for name, keywords in linker_config['SEGMENTS'].items():
-            segment_type_name = keywords.get('type', 'unknown').upper()
-            segment_type = SegmentType[segment_type_name]
 
-            if segment_type == SegmentType.UNKNOWN:
-                raise LinterError(f'Unknown segment type for segment "{name}"')
+    @property
+    def type(self):
+        """Return the LineType."""
+        return LINE_TYPES[self.store.types[self.index]]
 
-            self.segments[name] = segment_type
 
-        # ca65 defaults to a "CODE" segment when none has been specified.
-        self.set_segment('CODE')
+    @property
+    def tokens(self):
+        """Return a LineTokens instance."""
+        return self.store.get_tokens(self.index)
 
-        # the linter is fully initialized.
-        # check line length and trailing whitespace here
-        # since that can't be done on tokenized lines.
-        source_file.seek(0)
-        for line_num, line in enumerate(iter(source_file.readline, '')):
-            line_num += 1
-            line = line.rstrip('\n')
-            line = line.rstrip('\r')
-            line_len = len(line)
-            lenght_msg = 'line length is greater than'
 
-            if line_len > LINE_LEN:
-                self.warn(f'{lenght_msg} "{LINE_LEN}" chars', line_num)
+class TokenStore:
+    """
+    Compact read-only sequence of tokenized lines.
 
-            if line.endswith(' ') or line.endswith('\t'):
-                self.warn('Trailing whitespace', line_num)
+    Tokenizer keeps a TokenizedLine, a LineTokens, and six strings around for every line.
+    TokenStore keeps the text of the file, array based offsets for each token,
+    and a byte per line for its LineType instead.
+    Indexing it returns TokenView instances which can be read like TokenizedLine instances.
+    """
 
-        # the rest of the linting process will operate on tokenized lines.
-        self.lint()
+    # number of tokens per line.
+    FIELDS = len(LineTokens._fields)
 
+    def __init__(self, file=None, text=None):
+        """
+        Tokenize each line of a ca65 assembly file.
 
-    @property
-    def line(self):
-        """Return the current tokenized line."""
-        return self.lines[self.index]
+        Arguments:
+        file -- file object to read assembly code from.
+                may be None if text is given.
+        text -- text of a ca65 assembly file to tokenize instead of reading file.
+        """
 
+        if text is None:
+            text = file.read()
+
+        # lines joined from continued lines are added to the end of the text.
+        joined = []
+        offset = len(text)
+        codes = {line_type: code for code, line_type in enumerate(LINE_TYPES)}
+        groups = range(1, self.FIELDS + 1)
+
+        self.nums = array('I')
+        self.types = bytearray()
+        # start and end offsets into the buffer. each line has FIELDS entries in a row.
+        self.starts = array('I')
+        self.ends = array('I')
+        # see Tokenizer.raw_lines and Tokenizer.line_map.
+        self.raw_lines = []
+        self.line_map = {}
+
+        for i, matches, _, line_type in Tokenizer.scan(text, self.raw_lines, self.line_map):
+            self.nums.append(i)
+            self.types.append(codes[line_type])
+
+            if matches.string is text:
+                base = 0
+            else:
+                base = offset
+                joined.append(matches.string)
+                offset += len(matches.string)
 
-    @property
-    def num(self):
-        """Return the current tokenized line's line number."""
-        return self.line.num
+            for group in groups:
+                start, end = matches.span(group)
 
+                # groups that didn't match are empty.
+                if start < 0:
+                    start = end = 0
 
-    @property
-    def tokens(self):
-        """Return the current tokenized line's tokens."""
-        return self.line.tokens
+                self.starts.append(base + start)
+                self.ends.append(base + end)
 
+        self.buffer = text + ''.join(joined) if joined else text
 
-    @property
-    def type(self):
-        """Return the current tokenized line's type."""
-        return self.line.type
 
+    def __len__(self):
+        return len(self.nums)
 
-    @property
-    def indent(self):
-        """Return the current tokenized line's indent token."""
-        return self.tokens.indent
 
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [TokenView(self, i) for i in range(len(self.nums))[index]]
 
-    @property
-    def label(self):
-        """Return the current tokenized line's label token."""
-        return self.tokens.label
+        if index < 0:
+            index += len(self.nums)
 
+        # let the array raise IndexError for lines that don't exist.
+        self.nums[index]  # pylint: disable=pointless-statement
 
-    @property
-    def instr(self):
-        """Return the current tokenized line's instruction token."""
-        return self.tokens.instr
+        return TokenView(self, index)
 
 
-    @property
-    def args(self):
-        """Return the current tokenized line's instruction arguments token."""
-        return self.tokens.args
+    def __iter__(self):
+        for index in range(len(self)):
+            yield TokenView(self, index)
 
 
-    @property
-    def comment(self):
-        """Return the current tokenized line's comment token."""
-        return self.tokens.comment
+    def get_tokens(self, index):
+        """
+        Return a LineTokens instance for a line.
 
+        Arguments:
+        index -- index of the line.
+        """
 
-    @property
-    def end(self):
-        """Return the current tokenized line's line end token."""
-        return self.tokens.end
+        buffer = self.buffer
+        first = index * self.FIELDS
+        last = first + self.FIELDS
 
+        return LineTokens._make([
+            buffer[start:end]
+            for start, end in zip(self.starts[first:last], self.ends[first:last])
+        ])
 
-    @property
-    def command(self):
-        """
-        Return the current tokenized line's instruction token as a command.
-        """
-        return self.instr.lower()
 
+class StructureIndex:
+    """
+    Precomputed structural information about a list of tokenized lines.
 
-    @property
-    def mnemonic(self):
+    Rules use this to answer look-ahead and look-behind questions in constant time
+    instead of scanning the list of lines.
+    Lines are referred to by their distance from each other rather than their index.
+    That allows the index to be updated in place when lines are added or removed.
+    """
+
+    # line types that can sit between a "jsr" and "rts" in an unoptimized tail call.
+    INSIGNIFICANT_TYPES = (
+        LineType.BLANK,
+        LineType.WHITESPACE,
+        LineType.COMMENT,
+        LineType.SYMBOL,
+    )
+
+    def __init__(self, lines):
         """
-        Return the current tokenized line's instruction token as a mnemonic.
+        Index a list of tokenized lines.
+
+        Arguments:
+        lines -- list of TokenizedLine instances.
         """
-        return self.instr.lower()
 
-    @property
-    def block(self):
-        """Return the current block name or an empty string."""
-        return self.blocks[-1] if self.blocks else ''
+        count = len(lines)
 
+        # number of consecutive blank lines after each line.
+        self.blanks_after = [0] * count
+        # number of consecutive comment lines after each line.
+        self.comments_after = [0] * count
 
-    def next_line(self):
-        """
-        Select the next tokenized line of the source file.
+        # the following lists hold distances to other lines. -1 means there is no such line.
+        # distance to the next significant line after each line.
+        self.next_significant_dist = [-1] * count
+        # distance to the previous significant line before each line.
+        self.prev_significant_dist = [-1] * count
+        # distance to the latest ".proc" command at or before each line.
+        self.proc_start_dist = [-1] * count
+        # distance to the first ".endproc" command at or after each line.
+        self.proc_end_dist = [-1] * count
+        # distance to the last mnemonic at or before each line
+        # that isn't separated from that line by a ".proc" command.
+        self.last_mnemonic_dist = [-1] * count
 
-        Returns False if we have reached the end of the file.
-        Returns True otherwise.
-        """
-        self.index += 1
+        self._index_behind(lines, 0, count)
+        self._index_ahead(lines, count - 1, -1)
 
-        if self.index >= len(self.lines):
-            self.index -= 1
-            return False
 
-        return True
+    def next_significant(self, index):
+        """Return the index of the next significant line after a line or -1."""
+        dist = self.next_significant_dist[index]
+        return index + dist if dist >= 0 else -1
 
 
-    def warn(self, message, num=None):
-        """
-        Append a warning message to self.warnings.
+    def prev_significant(self, index):
+        """Return the index of the previous significant line before a line or -1."""
+        dist = self.prev_significant_dist[index]
+        return index - dist if dist >= 0 else -1
 
-        Arguments:
-        message -- warning message to append.
-        num -- line number associated with the warning message.
-        """
-        if num is None:
-            num = self.num
 
-        # warning message format is meant to mimic that of ca65.
-        self.warnings.append(f'({num}): Warning: Linter: {message}')
+    def proc_start(self, index):
+        """Return the index of the latest ".proc" command at or before a line or -1."""
+        dist = self.proc_start_dist[index]
+        return index - dist if dist >= 0 else -1
 
 
-    # 'cry' is an abbreviation of 'cry wolf'
-    # since most warnings from this method can be safely ignored.
-    def cry(self, message, num=None):
-        """
-        Append a warning message to self.warnings if in strict mode is enabled.
+    def proc_end(self, index):
+        """Return the index of the first ".endproc" command at or after a line or -1."""
+        dist = self.proc_end_dist[index]
+        return index + dist if dist >= 0 else -1
 
-        The warning message will be labeled as a strict warning.
 
-        Arguments:
-        message -- warning message to append.
-        num -- line number associated with the warning message.
+    def last_mnemonic(self, index):
         """
-        if self.strict:
-            self.warn(f'Strict: {message}', num)
+        Return the index of the last mnemonic at or before a line or -1.
+        A ".proc" command between the mnemonic and the line counts as no mnemonic.
+        """
+        dist = self.last_mnemonic_dist[index]
+        return index - dist if dist >= 0 else -1
 
 
-    def set_segment(self, segment):
+    def update(self, lines, start, old_stop, new_stop):
         """
-        Change the current segment name and type.
+        Update the index after lines[start:old_stop] were replaced with lines[start:new_stop].
+
+        Only the replaced lines and the lines whose entries depend on them are re-indexed.
+
+        Arguments:
+        lines -- list of TokenizedLine instances after the replacement.
+        start -- index of the first replaced line.
+        old_stop -- index of the line after the last replaced line before the replacement.
+        new_stop -- index of the line after the last replaced line after the replacement.
+        """
+
+        # placeholders never match a real entry so the replaced lines are always re-indexed.
+        placeholders = [None] * (new_stop - start)
+
+        for entries in (
+                self.blanks_after,
+                self.comments_after,
+                self.next_significant_dist,
+                self.prev_significant_dist,
+                self.proc_start_dist,
+                self.proc_end_dist,
+                self.last_mnemonic_dist):
+            entries[start:old_stop] = placeholders
+
+        self._index_behind(lines, start, new_stop)
+        self._index_ahead(lines, new_stop - 1, start)
+
+
+    def _index_behind(self, lines, start, stop):
+        """
+        Index look-behind information from a line forward.
+        Stops at the first unchanged entry at or after the stop line.
+
+        Arguments:
+        lines -- list of TokenizedLine instances.
+        start -- index of the first line to index.
+        stop -- index of the first line that may stop indexing.
+        """
+
+        insignificant = self.INSIGNIFICANT_TYPES
+
+        # pick up where the previous line left off.
+        if start > 0:
+            prev_significant = start - 1
+            if lines[prev_significant].type in insignificant:
+                prev_significant = self.prev_significant(prev_significant)
+            proc_start = self.proc_start(start - 1)
+            last_mnemonic = self.last_mnemonic(start - 1)
+        else:
+            prev_significant = -1
+            proc_start = -1
+            last_mnemonic = -1
+
+        for i in range(start, len(lines)):
+            line = lines[i]
+            line_type = line.type
+
+            if line_type == LineType.COMMAND:
+                if line.tokens.instr.lower() == '.proc':
+                    proc_start = i
+                    last_mnemonic = -1
+            elif line_type == LineType.MNEMONIC:
+                last_mnemonic = i
+
+            prev_significant_dist = i - prev_significant if prev_significant >= 0 else -1
+            proc_start_dist = i - proc_start if proc_start >= 0 else -1
+            last_mnemonic_dist = i - last_mnemonic if last_mnemonic >= 0 else -1
+
+            # the rest of the entries can't change once one of them is unchanged.
+            if (i >= stop
+                    and self.prev_significant_dist[i] == prev_significant_dist
+                    and self.proc_start_dist[i] == proc_start_dist
+                    and self.last_mnemonic_dist[i] == last_mnemonic_dist):
+                break
+
+            self.prev_significant_dist[i] = prev_significant_dist
+            self.proc_start_dist[i] = proc_start_dist
+            self.last_mnemonic_dist[i] = last_mnemonic_dist
+
+            if line_type not in insignificant:
+                prev_significant = i
+
+
+    def _index_ahead(self, lines, start, stop):
+        """
+        Index look-ahead information from a line backward.
+        Stops at the first unchanged entry before the stop line.
+
+        Arguments:
+        lines -- list of TokenizedLine instances.
+        start -- index of the first line to index.
+        stop -- index of the line after the last line that may not stop indexing.
+        """
+
+        # can't be bothered to split this up.
+        # pylint: disable=too-many-locals
+
+        insignificant = self.INSIGNIFICANT_TYPES
+
+        # pick up where the next line left off.
+        if start + 1 < len(lines):
+            following = start + 1
+            line_type = lines[following].type
+            blanks = self.blanks_after[following] + 1 if line_type == LineType.BLANK else 0
+            comments = self.comments_after[following] + 1 if line_type == LineType.COMMENT else 0
+            next_significant = following
+            if line_type in insignificant:
+                next_significant = self.next_significant(following)
+            proc_end = self.proc_end(following)
+        else:
+            blanks = 0
+            comments = 0
+            next_significant = -1
+            proc_end = -1
+
+        for i in range(start, -1, -1):
+            line = lines[i]
+            line_type = line.type
+
+            if line_type == LineType.COMMAND and line.tokens.instr.lower() == '.endproc':
+                proc_end = i
+
+            next_significant_dist = next_significant - i if next_significant >= 0 else -1
+            proc_end_dist = proc_end - i if proc_end >= 0 else -1
+
+            # the rest of the entries can't change once one of them is unchanged.
+            if (i < stop
+                    and self.blanks_after[i] == blanks
+                    and self.comments_after[i] == comments
+                    and self.next_significant_dist[i] == next_significant_dist
+                    and self.proc_end_dist[i] == proc_end_dist):
+                break
+
+            self.blanks_after[i] = blanks
+            self.comments_after[i] = comments
+            self.next_significant_dist[i] = next_significant_dist
+            self.proc_end_dist[i] = proc_end_dist
+
+            blanks = blanks + 1 if line_type == LineType.BLANK else 0
+            comments = comments + 1 if line_type == LineType.COMMENT else 0
+
+            if line_type not in insignificant:
+                next_significant = i
+
+
+class LinterError(Exception):
+    """Raised by Linter if a linting error occurs."""
+
+
+class SegmentTable(dict):
+    """Dictionary mapping segment names to their SegmentType."""
+
+    def __init__(self, linker_config):
+        """
+        Build a segment table from a parsed linker config.
+
+        The table only depends on the linker config
+        so it can be built once and shared by every linted file.
+
+        Arguments:
+        linker_config -- LinkerConfig instance.
+        """
+
+        # the data we need is in the "SEGMENTS" section.
+        if 'SEGMENTS' not in linker_config:
+            raise LinterError('Linker config is missing a "SEGMENTS" section.')
+
+        segments = {}
+
+        # build a dictionary of segments and their type.
+        # linting rules depend on the type of section we are linting.
+        for name, keywords in linker_config['SEGMENTS'].items():
+            segment_type_name = keywords.get('type', 'unknown').upper()
+            segment_type = SegmentType[segment_type_name]
+
+            if segment_type == SegmentType.UNKNOWN:
+                raise LinterError(f'Unknown segment type for segment "{name}"')
+
+            segments[name] = segment_type
+
+        super().__init__(segments)
+
+
+# ca65 commands that open a block mapped to the commands that close the block.
+BLOCK_ENDS = {
+    '.struct': ('.endstruct',),
+    '.union': ('.endunion',),
+    '.enum': ('.endenum',),
+    '.scope': ('.endscope',),
+    '.repeat': ('.endrepeat',),
+    '.mac': ('.endmac', '.endmacro'),
+    '.macro': ('.endmac', '.endmacro'),
+    '.proc': ('.endproc',),
+}
+
+# every ".if" style command opens a conditional block.
+BLOCK_ENDS.update((c, ('.endif',)) for c in COMMANDS if c.startswith('.if'))
+
+# ca65 commands that split a conditional block.
+BLOCK_ELSES = ('.else', '.elseif')
+
+
+# linting rule metadata that is attached to Linter methods by @rule.
+RuleSpec = namedtuple(
+    'RuleSpec',
+    [
+        'types', # tuple of LineTypes that the rule applies to.
+        'commands', # tuple of commands that the rule applies to.
+        'closing', # True if the rule runs before a block is closed.
+        'tier', # RuleTier that the rule belongs to.
+    ])
+
+
+def rule(*line_types, commands=(), closing=False, tier=RuleTier.FAST):
+    """
+    Register a Linter method as a linting rule.
+
+    Rules are only called for lines that they apply to.
+    Rules that apply to commands are called after all line type rules.
+    Rules of each kind are called in the order that they are defined.
+
+    Arguments:
+    line_types -- LineTypes that the rule applies to.
+                  the rule applies to every line type if none are given.
+    commands -- lowercase ca65 commands that the rule applies to.
+                if given, the rule only applies to those commands.
+    closing -- if True, the rule is called for one of its commands
+               only when that command closes the current block
+               and before the block is removed from Linter.blocks.
+    tier -- RuleTier of the rule. rules are skipped when linting with a lower tier.
+    """
+
+    if commands:
+        line_types = ()
+    elif not line_types:
+        line_types = tuple(LineType)
+
+    def decorator(func):
+        func.rule_spec = RuleSpec(line_types, commands, closing, tier)
+        return func
+
+    return decorator
+
+
+# ca65 commands that switch to another segment.
+SEGMENT_COMMANDS = ('.segment', '.zeropage', '.bss', '.data', '.rodata', '.code')
+
+
+# the part of a Linter's state that is carried from one line to the next.
+LinterState = namedtuple(
+    'LinterState',
+    [
+        'blocks', # tuple of open block commands.
+        'segment', # current segment name.
+    ])
+
+
+class Linter:
+    """Check that an assembly file complies with coding style guidelines."""
+
+    # i don't feel like putting in the work to fix these.
+    # pylint: disable=too-many-instance-attributes
+    # pylint: disable=too-many-public-methods
+
+    def __init__(self, segments, source_file, strict=False, lines=None, report=None,
+                 tier=RuleTier.FULL):
+        """
+        Initialize the linter and lint a tokenized assembly file.
+
+        Arguments:
+        segments -- SegmentTable instance.
+        source_file -- file object to read assembly code from.
+                       may be None if lines are given.
+                       raw line checks are skipped in that case.
+        strict -- Enables strict mode.
+                  Strict mode enforces some additional linting rules.
+                  These rules are suggestions and don't need to be followed.
+        lines -- optional list of TokenizedLine instances to lint
+                 instead of tokenizing source_file.
+        report -- optional function to call with each warning message as soon as it's found.
+                  linting stops if it raises an exception.
+        tier -- RuleTier of the most expensive rules to run.
+                RuleTier.FAST skips rules that are too slow for tight edit loops.
+        """
+
+        # i'd rather have a long argument list than a config object.
+        # pylint: disable=too-many-arguments
+
+        self.lines = tokenize_text(source_file.read()) if lines is None else lines
+        self.structure = StructureIndex(self.lines)
+        # see Tokenizer.line_map. plain lists of lines don't have one.
+        self.line_map = getattr(self.lines, 'line_map', {})
+        self.strict = strict
+        self.tier = tier
+        self.segments = segments
+        self.report = report
+        self.index = -1
+        self.line = None
+        self.tokens = None
+        self.warnings = []
+        self.blocks = []
+        self.segment = None
+        self.segment_type = None
+
+        # start at the last line like a list index of -1 would.
+        if self.lines:
+            self.select_line(-1)
+
+        # ca65 defaults to a "CODE" segment when none has been specified.
+        self.set_segment('CODE')
+
+        # the linter is fully initialized.
+        # check line length and trailing whitespace here
+        # since that can't be done on tokenized lines.
+        if source_file is not None:
+            # the tokenizers find the lines to check while tokenizing.
+            raw_lines = getattr(self.lines, 'raw_lines', None)
+
+            if raw_lines is None:
+                source_file.seek(0)
+                raw_lines = ((line, i + 1) for i, line in enumerate(iter(source_file.readline, '')))
+
+            for line, line_num in raw_lines:
+                self.lint_raw_line(line, line_num)
+
+        # the rest of the linting process will operate on tokenized lines.
+        self.lint()
+
+
+    @property
+    def num(self):
+        """Return the current tokenized line's line number."""
+        return self.line.num
+
+
+    @property
+    def type(self):
+        """Return the current tokenized line's type."""
+        return self.line.type
+
+
+    @property
+    def indent(self):
+        """Return the current tokenized line's indent token."""
+        return self.tokens.indent
+
+
+    @property
+    def label(self):
+        """Return the current tokenized line's label token."""
+        return self.tokens.label
+
+
+    @property
+    def instr(self):
+        """Return the current tokenized line's instruction token."""
+        return self.tokens.instr
+
+
+    @property
+    def args(self):
+        """Return the current tokenized line's instruction arguments token."""
+        return self.tokens.args
+
+
+    @property
+    def comment(self):
+        """Return the current tokenized line's comment token."""
+        return self.tokens.comment
+
+
+    @property
+    def end(self):
+        """Return the current tokenized line's line end token."""
+        return self.tokens.end
+
+
+    @property
+    def command(self):
+        """
+        Return the current tokenized line's instruction token as a command.
+        """
+        return self.instr.lower()
+
+
+    @property
+    def mnemonic(self):
+        """
+        Return the current tokenized line's instruction token as a mnemonic.
+        """
+        return self.instr.lower()
+
+
+    @property
+    def block(self):
+        """Return the current block name or an empty string."""
+        return self.blocks[-1] if self.blocks else ''
+
+
+    def select_line(self, index):
+        """
+        Make a tokenized line the current line.
+
+        The current line and its tokens are plain attributes
+        because rules read them far more often than the current line changes.
+
+        Arguments:
+        index -- index of the line in self.lines.
+        """
+        self.index = index
+        self.line = self.lines[index]
+        self.tokens = self.line.tokens
+
+
+    def get_state(self):
+        """Return a LinterState snapshot of the state carried between lines."""
+        return LinterState(tuple(self.blocks), self.segment)
+
+
+    def set_state(self, state):
+        """
+        Restore the state carried between lines from a LinterState snapshot.
+
+        This allows linting to resume at any line with lint_range.
+
+        Arguments:
+        state -- LinterState instance.
+        """
+        self.blocks = list(state.blocks)
+        self.segment = state.segment
+        self.segment_type = self.segments.get(state.segment, SegmentType.UNKNOWN)
+
+
+    @classmethod
+    def get_rules(cls, tier=RuleTier.FULL):
+        """
+        Return the rule dispatch tables for this class.
+        The tables are built once per class and tier from methods decorated with @rule.
+
+        Returns a tuple of dictionaries.
+        The first maps a LineType to a tuple of line type rules.
+        The second maps a command to a tuple of command rules.
+        The third maps a command to a tuple of block closing rules.
+
+        Arguments:
+        tier -- RuleTier of the most expensive rules to include.
+        """
+
+        cached = cls.__dict__.get('_rule_tables')
+
+        if cached is None:
+            cached = cls._rule_tables = {}
+
+        tables = cached.get(tier)
+
+        if tables is not None:
+            return tables
+
+        type_rules = {line_type: [] for line_type in LineType}
+        command_rules = {}
+        closing_rules = {}
+
+        # walk the class hierarchy from the base class down
+        # so that rules keep their definition order.
+        funcs = {}
+        for klass in reversed(cls.__mro__):
+            funcs.update(vars(klass))
+
+        for func in funcs.values():
+            spec = getattr(func, 'rule_spec', None)
+
+            if spec is None or spec.tier.value > tier.value:
+                continue
+
+            for line_type in spec.types:
+                type_rules[line_type].append(func)
+
+            rules = closing_rules if spec.closing else command_rules
+
+            for command in spec.commands:
+                rules.setdefault(command, []).append(func)
+
+        tables = (
+            {k: tuple(v) for k, v in type_rules.items()},
+            {k: tuple(v) for k, v in command_rules.items()},
+            {k: tuple(v) for k, v in closing_rules.items()},
+        )
+
+        cached[tier] = tables
+        return tables
+
+
+    def warn(self, message, num=None):
+        """
+        Append a warning message to self.warnings.
+
+        Arguments:
+        message -- warning message to append.
+        num -- line number associated with the warning message.
+        """
+        if num is None:
+            num = self.num
+
+        # warning message format is meant to mimic that of ca65.
+        warning = f'({num}): Warning: Linter: {message}'
+        self.warnings.append(warning)
+
+        if self.report is not None:
+            self.report(warning)
+
+
+    # 'cry' is an abbreviation of 'cry wolf'
+    # since most warnings from this method can be safely ignored.
+    def cry(self, message, num=None):
+        """
+        Append a warning message to self.warnings if in strict mode is enabled.
+
+        The warning message will be labeled as a strict warning.
+
+        Arguments:
+        message -- warning message to append.
+        num -- line number associated with the warning message.
+        """
+        if self.strict:
+            self.warn(f'Strict: {message}', num)
+
+
+    def get_arg_num(self, index):
+        """
+        Return the physical line number of a character in the current line's arguments.
+
+        Continued lines are joined into a single line numbered after its first physical line.
+        This finds the physical line that the character was actually on.
+
+        Arguments:
+        index -- index of the character in self.args.
+        """
+
+        num = self.num
+
+        for start, break_num in self.line_map.get(num, ()):
+            if index < start:
+                break
+            num = break_num
+
+        return num
+
+
+    def set_segment(self, segment):
+        """
+        Change the current segment name and type.
+
+        Arguments:
+        segment -- new segment name.
+        """
+        self.segment = segment
+        self.segment_type = self.segments.get(segment, SegmentType.UNKNOWN)
+
+        if self.segment_type == SegmentType.UNKNOWN:
+            self.warn(f'Unknown segment type for segment "{segment}".')
+
+
+    @staticmethod
+    def is_snake_case(text):
+        """
+        Check if a string is written in "snake_case".
+
+        Arguments:
+        text -- string to check.
+        """
+        return bool(SNAKE_CASE_REGEX.fullmatch(text))
+
+
+    @staticmethod
+    def is_pascal_case(text):
+        """
+        Check if a string is written in "PascalCase".
+
+        We're using a pretty loose definition of pascal case here.
+        For example, all of the following can be used.
+        FooBar (preferred)
+        FooBAR (allowed but discouraged)
+        FOOBar (allowed but discouraged)
+        FOOBAR (allowed but discouraged)
+
+        Arguments:
+        text -- string to check.
+        """
+
+        return bool(PASCAL_CASE_REGEX.fullmatch(text))
+
+
+    @staticmethod
+    def is_upper_case(text):
+        """
+        Check if a string is written in "UPPER_CASE".
+
+        Arguments:
+        text -- string to check.
+        """
+
+        return bool(UPPER_CASE_REGEX.fullmatch(text))
+
+
+    @staticmethod
+    @functools.lru_cache(maxsize=IDENT_CACHE_SIZE)
+    def classify_ident(ident, prefixes=''):
+        """
+        Classify an identifier for the naming rules.
+        Return an IdentInfo instance.
+
+        The same identifiers show up in many files so results are cached for every Linter
+        in this process. Worker processes have caches of their own.
+        See get_cache_counts for hit and miss counts.
+
+        Arguments:
+        ident -- identifier to classify.
+        prefixes -- prefix characters that are allowed, in the order they must appear in.
+        """
+
+        # try to match a prefixed identifier like this.
+        # 'rbaMyReadonlyByteArray'
+        # split the identifier into a prefix and name.
+        # ('rba', 'MyReadonlyByteArray')
+        matches = PREFIX_NAME_REGEX.fullmatch(ident)
+        prefix, name = matches.groups() if matches else ('', ident)
+
+        prefix_order = iter(prefixes)
+
+        return IdentInfo(
+            snake=Linter.is_snake_case(ident),
+            pascal=Linter.is_pascal_case(ident),
+            upper=Linter.is_upper_case(ident),
+            prefix=prefix,
+            name=name,
+            name_pascal=Linter.is_pascal_case(name),
+            invalid=tuple(char for char in prefix if char not in prefixes),
+            repeated=len(set(prefix)) != len(prefix),
+            # check that prefix characters appear in the right order.
+            ordered=all(any(y == x for y in prefix_order) for x in prefix),
+            types=tuple(TYPE_PREFIXES[char] for char in TYPE_PREFIXES if char in prefix),
+            string_array=all(c in prefix for c in 'sa'))
+
+
+    @staticmethod
+    def join_types(types):
+        """
+        Return a list of mutually exclusive types as English text.
+
+        Arguments:
+        types -- tuple of two or more TYPE_PREFIXES types.
+        """
+
+        text = ', '.join(types[:-1])
+
+        if len(types) > 2:
+            text = text + ','
+
+        return text + f' and {types[-1]}'
+
+
+    def is_documented(self):
+        """Check for documentation above the current line."""
+
+        # if we are at the start of the file then there is no previous line.
+        # therefore there is no documentation above the current line.
+        if not self.index:
+            return False
+
+        # get the previous line
+        index = self.index - 1
+        line = self.lines[index]
+
+        # check if the line is a comment
+        return line.type == LineType.COMMENT
+
+
+    def get_magic_numbers(self, text=None):
+        """
+        Extract "magic numbers" from a sting.
+        Such numbers should be assigned to an identifier before being used.
+        Return a list of magic number strings.
+
+        Arguments:
+        text -- a string to extract magic numbers from.
+        """
+
+        # default to the current line's arguments
+        if text is None:
+            text = self.args
+
+        if not text:
+            return []
+
+        return list(self.find_magic_numbers(text))
+
+
+    @staticmethod
+    @functools.lru_cache(maxsize=MAGIC_CACHE_SIZE)
+    def find_magic_numbers(text):
+        """
+        Extract "magic numbers" from a sting.
+        Return a tuple of magic number strings.
+
+        Results are cached for every Linter in this process.
+        Worker processes have caches of their own. See get_cache_counts for hit and miss counts.
+
+        Arguments:
+        text -- a string to extract magic numbers from.
+        """
+
+        # we want to ignore anything in quotes.
+        # we'll do this be removing quoted content from the text.
+
+        # split the text into quoted strings, quoted chars, and everything else.
+        matches = QUOTED_REGEX.findall(text)
+
+        # remove any matches that have single or double quotes in them.
+        matches = [m for m in matches if not any(q in m for q in '\'"')]
+
+        # text should now contain only numbers, symbols, and operators.
+        text = ' '.join(matches)
+
+        # split text into numbers and symbols.
+        matches = WORD_REGEX.findall(text)
+
+        # build a dictionary that maps strings to their integer values.
+        numbers = {}
+
+        for key in matches:
+            # remove underscores if there are any.
+            num_str = key.replace('_', '')
+
+            try:
+                # parse binary numbers
+                if num_str.startswith('%'):
+                    num_str = num_str.lstrip('%')
+                    value = int(num_str, base=2)
+                # parse hexadecimal numbers
+                elif num_str.startswith('$'):
+                    num_str = num_str.lstrip('$')
+                    value = int(num_str, base=16)
+                # parse decimal numbers
+                elif num_str.isdigit():
+                    value = int(num_str)
+                # not a number
+                else:
+                    continue
+            except ValueError:
+                # catch and ignore errors from int()
+                # if we end up here then ca65 should be complaining
+                # or it's a linting edge case that i don't really care about.
+                continue
+
+            numbers[key] = value
+
+
+        # these numbers are commonly used and well understood at a glance.
+        # as such, they don't need identifiers defined for them.
+        common_numbers = [
+            0x00, # zero
+            0x01, # one
+            0x7f, # max signed byte
+            0x80, # min signed byte
+            0xff, # max unsigned byte or negative one
+            0x7fff, # max signed word
+            0x8000, # min signed word
+            0xffff, # max unsigned word or negative one
+        ]
+
+        # return only the magical numbers.
+        return tuple(k for k, v in numbers.items() if v not in common_numbers)
+
+
+    def get_prefix_name(self, ident=None):
+        """
+        Split an identifier into its prefix and name.
+        Return the prefix and name as a tuple.
+
+        Arguments:
+        ident -- an identifier that should have a prefix.
+        """
+
+        # default to the current line's label
+        if ident is None:
+            ident = self.label
+
+        info = self.classify_ident(ident)
+        return (info.prefix, info.name)
+
+
+    def get_linter_tag(self, line=None):
+        """
+        Extract a linter tag from a comment.
+        Return a LinterTag.
+
+        Arguments:
+        line -- a line TokenizedLine instance.
+        """
+
+        # we need a TokenizedLine so that warnings use the correct line number.
+
+        # default to the current line
+        if line is None:
+            line = self.line
+
+        # if there is no comment then there can be no linter tag.
+        if not line.tokens.comment:
+            return LinterTag.NONE
+
+        # parse the linter tag out of the comment.
+        # the comment should contain only the tag and whitespace.
+        # example:
+        # "; [fall_through]"
+        matches = LINTER_TAG_REGEX.fullmatch(line.tokens.comment)
+
+        # if there is no match then there is no tag
+        # or the comment contained more then just a tag and whitespace.
+        # in the latter case, the absence of a tag will cause other warnings.
+        # that will effectively inform the user of the issue.
+        if not matches:
+            return LinterTag.NONE
+
+        tag_name = matches.group(1)
+
+        if not tag_name.islower():
+            self.warn(f'Linter tag "{tag_name}" should be lowercase.', line.num)
+
+        # lookup the tag name and generate a warning if it's not found.
+        try:
+            return LinterTag[tag_name.upper()]
+        except KeyError:
+            self.warn(f'Linter tag "{tag_name}" is not recognized.', line.num)
+            return LinterTag.NONE
+
+
+    def get_command_alias(self, command=None):
+        """
+        Return the preferred alias for a command when an illegal command is provided.
+        Return an empty string otherwise.
+        If "command" is None then "self.command is used".
+
+        Arguments:
+        command -- ca65 command string. e.g. ".struct".
+        """
+
+        if command is None:
+            command = self.command
+        else:
+            command = command.lower()
+
+        # always use the long form of a command
+        aliases = {
+            '.zeropage': '.segment "ZEROPAGE"',
+            '.bss': '.segment "BSS"',
+            '.data': '.segment "DATA"',
+            '.rodata': '.segment "RODATA"',
+            '.code': '.segment "CODE"',
+            '.byt': '.byte',
+            '.delmac': '.delmacro',
+            '.endmac': '.endmacro',
+            '.endrep': '.endrepeat',
+            '.exitmac': '.exitmacro',
+            '.fopt': '.fileopt',
+            '.mac': '.macro',
+            '.pagelen': '.pagelength',
+            '.refto': '.referto',
+            '.undef': '.undefine',
+            '.def': '.defined',
+            '.ismnem': '.ismnemonic',
+            '.ref': '.referenced',
+        }
+
+        return aliases.get(command, '')
+
+
+    def lint(self):
+        """Lint each tokenized line of a source file."""
+
+        self.lint_range(0, len(self.lines))
+        self.lint_end()
+
+
+    def lint_range(self, start, stop):
+        """
+        Lint a range of tokenized lines.
+
+        Arguments:
+        start -- index of the first line to lint.
+        stop -- index of the line to stop at. this line is not linted.
+        """
+
+        for index in range(start, stop):
+            self.select_line(index)
+            self.lint_line()
+
+
+    def skip_range(self, start, stop):
+        """
+        Carry the state between lines over a range of tokenized lines without linting them.
+        Blocks are opened and closed and segments are switched exactly like lint_line does.
+
+        Arguments:
+        start -- index of the first line to skip.
+        stop -- index of the line to stop at. this line is not skipped.
+        """
+
+        for index in range(start, stop):
+            if self.lines[index].type != LineType.COMMAND:
+                continue
+
+            self.select_line(index)
+            command = self.command
+            block = self.block
+
+            if command in BLOCK_ENDS.get(block, ()):
+                self.blocks.pop()
+            elif command in BLOCK_ELSES and block.startswith('.if'):
+                # the block is split and opened again.
+                pass
+            elif command in BLOCK_ENDS:
+                self.blocks.append(command)
+
+            if command in SEGMENT_COMMANDS:
+                self.segment = self.get_segment_arg()
+                self.segment_type = self.segments.get(self.segment, SegmentType.UNKNOWN)
+
+
+    def lint_end(self):
+        """Check rules for the end of a source file."""
+
+        last = self.lines[-1]
+
+        if not last.tokens.end.endswith('\n'):
+            self.warn('File does not end with a newline.', last.num)
+
+
+    def lint_raw_line(self, line, num):
+        """
+        Check rules that must be checked on an untokenized line.
+
+        Arguments:
+        line -- a single line of the source file.
+        num -- line number of the line (1-indexed).
+        """
+
+        line = line.rstrip('\n')
+        line = line.rstrip('\r')
+        line_len = len(line)
+        lenght_msg = 'line length is greater than'
+
+        if line_len > LINE_LEN:
+            self.warn(f'{lenght_msg} "{LINE_LEN}" chars', num)
+
+        if line.endswith(' ') or line.endswith('\t'):
+            self.warn('Trailing whitespace', num)
+
+
+    def lint_line(self):
+        """
+        Lint a single tokenized line of a source file.
+
+        Only the rules that apply to the line are called.
+        Blocks are opened and closed here so that rules don't need to.
+        """
+
+        type_rules, command_rules, closing_rules = self.get_rules(self.tier)
+        line_type = self.type
+        command = self.command if line_type == LineType.COMMAND else ''
+        block = self.block
+
+        closes = command in BLOCK_ENDS.get(block, ())
+        splits = command in BLOCK_ELSES and block.startswith('.if')
+
+        if closes:
+            for func in closing_rules.get(command, ()):
+                func(self)
+            self.blocks.pop()
+        elif splits:
+            # lines that split a block are indented like the lines that open it.
+            self.blocks.pop()
+
+        for func in type_rules[line_type]:
+            func(self)
+
+        if not command:
+            return
+
+        for func in command_rules.get(command, ()):
+            func(self)
+
+        if splits:
+            self.blocks.append(block)
+        elif command in BLOCK_ENDS:
+            self.blocks.append(command)
+
+
+    @rule()
+    def lint_whitespace(self):
+        """Check whitespace rules for the current line."""
+
+        if '\r' in self.end:
+            self.warn('Found Windows line ending. Expected UNIX line ending.')
+
+        if '\t' in self.indent:
+            self.warn('Found tab char in indent. Only spaces are allowed.')
+
+        # nothing more to check for blank lines.
+        if self.type == LineType.BLANK:
+            return
+
+        indent_size = TAB_SIZE * len(self.blocks)
+
+        # labels should be indented 1 tab less than everything else.
+        if self.label:
+            indent_size -= TAB_SIZE
+
+        indent = ' ' * indent_size
+
+        # check indent depth.
+        if self.indent != indent:
+            if self.type == LineType.COMMENT:
+                # sometimes it's appropriate for comments to disobey indent rules.
+                self.cry(f'Incorrect indent depth. Expected {indent_size} spaces.')
+            else:
+                self.warn(f'Incorrect indent depth. Expected {indent_size} spaces.')
+
+        # blank line rules are more complex after an ".endproc" command.
+        # those rules will be enforced by "lint_command_endproc"
+        if self.type == LineType.COMMAND and self.command == '.endproc':
+            return
+
+        # count the number of blank lines after the current line.
+        # the current line is necessarily not blank.
+        count = self.structure.blanks_after[self.index]
+
+        if count > 1:
+            line_num = self.lines[self.index + count].num
+            self.warn(f'Too many blank lines. Found {count}, Expected 1.', line_num)
+
+
+    @rule()
+    def lint_label(self):
+        """Check label rules for the current line."""
+
+        if not self.label:
+            return
+
+        linter_tag = self.get_linter_tag()
+
+        # check if we are in a code block.
+        if self.block == '.proc' or "CODE" in self.segment:
+            # we are in a code block or code segment.
+            # labels should be code labels unless a linter tag says otherwise.
+            if linter_tag == LinterTag.DATA_LABEL:
+                self.lint_label_data()
+            else:
+                self.lint_label_code()
+        else:
+            # we are not in a code block nor code segment.
+            # labels should be data labels unless a linter tag says otherwise.
+            if linter_tag == LinterTag.CODE_LABEL:
+                self.lint_label_code()
+            else:
+                self.lint_label_data()
+
+
+    def lint_label_code(self):
+        """Check code label rules for the current line."""
+
+        # account for cheap local labels.
+        if self.label.startswith('@'):
+            label = self.label.lstrip('@')
+        else:
+            label = self.label
+
+        if not self.classify_ident(label).snake:
+            self.warn(f'Code label "{label}" is not snake case.')
+
+        if self.type != LineType.LABEL:
+            self.warn('Only comments are allowed after code labels.')
+
+
+    def lint_label_data(self):
+        """Check data label rules for the current line."""
+
+        # this method is kind of a cluster-fuck but it works.
+        # pylint: disable=too-many-branches
+
+        # account for cheap local labels.
+        if self.label.startswith('@'):
+            self.warn('Cheap local data label are not allowed.')
+            label = self.label.lstrip('@')
+        else:
+            label = self.label
+
+        info = self.classify_ident(label, 'rzbwdqasp')
+        prefix = info.prefix
+
+        if not prefix:
+            self.warn(f'Data label "{self.label}" has no prefix.')
+
+        if not info.name:
+            self.warn(f'Data label "{self.label}" has no name.')
+        elif not info.name_pascal:
+            self.warn(f'Data label "{self.label}" name is not pascal case.')
+
+        for char in info.invalid:
+            self.warn(f'Data label "{self.label}" uses an invalid prefix character "{char}".')
+
+        if info.repeated:
+            self.warn(f'Data label "{self.label}" has repeated prefix characters.')
+
+        if not info.ordered:
+            self.warn(f'Data label "{self.label}" has an incorrect prefix order.')
+
+        msg = f'Data label "{self.label}" is prefixed with mutually exclusive types'
+
+        # check if the label contains mutually exclusive prefixes.
+        if len(info.types) > 1:
+            self.warn(f'{msg} {self.join_types(info.types)}.')
+
+        # check if the label is prefixed as a string array.
+        # this is disallowed because a sting array could be ambiguous.
+        # i.e. an array of C strings or an array of string pointers.
+        # in either case, only an array prefix should be used.
+        if info.string_array:
+            self.warn(f'{msg} string and array.')
+
+        # data labels have extra rules based on the segment type.
+        if self.segment_type == SegmentType.ZP and 'z' not in prefix:
+            self.warn(f'Zero-page data label "{self.label}" missing zero-page prefix.')
+
+        if self.segment_type != SegmentType.ZP and 'z' in prefix:
+            self.warn(f'Non-zero-page data label "{self.label}" prefixed as zero-page.')
+
+        if self.segment_type == SegmentType.RO and 'r' not in prefix:
+            self.warn(f'Read-only data label "{self.label}" missing read-only prefix.')
+
+        # writable data is allowed to be prefixed as read-only.
+        # that is useful for exported variables
+        # which should be treated as read-only by the importer.
+
+
+    @rule(LineType.SYMBOL)
+    def lint_symbol(self):
+        """Check symbol rules for the current line."""
+
+        if not self.classify_ident(self.instr).upper:
+            self.warn(f'Symbol "{self.instr}" is not upper case.')
+
+
+    @rule(LineType.MNEMONIC)
+    def lint_mnemonic(self):
+        """Check mnemonic rules for the current line."""
+
+        if self.block != '.proc':
+            self.warn('Found mnemonic outside of ".proc" block.')
+
+        if not self.instr.islower():
+            self.warn('Mnemonic should be lower case.')
+
+        if self.mnemonic in BRANCHES and not self.comment:
+            self.cry('Branch mnemonic missing inline comment.')
+
+
+    @rule(LineType.MNEMONIC, tier=RuleTier.FULL)
+    def lint_mnemonic_magic(self):
+        """Check for magic numbers in the current line's mnemonic arguments."""
+
+        magic = self.get_magic_numbers()
+
+        for num in magic:
+            self.cry(f'Magic number "{num}" in mnemonic arguments.')
+
+
+    @rule(LineType.MNEMONIC, tier=RuleTier.FULL)
+    def lint_mnemonic_tail_call(self):
+        """Check for an unoptimized tail call at the current line."""
+
+        # this rule only applies to 'jsr' mnemonics.
+        if self.mnemonic != 'jsr':
+            return
+
+        # look ahead for a 'rts' mnemonic to find unoptimized tail calls.
+        # blank lines, comments, and symbols wouldn't interfere with optimizing a tail call.
+        index = self.structure.next_significant(self.index)
+
+        if index < 0:
+            return
+
+        line = self.lines[index]
+
+        if line.type == LineType.MNEMONIC and line.tokens.instr.lower() == 'rts':
+            self.warn('Unoptimized tail call.')
+
+
+    @rule(LineType.MACRO)
+    def lint_macro(self):
+        """Check macro rules for the current line."""
+
+        # too lazy to fix this.
+        # pylint: disable=too-many-branches
+
+        if self.block == '.enum':
+            # enum values get classified as macros.
+            # these should be upper case.
+            if not self.classify_ident(self.instr).upper:
+                self.warn(f'Enum value "{self.instr}" is not upper case.')
+        elif self.block in ('.struct', '.union'):
+            # struct and union attributes get classified as macros.
+            # these have similar rules to data labels.
+            info = self.classify_ident(self.instr, 'bwdqasp')
+
+            if not info.prefix:
+                self.warn(f'Attribute "{self.instr}" has no prefix.')
+
+            if not info.name:
+                self.warn(f'Attribute "{self.instr}" has no name.')
+            elif not info.name_pascal:
+                self.warn(f'Attribute "{self.instr}" name is not pascal case.')
+
+            for char in info.invalid:
+                self.warn(f'Attribute "{self.instr}" uses an invalid prefix character "{char}".')
+
+            if info.repeated:
+                self.warn(f'Attribute "{self.instr}" has repeated prefix characters.')
+
+            if not info.ordered:
+                self.warn(f'Attribute "{self.instr}" has an incorrect prefix order.')
+
+            msg = f'Attribute "{self.instr}" is prefixed with mutually exclusive types'
+
+            # check if the attribute contains mutually exclusive prefixes.
+            if len(info.types) > 1:
+                self.warn(f'{msg} {self.join_types(info.types)}.')
+
+            # check if the attribute is prefixed as a string array.
+            # this is disallowed because a sting array could be ambiguous.
+            # i.e. an array of C strings or an array of string pointers.
+            # in either case, only an array prefix should be used.
+            if info.string_array:
+                self.warn(f'{msg} string and array.')
+
+            # the 's' prefix is pulling double duty for strings and structs.
+            # in context, the difference should be clear.
+        else:
+            if not self.classify_ident(self.instr).snake:
+                self.warn(f'Macro name "{self.instr}" is not snake case.')
+
+
+    @rule(LineType.MACRO, tier=RuleTier.FULL)
+    def lint_macro_magic(self):
+        """Check for magic numbers in the current line's macro arguments."""
+
+        # enum values and struct and union attributes get classified as macros.
+        if self.block in ('.enum', '.struct', '.union'):
+            return
+
+        magic = self.get_magic_numbers()
+
+        for num in magic:
+            self.cry(f'Magic number "{num}" in macro arguments.')
+
+    # only lines with an instruction can have arguments.
+    @rule(LineType.SYMBOL, LineType.COMMAND, LineType.MNEMONIC, LineType.MACRO)
+    def lint_args(self):
+        """Check argument rules for the current line."""
+
+        # we're just going to search for commands in arguments and check some basic rules.
+        # this will probably be good enough to catch common errors.
+
+        # pattern match ca65 commands in arguments.
+        for matches in ARG_COMMAND_REGEX.finditer(self.args):
+            command = matches.group(1)
+
+            # filter matches down to valid commands.
+            if command.lower() not in COMMANDS:
+                continue
+
+            # point at the physical line that the command is on if lines were continued.
+            num = self.get_arg_num(matches.start())
+
+            if not command.islower():
+                self.warn(f'Command "{command}" should be lowercase.', num)
+
+            alias = self.get_command_alias(command)
+
+            if alias:
+                self.warn(f'Illegal command "{command}". Use "{alias}" instead.', num)
+
+
+
+    # blank lines and whitespace lines can't have comments.
+    @rule(
+        LineType.COMMENT,
+        LineType.LABEL,
+        LineType.SYMBOL,
+        LineType.COMMAND,
+        LineType.MNEMONIC,
+        LineType.MACRO,
+        tier=RuleTier.FULL)
+    def lint_comment(self):
+        """Check comment rules for the current line."""
+
+        if not self.comment:
+            return
+
+        matches = TODO_REGEX.fullmatch(self.comment)
+
+        if not matches:
+            return
+
+        comment_data = []
+        comment_type, content = matches.groups()
+        comment_data.append(content)
+
+        # comments may span multiple lines.
+        # gather those lines and join them together.
+        # the lines must contain only a comment.
+        stop = self.index + 1 + self.structure.comments_after[self.index]
+
+        for line in (self.lines[i] for i in range(self.index + 1, stop)):
+            line_comment = line.tokens.comment
+
+            # check if this line starts a new TODO or NOTE comment.
+            if TODO_START_REGEX.match(line_comment):
+                break
+
+            # this should always match. no need to check the return value.
+            matches = COMMENT_REGEX.fullmatch(line_comment)
+
+            content = matches.group(1)
+            comment_data.append(content)
+
+        full_comment = ' '.join(comment_data)
+
+        if comment_type.upper() == 'TODO':
+            self.warn(f'TODO: {full_comment}')
+        else: # NOTE
+            self.cry(f'NOTE: {full_comment}')
+
+
+    @rule(LineType.COMMAND)
+    def lint_command(self):
+        """Check ca65 command rules for the current line."""
+
+        if not self.instr.islower():
+            self.warn(f'Command "{self.instr}" should be lowercase.')
+
+        alias = self.get_command_alias()
+
+        if alias:
+            self.warn(f'Illegal command "{self.command}". Use "{alias}" instead.')
+
+
+    def get_segment_arg(self):
+        """Return the name of the segment that the current segment command switches to."""
+
+        if self.command == '.segment':
+            return self.args.split('"')[1]
+
+        # illegal aliases of ".segment" have already been warned about.
+        return self.command[1:].upper()
+
+
+    @rule(commands=SEGMENT_COMMANDS)
+    def lint_command_segment(self):
+        """Check .segment command rules for the current line."""
+
+        self.set_segment(self.get_segment_arg())
+
+
+    @rule(commands=('.struct',))
+    def lint_command_struct(self):
+        """Check .struct command rules for the current line."""
+
+        ident = self.args
+
+        if ident:
+            info = self.classify_ident(ident, 's')
+
+            if not info.prefix:
+                self.warn(f'Struct "{ident}" has no prefix.')
+
+            if 's' not in info.prefix:
+                self.warn(f'Struct "{ident}" is missing "s" prefix.')
+
+            if info.repeated:
+                self.warn(f'Struct "{ident}" has repeated prefix characters.')
+
+            if info.invalid:
+                self.warn(f'Struct "{ident}" has invalid prefix.')
+
+            if not info.name_pascal:
+                self.warn(f'Struct "{ident}" name is not pascal case.')
+        else:
+            self.cry('Unnamed struct.')
+
+
+    @rule(commands=('.union',))
+    def lint_command_union(self):
+        """Check .union command rules for the current line."""
+
+        ident = self.args
+
+        if ident:
+            info = self.classify_ident(ident, 'u')
+
+            if not info.prefix:
+                self.warn(f'Union "{ident}" has no prefix.')
+
+            if 'u' not in info.prefix:
+                self.warn(f'Union "{ident}" is missing "u" prefix.')
+
+            if info.repeated:
+                self.warn(f'Union "{ident}" has repeated prefix characters.')
+
+            if info.invalid:
+                self.warn(f'Union "{ident}" has invalid prefix.')
+
+            if not info.name_pascal:
+                self.warn(f'Union "{ident}" name is not pascal case.')
+        else:
+            self.cry('Unnamed union.')
+
+
+    @rule(commands=('.enum',))
+    def lint_command_enum(self):
+        """Check .enum command rules for the current line."""
+
+        ident = self.args
+
+        if ident:
+            info = self.classify_ident(ident, 'e')
+
+            if not info.prefix:
+                self.warn(f'Enum "{ident}" has no prefix.')
+
+            if 'e' not in info.prefix:
+                self.warn(f'Enum "{ident}" is missing "e" prefix.')
+
+            if info.repeated:
+                self.warn(f'Enum "{ident}" has repeated prefix characters.')
+
+            if info.invalid:
+                self.warn(f'Enum "{ident}" has invalid prefix.')
+
+            if not info.name_pascal:
+                self.warn(f'Enum "{ident}" name is not pascal case.')
+        else:
+            self.cry('Unnamed enum.')
+
+
+    @rule(commands=('.scope',))
+    def lint_command_scope(self):
+        """Check .scope command rules for the current line."""
+
+        name = self.args
+
+        if not name:
+            self.cry(f'Scope has no name.')
+        elif not self.classify_ident(name).pascal:
+            self.warn(f'Scope "{name}" name is not pascal case.')
+
+
+    @rule(commands=('.repeat',), tier=RuleTier.FULL)
+    def lint_command_repeat(self):
+        """Check .rep command rules for the current line."""
+
+        magic = self.get_magic_numbers()
+
+        for num in magic:
+            self.cry(f'Magic number "{num}" in .repeat arguments.')
+
+
+    @rule(commands=('.mac', '.macro'))
+    def lint_command_macro(self):
+        """Check .mac* command rules for the current line."""
+
+        # args will contain a macro name and possibly macro arguments.
+        # strip off arguments since we don't need them.
+        name = self.args.split()[0]
+
+        if not self.classify_ident(name).snake:
+            self.warn(f'Macro name "{name}" is not snake case.')
+
+        if not self.is_documented():
+            self.warn(f'Macro "{name}" is not documented.')
+
+
+    @rule(commands=('.proc',))
+    def lint_command_proc(self):
+        """Check .proc command rules for the current line."""
+
+        name = self.args
+
+        if not self.classify_ident(name).snake:
+            self.warn(f'Procedure name "{name}" is not snake case.')
+
+        if not self.is_documented():
+            self.warn(f'Procedure "{name}" is not documented.')
+
+
+    @rule(commands=('.endproc',), closing=True)
+    def lint_command_endproc(self):
+        """Check linter tags at the end of a procedure."""
+
+        # can't be bothered to fix these.
+        # pylint: disable=too-many-branches
+        # pylint: disable=too-many-statements
+
+        # we have a ".endproc" at the start of the file.
+        # this code probable doesn't even assemble.
+        # ignore it.
+        if not self.index:
+            return
+
+        index = self.index - 1
+        line = self.lines[index]
+
+        # get a linter tag from the end of the procedure if there is one.
+        # we will only consider the line immediately preceding the current line.
+        linter_tag = self.get_linter_tag(line)
+
+        valid_tags = [
+            LinterTag.NONE,
+            LinterTag.FALL_THROUGH,
+            LinterTag.TAIL_JUMP,
+            LinterTag.TAIL_BRANCH,
+        ]
+
+        # filter out linter tags that we don't care about.
+        if linter_tag not in valid_tags:
+            linter_tag = LinterTag.NONE
+
+        tag_line = line
+        tag_name = linter_tag.name.lower()
+
+        if linter_tag != LinterTag.NONE and line.type != LineType.COMMENT:
+            self.warn(f'Linter tag "{tag_name}" should be on its own line ', line.num)
+
+        # find the last mnemonic in the procedure.
+        mnemonic_index = self.structure.last_mnemonic(index)
+
+        # we reached the start of the procedure or file without finding one.
+        if mnemonic_index < 0:
+            return
+
+        line = self.lines[mnemonic_index]
+        mnemonic = line.tokens.instr.lower()
+
+        max_count = 1
+
+        # check if the correct linter tag is given for the last mnemonic.
+        if linter_tag == LinterTag.NONE:
+            if mnemonic in RETURNS:
+                max_count = 2
+            elif mnemonic == 'jmp':
+                max_count = 2
+                self.warn('Missing "tail_jump" linter tag.')
+            elif mnemonic in BRANCHES:
+                self.warn('Missing "tail_branch" linter tag.')
+            else:
+                self.warn('Missing "fall_through" linter tag.')
+        elif mnemonic in RETURNS:
+            max_count = 2
+            self.warn(f'Return incorrectly tagged as "{tag_name}".', tag_line.num)
+        elif mnemonic == 'jmp':
+            max_count = 2
+            if linter_tag != LinterTag.TAIL_JUMP:
+                self.warn(f'Tail jump incorrectly tagged as "{tag_name}".', tag_line.num)
+        elif mnemonic in BRANCHES:
+            if linter_tag != LinterTag.TAIL_BRANCH:
+                self.warn(f'Tail branch incorrectly tagged as "{tag_name}".', tag_line.num)
+        elif linter_tag != LinterTag.FALL_THROUGH:
+            self.warn(f'Fall through incorrectly tagged as "{tag_name}".', tag_line.num)
+
+        # count the number of blank lines after '.endproc'.
+        count = self.structure.blanks_after[self.index]
+        line_num = self.lines[self.index + count].num
+
+        # only blank lines follow '.endproc'.
+        if self.index + count == len(self.lines) - 1:
+            # end of file.
+            max_count = 0
+
+        # 1 blank line must follow procedures that tail branch or fall through.
+        # 2 blank lines must follow procedures that tail jump or return.
+        if count < max_count:
+            self.warn(f'Too few blank lines. Found {count}, Expected {max_count}.', line_num)
+        if count > max_count:
+            self.warn(f'Too many blank lines. Found {count}, Expected {max_count}.', line_num)
+
+
+    @rule(commands=('.define',))
+    def lint_command_define(self):
+        """Check .define command rules for the current line."""
+
+        # strip off macro value
+        name = self.args.split()[0]
+
+        # strip off macro parameters
+        name = name.split('(')[0]
+
+        if not self.classify_ident(name).upper:
+            self.warn(f'Define-style macro "{name}" is not upper case.')
+
+
+class ProfiledRegex:
+    """Compiled regular expression that records how long each call takes."""
+
+    def __init__(self, pattern, stats):
+        """
+        Wrap a compiled regular expression.
+
+        Arguments:
+        pattern -- compiled regular expression.
+        stats -- [calls, seconds] list to add each call to.
+        """
+        self.pattern = pattern
+        self.stats = stats
+
+
+    def __getattr__(self, name):
+        # attributes like 'pattern' and 'flags' are passed through untimed.
+        return getattr(self.pattern, name)
+
+
+    def _call(self, method, *args):
+        """
+        Call a method of the wrapped regular expression and record the time it took.
+
+        Arguments:
+        method -- name of the method to call.
+        args -- arguments to pass to the method.
+        """
+
+        start = time.perf_counter()
+
+        try:
+            return getattr(self.pattern, method)(*args)
+        finally:
+            self.stats[0] += 1
+            self.stats[1] += time.perf_counter() - start
+
+
+    def match(self, *args):
+        """Same as re.Pattern.match."""
+        return self._call('match', *args)
+
+
+    def fullmatch(self, *args):
+        """Same as re.Pattern.fullmatch."""
+        return self._call('fullmatch', *args)
+
+
+    def search(self, *args):
+        """Same as re.Pattern.search."""
+        return self._call('search', *args)
+
+
+    def findall(self, *args):
+        """Same as re.Pattern.findall."""
+        return self._call('findall', *args)
+
+
+    def finditer(self, *args):
+        """Same as re.Pattern.finditer. Each match found counts as a call."""
+
+        matches = self.pattern.finditer(*args)
+
+        while True:
+            start = time.perf_counter()
+            match = next(matches, None)
+            self.stats[0] += 1
+            self.stats[1] += time.perf_counter() - start
+
+            if match is None:
+                return
+
+            yield match
+
+
+class Profiler:
+    """
+    Timing statistics for a lint run.
+
+    Records time spent in each phase, wall time and call counts for each rule
+    and each module level regular expression, and line counts by LineType.
+    """
+
+    # phases in the order that they happen.
+    PHASES = ('config', 'tokenize', 'raw', 'rules', 'other')
+
+    def __init__(self):
+        """Initialize empty statistics."""
+        self.files = 0
+        self.phases = {phase: 0.0 for phase in self.PHASES}
+        self.rules = {}
+        self.regexes = {}
+        self.line_types = {line_type.name: 0 for line_type in LineType}
+        self.saved_regexes = {}
+
+
+    def install(self):
+        """Replace the module level regular expressions with timed ones."""
+
+        module = globals()
+
+        for name, value in list(module.items()):
+            if name.endswith('_REGEX') and not isinstance(value, ProfiledRegex):
+                self.saved_regexes[name] = value
+                stats = self.regexes.setdefault(name, [0, 0.0])
+                module[name] = ProfiledRegex(value, stats)
+
+
+    def uninstall(self):
+        """Restore the module level regular expressions."""
+        globals().update(self.saved_regexes)
+        self.saved_regexes = {}
+
+
+    def add_phase(self, phase, seconds):
+        """
+        Add time to a phase.
+
+        Arguments:
+        phase -- one of Profiler.PHASES.
+        seconds -- time spent.
+        """
+        self.phases[phase] += seconds
+
+
+    def add_rule(self, name, seconds):
+        """
+        Add a call to a rule.
+
+        Arguments:
+        name -- name of the rule.
+        seconds -- time spent in the call.
+        """
+        stats = self.rules.setdefault(name, [0, 0.0])
+        stats[0] += 1
+        stats[1] += seconds
+
+
+    def as_dict(self):
+        """Return the statistics as a JSON serializable dictionary."""
+
+        def calls(stats):
+            return {
+                name: {'calls': count, 'seconds': seconds}
+                for name, (count, seconds) in stats.items()
+            }
+
+        return {
+            'files': self.files,
+            'lines': sum(self.line_types.values()),
+            'line_types': dict(self.line_types),
+            'phases': dict(self.phases),
+            'rules': calls(self.rules),
+            'regexes': calls(self.regexes),
+            'magic_cache': Linter.find_magic_numbers.cache_info()._asdict(),
+            'ident_cache': Linter.classify_ident.cache_info()._asdict(),
+        }
+
+
+    def format_table(self):
+        """Return the statistics as a human readable table."""
+
+        lines = sum(self.line_types.values())
+        table = [f'lint65: profile: {self.files} files, {lines} lines', '']
+
+        table.append(f'{"phase":32} {"ms":>10}')
+        for phase, seconds in self.phases.items():
+            table.append(f'{phase:32} {seconds * 1000:10.2f}')
+
+        table += ['', f'{"cache":32} {"hits":>10} {"misses":>10} {"size":>10}']
+        for name, func in (('magic numbers', Linter.find_magic_numbers),
+                           ('identifiers', Linter.classify_ident)):
+            info = func.cache_info()
+            table.append(f'{name:32} {info.hits:10} {info.misses:10} {info.currsize:10}')
+
+        table += ['', f'{"line type":32} {"lines":>10}']
+        for line_type, count in self.line_types.items():
+            table.append(f'{line_type:32} {count:10}')
+
+        for title, stats in (('rule', self.rules), ('regex', self.regexes)):
+            table += ['', f'{title:32} {"calls":>10} {"ms":>10} {"us/call":>10}']
+
+            # slowest first.
+            for name, (count, seconds) in sorted(stats.items(), key=lambda s: -s[1][1]):
+                per_call = seconds * 1e6 / count if count else 0.0
+                table.append(f'{name:32} {count:10} {seconds * 1000:10.2f} {per_call:10.2f}')
+
+        return '\n'.join(table)
+
+
+class ProfilingLinter(Linter):
+    """Linter that records timing statistics in a Profiler."""
+
+    def __init__(self, profiler, segments, source_file, strict=False, report=None, lines=None,
+                 tier=RuleTier.FULL):
+        """
+        Initialize the linter and lint an assembly file while profiling.
+
+        Arguments:
+        profiler -- Profiler instance to record statistics in.
+        segments -- SegmentTable instance.
+        source_file -- file object to read assembly code from.
+        strict -- Enables strict mode.
+        report -- optional function to call with each warning message as soon as it's found.
+        lines -- optional list of TokenizedLine instances to lint
+                 instead of tokenizing source_file.
+        tier -- RuleTier of the most expensive rules to run.
+        """
+
+        # i'd rather have a long argument list than a config object.
+        # pylint: disable=too-many-arguments
+
+        # the profiler has to be set before the base class starts linting.
+        self.profiler = profiler
+
+        start = time.perf_counter()
+        lines = tokenize_text(source_file.read()) if lines is None else lines
+        tokenized = time.perf_counter()
+
+        for line in lines:
+            profiler.line_types[line.type.name] += 1
+
+        raw = profiler.phases['raw']
+        rules = profiler.phases['rules']
+
+        super().__init__(segments, source_file, strict, lines, report, tier)
+
+        # whatever isn't raw checks or rules is setup like building the structure index.
+        spent = profiler.phases['raw'] - raw + profiler.phases['rules'] - rules
+        profiler.add_phase('tokenize', tokenized - start)
+        profiler.add_phase('other', time.perf_counter() - tokenized - spent)
+        profiler.files += 1
+
+
+    @classmethod
+    def get_rules(cls, tier=RuleTier.FULL):
+        """
+        Return the rule dispatch tables with every rule wrapped in a timer.
+
+        Arguments:
+        tier -- RuleTier of the most expensive rules to include.
+        """
+
+        cached = cls.__dict__.get('_profiled_rule_tables')
+
+        if cached is None:
+            cached = cls._profiled_rule_tables = {}
+
+        tables = cached.get(tier)
+
+        if tables is not None:
+            return tables
+
+        def timed(func):
+            def wrapper(self):
+                start = time.perf_counter()
+                try:
+                    func(self)
+                finally:
+                    self.profiler.add_rule(func.__name__, time.perf_counter() - start)
+            return wrapper
+
+        # every table refers to the same wrapper for the same rule.
+        wrappers = {}
+        tables = tuple(
+            {
+                key: tuple(wrappers.setdefault(func, timed(func)) for func in funcs)
+                for key, funcs in table.items()
+            }
+            for table in super().get_rules(tier)
+        )
+
+        cached[tier] = tables
+        return tables
+
+
+    def lint(self):
+        """Lint each tokenized line of a source file while timing the rule phase."""
+        start = time.perf_counter()
+        super().lint()
+        self.profiler.add_phase('rules', time.perf_counter() - start)
+
+
+    def lint_raw_line(self, line, num):
+        """
+        Check raw line rules while timing the raw line phase.
+
+        Arguments:
+        line -- a single line of the source file.
+        num -- line number of the line (1-indexed).
+        """
+        start = time.perf_counter()
+        super().lint_raw_line(line, num)
+        self.profiler.add_phase('raw', time.perf_counter() - start)
+
+
+class DiffLinter(Linter):
+    """Linter that only checks the blocks around changed lines."""
+
+    def __init__(self, changed, segments, source_file, strict=False, lines=None, report=None,
+                 tier=RuleTier.FULL):
+        """
+        Initialize the linter and lint the parts of an assembly file that changed.
+
+        Arguments:
+        changed -- set of changed line numbers. see parse_diff.
+        segments -- SegmentTable instance.
+        source_file -- file object to read assembly code from.
+        strict -- Enables strict mode.
+        lines -- optional list of TokenizedLine instances to lint
+                 instead of tokenizing source_file.
+        report -- optional function to call with each warning message as soon as it's found.
+        tier -- RuleTier of the most expensive rules to run.
+        """
+
+        # i'd rather have a long argument list than a config object.
+        # pylint: disable=too-many-arguments
+
+        self.changed = changed
+        super().__init__(segments, source_file, strict, lines, report, tier)
+
+
+    def get_ranges(self):
+        """
+        Return a sorted list of (start, stop) tuples of line indexes to lint.
+
+        Changed lines inside a ".proc" or ".scope" block lint the innermost such block.
+        Other changed lines lint themselves and the lines before them
+        whose rules look ahead past insignificant lines.
+        """
+
+        lines = self.lines
+        nums = [line.num for line in lines]
+
+        # (start, stop) tuple of each ".proc" and ".scope" block.
+        blocks = []
+        opened = []
+
+        for index, line in enumerate(lines):
+            if line.type != LineType.COMMAND:
+                continue
+
+            command = line.tokens.instr.lower()
+
+            if command in ('.proc', '.scope'):
+                opened.append(index)
+            elif command in ('.endproc', '.endscope') and opened:
+                blocks.append((opened.pop(), index + 1))
+
+        ranges = []
+
+        for num in sorted(self.changed):
+            # continued lines are tokenized as the line that they continue.
+            index = max(bisect.bisect_right(nums, num) - 1, 0)
+            enclosing = [block for block in blocks if block[0] <= index < block[1]]
+
+            if enclosing:
+                ranges.append(max(enclosing))
+                continue
+
+            # rules for blank line counts, TODO comments, and tail calls
+            # look ahead past insignificant lines.
+            first = index
+            while first > 0 and lines[first - 1].type in StructureIndex.INSIGNIFICANT_TYPES:
+                first -= 1
+
+            ranges.append((max(first - 1, 0), index + 1))
+
+        merged = []
+
+        for start, stop in sorted(ranges):
+            if merged and start <= merged[-1][1]:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], stop))
+            else:
+                merged.append((start, stop))
+
+        return merged
+
+
+    def lint(self):
+        """Lint the ranges of tokenized lines around changed lines."""
+
+        if not self.lines:
+            return
+
+        pos = 0
+        # (start, stop) tuples of the linted lines.
+        self.ranges = self.get_ranges()
+
+        for start, stop in self.ranges:
+            self.skip_range(pos, start)
+            self.lint_range(start, stop)
+            pos = stop
+
+        # the end of the file only matters if the last line was linted.
+        if pos == len(self.lines):
+            self.lint_end()
+
+
+    def lint_raw_line(self, line, num):
+        """
+        Check rules that must be checked on an untokenized line if the line changed.
+
+        Arguments:
+        line -- a single line of the source file.
+        num -- line number of the line (1-indexed).
+        """
+
+        if num in self.changed:
+            super().lint_raw_line(line, num)
+
+
+class VariantLinter(DiffLinter):
+    """
+    Linter for one build variant of an assembly file.
+    Lines in conditional branches that are inactive for the variant are skipped.
+    """
+
+    def __init__(self, inactive, changed, segments, source_file, strict=False, lines=None,
+                 tier=RuleTier.FULL):
+        """
+        Initialize the linter and lint the active lines of an assembly file.
+
+        Arguments:
+        inactive -- set of indexes of inactive lines. see find_inactive.
+        changed -- optional set of line numbers. see DiffLinter.
+                   every line is linted if None.
+        segments -- SegmentTable instance.
+        source_file -- file object to read assembly code from.
+                       may be None if lines are given.
+        strict -- Enables strict mode.
+        lines -- optional list of TokenizedLine instances to lint
+                 instead of tokenizing source_file.
+        tier -- RuleTier of the most expensive rules to run.
+        """
+
+        # i'd rather have a long argument list than a config object.
+        # pylint: disable=too-many-arguments
+
+        self.inactive = inactive
+        # number of warnings from raw line checks. they come before every other warning.
+        self.raw_count = 0
+        super().__init__(changed, segments, source_file, strict, lines, None, tier)
+
+
+    def lint(self):
+        """Lint the active tokenized lines."""
+
+        self.raw_count = len(self.warnings)
+
+        if self.changed is None:
+            Linter.lint(self)
+        else:
+            super().lint()
+
+
+    def lint_raw_line(self, line, num):
+        """
+        Check rules that must be checked on an untokenized line.
 
         Arguments:
-        segment -- new segment name.
+        line -- a single line of the source file.
+        num -- line number of the line (1-indexed).
         """
-        self.segment = segment
-        self.segment_type = self.segments.get(segment, SegmentType.UNKNOWN)
 
-        if self.segment_type == SegmentType.UNKNOWN:
-            self.warn(f'Unknown segment type for segment "{segment}".')
+        if self.changed is None:
+            Linter.lint_raw_line(self, line, num)
+        else:
+            super().lint_raw_line(line, num)
 
 
-    @staticmethod
-    def is_snake_case(text):
+    def lint_range(self, start, stop):
         """
-        Check if a string is written in "snake_case".
+        Lint the active lines in a range of tokenized lines.
 
         Arguments:
-        text -- string to check.
+        start -- index of the first line to lint.
+        stop -- index of the line to stop at. this line is not linted.
         """
-        return bool(re.fullmatch(r'[a-z][a-z0-9_]*', text))
 
+        for index in range(start, stop):
+            if index not in self.inactive:
+                self.select_line(index)
+                self.lint_line()
 
-    @staticmethod
-    def is_pascal_case(text):
+
+    def skip_range(self, start, stop):
         """
-        Check if a string is written in "PascalCase".
+        Carry the state between lines over the active lines in a range of tokenized lines.
 
-        We're using a pretty loose definition of pascal case here.
-        For example, all of the following can be used.
-        FooBar (preferred)
-        FooBAR (allowed but discouraged)
-        FOOBar (allowed but discouraged)
-        FOOBAR (allowed but discouraged)
+        Arguments:
+        start -- index of the first line to skip.
+        stop -- index of the line to stop at. this line is not skipped.
+        """
+
+        for index in range(start, stop):
+            if index not in self.inactive:
+                super().skip_range(index, index + 1)
+
+
+# a build variant to lint for, like the "ksnes" or "edfc" make targets.
+Variant = namedtuple(
+    'Variant',
+    [
+        'name', # variant name.
+        'segments', # SegmentTable instance built from the variant's linker config.
+        'defines', # frozenset of symbols defined with -D.
+])
+
+
+def wrap_long(value):
+    """
+    Return an integer wrapped to 32 bits like a ca65 expression.
+
+    Arguments:
+    value -- integer to wrap.
+    """
+    return (value + 0x80000000 & 0xFFFFFFFF) - 0x80000000
+
+
+def divide(left, right):
+    """
+    Return the quotient of two integers rounded toward zero like ca65 does.
+    Raises ZeroDivisionError if the divisor is zero.
+
+    Arguments:
+    left -- dividend.
+    right -- divisor.
+    """
+
+    quotient = abs(left) // abs(right)
+    return quotient if (left < 0) == (right < 0) else -quotient
+
+
+def shift_left(value, count):
+    """
+    Return an integer shifted left like ca65 does. Negative counts shift right instead.
+
+    Arguments:
+    value -- integer to shift.
+    count -- number of bits to shift by.
+    """
+
+    # every bit has been shifted out of a 32 bit value long before the count gets this big.
+    count = max(-32, min(count, 32))
+    return value << count if count >= 0 else value >> -count
+
+
+class ConditionParser:
+    """
+    Recursive descent parser that evaluates an .if condition for a build variant
+    with ca65's operators and precedence.
+
+    Numbers and .defined() of controlled symbols can be evaluated.
+    Anything else raises ValueError since it may have any value, like other symbols,
+    or isn't a ca65 expression at all.
+    """
+
+    def __init__(self, text, defines, controlled):
+        """
+        Split a condition into tokens.
 
         Arguments:
-        text -- string to check.
+        text -- condition text.
+        defines -- set of symbols that the variant defines.
+        controlled -- set of symbols that any variant defines.
         """
 
-        return bool(re.fullmatch(r'(?:[A-Z0-9][A-Za-z0-9]*)+', text))
+        self.defines = defines
+        self.controlled = controlled
+        # list of (number, name, operator) tuples. only one of them is not None.
+        self.tokens = []
+        self.index = 0
+        pos = 0
 
+        while pos < len(text):
+            matches = CONDITION_TOKEN_REGEX.match(text, pos)
 
-    @staticmethod
-    def is_upper_case(text):
+            if not matches:
+                raise ValueError(f'Unexpected character in condition: {text[pos:]}')
+
+            hex_digits, binary_digits, decimal_digits, name, operator = matches.groups()
+
+            if name is not None or operator is not None:
+                self.tokens.append((None, name, (name or operator).lower()))
+            elif hex_digits is not None:
+                self.tokens.append((int(hex_digits, 16), None, None))
+            elif binary_digits is not None:
+                self.tokens.append((int(binary_digits, 2), None, None))
+            else:
+                self.tokens.append((int(decimal_digits), None, None))
+
+            pos = matches.end()
+
+
+    @property
+    def operator(self):
+        """Return the lowercase name or operator of the next token or None."""
+
+        if self.index < len(self.tokens):
+            return self.tokens[self.index][2]
+
+        return None
+
+
+    def expect(self, operator):
         """
-        Check if a string is written in "UPPER_CASE".
+        Skip the next token if it's an operator. Raises ValueError if it isn't.
 
         Arguments:
-        text -- string to check.
+        operator -- expected operator.
         """
 
-        return bool(re.fullmatch(r'[A-Z_][A-Z0-9_]*', text))
+        if self.operator != operator:
+            raise ValueError(f'Expected "{operator}" in condition.')
 
+        self.index += 1
 
-    def is_documented(self):
-        """Check for documentation above the current line."""
 
-        # if we are at the start of the file then there is no previous line.
-        # therefore there is no documentation above the current line.
-        if not self.index:
-            return False
+    def parse(self):
+        """
+        Return the value of the whole condition as an integer.
+        ca65 conditions are true if they are not zero.
+        """
 
-        # get the previous line
-        index = self.index - 1
-        line = self.lines[index]
+        value = self.parse_not()
 
-        # check if the line is a comment
-        return line.type == LineType.COMMENT
+        if self.index != len(self.tokens):
+            raise ValueError('Unexpected token in condition.')
 
+        return value
 
-    def get_magic_numbers(self, text=None):
+
+    def parse_not(self):
+        """Return the value of a ".not" expression, which has the lowest precedence."""
+
+        if self.operator in ('!', '.not'):
+            self.index += 1
+            return int(not self.parse_not())
+
+        return self.parse_binary(0)
+
+
+    def parse_binary(self, level):
         """
-        Extract "magic numbers" from a sting.
-        Such numbers should be assigned to an identifier before being used.
-        Return a list of magic number strings.
+        Return the value of a binary expression.
 
         Arguments:
-        text -- a string to extract magic numbers from.
+        level -- index of the precedence level in CONDITION_BINARY_OPERATORS.
         """
 
-        # we want to ignore anything in quotes.
-        # we'll do this be removing quoted content from the text.
+        if level == len(CONDITION_BINARY_OPERATORS):
+            return self.parse_unary()
 
-        # default to the current line's arguments
-        if text is None:
-            text = self.args
+        operators = CONDITION_BINARY_OPERATORS[level]
+        value = self.parse_binary(level + 1)
 
-        if not text:
-            return []
+        while self.operator in operators:
+            func = operators[self.operator]
+            self.index += 1
+            value = wrap_long(func(value, self.parse_binary(level + 1)))
 
-        regex = (
-            '('
-                "'[^'\r\n]'" # quoted character
-                '|'
-                '""' # empty quoted string
-                '|'
-                '".*?[^\\\\]"' # quoted string
-                '|'
-                '[^\'""]+' # not quotes
-            ')'
-        )
+        return value
 
-        # split the text into quoted strings, quoted chars, and everything else.
-        matches = re.findall(regex, text)
 
-        # remove any matches that have single or double quotes in them.
-        matches = [m for m in matches if not any(q in m for q in '\'"')]
+    def parse_unary(self):
+        """Return the value of a number, a function, or a unary or parenthesized expression."""
 
-        # text should now contain only numbers, symbols, and operators.
-        text = ' '.join(matches)
+        if self.index == len(self.tokens):
+            raise ValueError('Unexpected end of condition.')
 
-        # split text into numbers and symbols.
-        regex = r'(?:^|[^\w%$]+)([\w%$]+)'
-        matches = re.findall(regex, text)
+        number, name, operator = self.tokens[self.index]
+        self.index += 1
 
-        # build a dictionary that maps strings to their integer values.
-        numbers = {}
+        if number is not None:
+            return wrap_long(number)
 
-        for key in matches:
-            # remove underscores if there are any.
-            num_str = key.replace('_', '')
+        if operator in CONDITION_UNARY_OPERATORS:
+            return wrap_long(CONDITION_UNARY_OPERATORS[operator](self.parse_unary()))
 
-            try:
-                # parse binary numbers
-                if num_str.startswith('%'):
-                    num_str = num_str.lstrip('%')
-                    value = int(num_str, base=2)
-                # parse hexadecimal numbers
-                elif num_str.startswith('$'):
-                    num_str = num_str.lstrip('$')
-                    value = int(num_str, base=16)
-                # parse decimal numbers
-                elif num_str.isdigit():
-                    value = int(num_str)
-                # not a number
-                else:
-                    continue
-            except ValueError:
-                # catch and ignore errors from int()
-                # if we end up here then ca65 should be complaining
-                # or it's a linting edge case that i don't really care about.
+        if operator == '(':
+            value = self.parse_not()
+            self.expect(')')
+            return value
+
+        if operator in ('.def', '.defined'):
+            self.expect('(')
+            symbol = self.tokens[self.index][1] if self.index < len(self.tokens) else None
+            self.index += 1
+            self.expect(')')
+
+            # other symbols may be defined anywhere.
+            if symbol is None or symbol not in self.controlled:
+                raise ValueError(f'Symbol "{symbol}" may be defined outside the build.')
+
+            return int(symbol in self.defines)
+
+        raise ValueError(f'Can\'t evaluate "{name or operator}" in condition.')
+
+
+def evaluate_condition(command, args, defines, controlled):
+    """
+    Evaluate the condition of an .if style command for a build variant.
+    Return True or False, or None if the condition can't be evaluated.
+
+    Only conditions made of numbers and whether symbols are defined can be evaluated.
+    And only for controlled symbols, since anything else may be defined somewhere else.
+
+    Arguments:
+    command -- lowercase ".if", ".ifdef", ".ifndef", or ".elseif" command.
+    args -- command arguments.
+    defines -- set of symbols that the variant defines.
+    controlled -- set of symbols that any variant defines.
+    """
+
+    if command in ('.ifdef', '.ifndef'):
+        name = args.strip()
+
+        if name not in controlled:
+            return None
+
+        return (name in defines) == (command == '.ifdef')
+
+    if command not in ('.if', '.elseif'):
+        return None
+
+    try:
+        return bool(ConditionParser(args, defines, controlled).parse())
+    except (ValueError, ZeroDivisionError):
+        return None
+
+
+def find_inactive(lines, defines, controlled):
+    """
+    Return a frozenset of the indexes of lines in conditional branches
+    that are inactive for a build variant.
+
+    Branches of conditions that can't be evaluated are all active, like when linting without
+    variants. The commands that open, split, and close a conditional block are only inactive
+    if the whole block is inside an inactive branch.
+
+    Arguments:
+    lines -- list of TokenizedLine instances.
+    defines -- set of symbols that the variant defines.
+    controlled -- set of symbols that any variant defines.
+    """
+
+    inactive = set()
+    # [state, taken] for each open conditional block.
+    # the state is "active", "inactive", "unknown", or "dead" for blocks in inactive branches.
+    frames = []
+
+    for index, line in enumerate(lines):
+        command = line.tokens.instr.lower() if line.type == LineType.COMMAND else ''
+        dead = bool(frames) and frames[-1][0] in ('inactive', 'dead')
+
+        if BLOCK_ENDS.get(command) == ('.endif',):
+            if dead:
+                frames.append(['dead', True])
+                inactive.add(index)
                 continue
 
-            numbers[key] = value
+            value = evaluate_condition(command, line.tokens.args, defines, controlled)
 
+            if value is None:
+                frames.append(['unknown', True])
+            else:
+                frames.append(['active' if value else 'inactive', value])
 
-        # these numbers are commonly used and well understood at a glance.
-        # as such, they don't need identifiers defined for them.
-        common_numbers = [
-            0x00, # zero
-            0x01, # one
-            0x7f, # max signed byte
-            0x80, # min signed byte
-            0xff, # max unsigned byte or negative one
-            0x7fff, # max signed word
-            0x8000, # min signed word
-            0xffff, # max unsigned word or negative one
+        elif command in BLOCK_ELSES and frames:
+            frame = frames[-1]
+
+            if frame[0] == 'dead':
+                inactive.add(index)
+            elif frame[0] == 'unknown':
+                continue
+            elif frame[1]:
+                frame[0] = 'inactive'
+            elif command == '.else':
+                frame[:] = ['active', True]
+            else:
+                value = evaluate_condition(command, line.tokens.args, defines, controlled)
+
+                if value is None:
+                    frame[:] = ['unknown', True]
+                else:
+                    frame[:] = ['active' if value else 'inactive', value]
+
+        elif command == '.endif' and frames:
+            if frames.pop()[0] == 'dead':
+                inactive.add(index)
+
+        elif dead:
+            inactive.add(index)
+
+    return frozenset(inactive)
+
+
+def trace_segments(lines, inactive):
+    """
+    Return a list with the name of the segment at each tokenized line.
+
+    Arguments:
+    lines -- list of TokenizedLine instances.
+    inactive -- set of indexes of inactive lines that don't switch segments.
+    """
+
+    # ca65 defaults to a "CODE" segment when none has been specified.
+    segment = 'CODE'
+    names = []
+
+    for index, line in enumerate(lines):
+        names.append(segment)
+
+        if line.type != LineType.COMMAND or index in inactive:
+            continue
+
+        command = line.tokens.instr.lower()
+
+        if command == '.segment':
+            parts = line.tokens.args.split('"')
+            if len(parts) > 1:
+                segment = parts[1]
+        elif command in SEGMENT_COMMANDS:
+            segment = command[1:].upper()
+
+    return names
+
+
+def warning_num(warning):
+    """
+    Return the line number of a warning message from Linter.warn.
+
+    Arguments:
+    warning -- warning message.
+    """
+    return int(warning[1:warning.index(')')])
+
+
+def lint_variants(variants, text, lines, strict=False, tier=RuleTier.FULL):
+    """
+    Lint an assembly file for several build variants and return a single list of warnings.
+    Warnings that only some variants have are followed by the names of those variants.
+
+    The first variant is linted in full.
+    The others only lint the blocks around lines that are active or in a segment type
+    that differs from the first variant. Their other warnings are the same.
+
+    Arguments:
+    variants -- list of Variant instances.
+    text -- text of the assembly file.
+    lines -- list of TokenizedLine instances of the assembly file.
+    strict -- Enables strict mode.
+    tier -- RuleTier of the most expensive rules to run.
+    """
+
+    controlled = frozenset().union(*(variant.defines for variant in variants))
+    base = variants[0]
+    base_inactive = find_inactive(lines, base.defines, controlled)
+    base_segments = trace_segments(lines, base_inactive)
+    linter = VariantLinter(base_inactive, None, base.segments, io.StringIO(text, newline=''),
+        strict, lines, tier)
+
+    # raw line checks are the same for every variant.
+    raw_warnings = linter.warnings[:linter.raw_count]
+    base_warnings = linter.warnings[linter.raw_count:]
+    results = [base_warnings]
+
+    for variant in variants[1:]:
+        inactive = find_inactive(lines, variant.defines, controlled)
+        names = trace_segments(lines, inactive) if inactive != base_inactive else base_segments
+        unknown = SegmentType.UNKNOWN
+
+        differs = {
+            lines[index].num
+            for index in range(len(lines))
+            if (index in inactive) != (index in base_inactive)
+            or variant.segments.get(names[index], unknown) != base.segments.get(
+                base_segments[index], unknown)
+        }
+
+        if not differs:
+            results.append(base_warnings)
+            continue
+
+        linter = VariantLinter(inactive, differs, variant.segments, None, strict, lines, tier)
+        covered = []
+
+        for start, stop in linter.ranges:
+            stop_num = lines[stop].num if stop < len(lines) else float('inf')
+            covered.append((lines[start].num, stop_num))
+
+        warnings = [
+            warning for warning in base_warnings
+            if not any(start <= warning_num(warning) < stop for start, stop in covered)
         ]
+        warnings += linter.warnings
+        warnings.sort(key=warning_num)
+        results.append(warnings)
 
-        # return only the magical numbers.
-        return [k for k, v in numbers.items() if v not in common_numbers]
+    # tell apart warnings that are repeated on the same line.
+    occurrences = {}
 
+    for variant, warnings in zip(variants, results):
+        seen = {}
 
-    def get_prefix_name(self, ident=None):
+        for warning in warnings:
+            seen[warning] = seen.get(warning, 0) + 1
+            occurrences.setdefault((warning, seen[warning]), []).append(variant.name)
+
+    merged = []
+
+    for (warning, _), names in occurrences.items():
+        if len(names) < len(variants):
+            warning = f'{warning} [{", ".join(names)}]'
+
+        merged.append(warning)
+
+    merged.sort(key=warning_num)
+    return raw_warnings + merged
+
+
+class ShardLinter(Linter):
+    """
+    Linter for one shard of a large assembly file. See find_shards.
+
+    Every shard but the last is followed by one line of context that is tokenized but not linted,
+    so that rules which count the blank lines after a block see where they end.
+    """
+
+    def __init__(self, state, last, segments, source_file, strict=False, tier=RuleTier.FULL):
         """
-        Split an identifier into its prefix and name.
-        Return the prefix and name as a tuple.
+        Initialize the linter and lint a shard of an assembly file.
 
         Arguments:
-        ident -- an identifier that should have a prefix.
+        state -- LinterState instance at the start of the shard.
+        last -- True if the shard is at the end of the file and has no context line.
+        segments -- SegmentTable instance.
+        source_file -- file object to read the shard's assembly code from.
+        strict -- Enables strict mode.
+        tier -- RuleTier of the most expensive rules to run.
         """
 
-        # default to the current line's label
-        if ident is None:
-            ident = self.label
-
-        # try to match a prefixed identifier like this.
-        # 'rbaMyReadonlyByteArray'
-        # split the identifier into a prefix and name.
-        # ('rba', 'MyReadonlyByteArray')
-        matches = re.fullmatch(r'([a-z]+)([A-Z0-9].*)', ident)
-
-        if matches:
-            return matches.groups()
+        # i'd rather have a long argument list than a config object.
+        # pylint: disable=too-many-arguments
 
-        # the identifier doesn't appear to have a prefix.
-        return ('', ident)
+        self.state = state
+        self.last = last
+        # number of warnings from raw line checks. they come before every other warning.
+        self.raw_count = 0
+        super().__init__(segments, source_file, strict, None, None, tier)
 
 
-    def get_linter_tag(self, line=None):
+    def lint_raw_line(self, line, num):
         """
-        Extract a linter tag from a comment.
-        Return a LinterTag.
+        Check rules that must be checked on an untokenized line of the shard.
 
         Arguments:
-        line -- a line TokenizedLine instance.
+        line -- a single line of the source file.
+        num -- line number of the line (1-indexed).
         """
 
-        # we need a TokenizedLine so that warnings use the correct line number.
+        # the context line is checked by the next shard.
+        if self.last or num < self.lines[-1].num:
+            super().lint_raw_line(line, num)
+
+
+    def lint(self):
+        """Lint the tokenized lines of the shard."""
+
+        self.raw_count = len(self.warnings)
+        self.set_state(self.state)
+
+        if self.last:
+            super().lint()
+        else:
+            self.lint_range(0, len(self.lines) - 1)
+
+
+# a piece of a source file that can be linted on its own. see find_shards.
+Shard = namedtuple(
+    'Shard',
+    [
+        'start', # offset of the first character of the shard.
+        'stop', # offset of the character after the shard.
+        'end', # offset of the character after the shard's context line.
+        'offset', # number of lines before the shard.
+        'state', # LinterState instance at the start of the shard.
+])
+
+
+def find_shards(text, count):
+    """
+    Return a list of Shard instances that split the text of a source file.
+
+    Shards start at the first non-blank line after a top-level ".endproc" or ".endscope".
+    The state at the start of each shard is found by scanning command lines without
+    tokenizing the whole file. See merge_shards for how mistakes are caught.
+
+    Arguments:
+    text -- text of a ca65 source file.
+    count -- number of shards to aim for. there may be fewer if blocks are too big.
+    """
+
+    blocks = []
+    segment = 'CODE'
+    # (offset, LinterState) tuple of each place that the file could be split at.
+    boundaries = []
+
+    for matches in SHARD_COMMAND_REGEX.finditer(text):
+        command = matches.group(1).lower()
+        block = blocks[-1] if blocks else ''
+
+        # the same block and segment changes that Linter.skip_range makes.
+        if command in BLOCK_ENDS.get(block, ()):
+            blocks.pop()
+        elif command in BLOCK_ELSES and block.startswith('.if'):
+            pass
+        elif command in BLOCK_ENDS:
+            blocks.append(command)
+
+        if command == '.segment':
+            parts = matches.group(2).split('"')
+            segment = parts[1] if len(parts) > 1 else segment
+        elif command in SEGMENT_COMMANDS:
+            segment = command[1:].upper()
+
+        if command not in ('.endproc', '.endscope') or '.proc' in blocks or '.scope' in blocks:
+            continue
+
+        # the command's match stops at a comment. shards start on a line of their own.
+        line_end = text.find('\n', matches.end())
+        following = SHARD_START_REGEX.search(text, line_end + 1) if line_end >= 0 else None
+
+        if following is None:
+            continue
+
+        start = text.rfind('\n', 0, following.start()) + 1
+        line_end = text.find('\n', start)
+        previous = text[text.rfind('\n', 0, start - 1) + 1:start].rstrip('\r\n')
+        line = text[start:line_end if line_end >= 0 else len(text)].rstrip('\r')
+
+        # lines that continue onto the next line can't be split.
+        if previous.endswith('\\') or line.endswith('\\'):
+            continue
+
+        boundaries.append((start, LinterState(tuple(blocks), segment)))
+
+    splits = [(0, LinterState((), 'CODE'))]
+
+    # split at the boundary closest to each even share of the text.
+    for shard in range(1, count):
+        target = len(text) * shard // count
+        boundary = min(boundaries, key=lambda b: abs(b[0] - target), default=(0, None))
+
+        if splits[-1][0] < boundary[0] < len(text):
+            splits.append(boundary)
+
+    shards = []
+    offset = 0
+
+    for (start, state), (stop, _) in zip(splits, splits[1:] + [(len(text), None)]):
+        end = text.find('\n', stop)
+        end = len(text) if end < 0 or stop == len(text) else end + 1
+        shards.append(Shard(start, stop, end, offset, state))
+        offset += text.count('\n', start, stop)
+
+    return shards
 
-        # default to the current line
-        if line is None:
-            line = self.line
 
-        # if there is no comment then there can be no linter tag.
-        if not line.tokens.comment:
-            return LinterTag.NONE
+def renumber(warnings, offset):
+    """
+    Return a list of warnings with their line numbers moved down by some number of lines.
 
-        # parse the linter tag out of the comment.
-        # the comment should contain only the tag and whitespace.
-        # example:
-        # "; [fall_through]"
-        matches = re.fullmatch(r';\s*\[(\w+)\]\s*', line.tokens.comment)
+    Arguments:
+    warnings -- list of warning messages from Linter.warn.
+    offset -- number of lines to add to each line number.
+    """
+    return [
+        f'({warning_num(warning) + offset}{warning[warning.index(")"):]}' for warning in warnings
+    ]
 
-        # if there is no match then there is no tag
-        # or the comment contained more then just a tag and whitespace.
-        # in the latter case, the absence of a tag will cause other warnings.
-        # that will effectively inform the user of the issue.
-        if not matches:
-            return LinterTag.NONE
 
-        tag_name = matches.group(1)
+def lint_shard(segments, text, shard, last, strict=False, tier=RuleTier.FULL):
+    """
+    Lint a shard of a source file.
+    Return a tuple of the raw line warnings, the other warnings,
+    and the LinterState at the end of the shard or None if the shards can't be merged.
 
-        if not tag_name.islower():
-            self.warn(f'Linter tag "{tag_name}" should be lowercase.', line.num)
+    Arguments:
+    segments -- SegmentTable instance.
+    text -- text of the shard and its context line.
+    shard -- Shard instance.
+    last -- True if the shard is at the end of the file.
+    strict -- Enables strict mode.
+    tier -- RuleTier of the most expensive rules to run.
+    """
 
-        # lookup the tag name and generate a warning if it's not found.
-        try:
-            return LinterTag[tag_name.upper()]
-        except KeyError:
-            self.warn(f'Linter tag "{tag_name}" is not recognized.', line.num)
-            return LinterTag.NONE
+    # i'd rather have a long argument list than a config object.
+    # pylint: disable=too-many-arguments
 
+    linter = ShardLinter(shard.state, last, segments, io.StringIO(text, newline=''), strict, tier)
+    warnings = renumber(linter.warnings, shard.offset)
+    state = linter.get_state()
 
-    def get_command_alias(self, command=None):
-        """
-        Return the preferred alias for a command when an illegal command is provided.
-        Return an empty string otherwise.
-        If "command" is None then "self.command is used".
+    # rules would miss the blank lines after the shard if the context line is tokenized as blank.
+    # no state matches None so the file is linted in one piece instead.
+    if not last and linter.lines[-1].type == LineType.BLANK:
+        state = None
 
-        Arguments:
-        command -- ca65 command string. e.g. ".struct".
-        """
+    return warnings[:linter.raw_count], warnings[linter.raw_count:], state
 
-        if command is None:
-            command = self.command
-        else:
-            command = command.lower()
 
-        # always use the long form of a command
-        aliases = {
-            '.zeropage': '.segment "ZEROPAGE"',
-            '.bss': '.segment "BSS"',
-            '.data': '.segment "DATA"',
-            '.rodata': '.segment "RODATA"',
-            '.code': '.segment "CODE"',
-            '.byt': '.byte',
-            '.delmac': '.delmacro',
-            '.endmac': '.endmacro',
-            '.endrep': '.endrepeat',
-            '.exitmac': '.exitmacro',
-            '.fopt': '.fileopt',
-            '.mac': '.macro',
-            '.pagelen': '.pagelength',
-            '.refto': '.referto',
-            '.undef': '.undefine',
-            '.def': '.defined',
-            '.ismnem': '.ismnemonic',
-            '.ref': '.referenced',
-        }
+def merge_shards(results, shards):
+    """
+    Return the warnings of a whole file from the results of lint_shard for each of its shards.
+    Return None if a shard didn't end in the state that the next shard started in.
+    The file has to be linted in one piece in that case.
 
-        return aliases.get(command, '')
+    Arguments:
+    results -- list of lint_shard results.
+    shards -- list of Shard instances.
+    """
 
+    for (_, _, state), shard in zip(results, shards[1:]):
+        if state != shard.state:
+            return None
 
-    def lint(self):
-        """Lint each tokenized line of a source file."""
+    # raw line checks come before every other warning, like when the file is linted in one piece.
+    return [warning for raw, _, _ in results for warning in raw] + [
+        warning for _, warnings, _ in results for warning in warnings
+    ]
 
-        while self.next_line():
-            self.lint_line()
 
-        last = self.lines[-1]
+class LintCache:
+    """On-disk cache of lint results keyed by source content and linter settings."""
 
-        if not last.tokens.end.endswith('\n'):
-            self.warn('File does not end with a newline.', last.num)
+    def __init__(self, path, segments, strict=False, variants=None, tier=RuleTier.FULL):
+        """
+        Initialize a lint cache.
 
+        Cached results are only valid for the same source content, segment table,
+        strict mode, build variants, rule tier, and linter version.
+        All of those are hashed into the key of each cache entry.
 
-    def lint_line(self):
-        """Lint a single tokenized line of a source file."""
+        Arguments:
+        path -- directory to store cache entries in.
+        segments -- SegmentTable instance.
+        strict -- Enables strict mode.
+        variants -- optional list of Variant instances. see lint_variants.
+        tier -- RuleTier of the most expensive rules to run.
+        """
 
-        self.lint_whitespace()
-        self.lint_label()
-        self.lint_symbol()
-        self.lint_mnemonic()
-        self.lint_macro()
-        self.lint_args()
-        self.lint_comment()
-        self.lint_command() # must be done last for recursion reasons
+        # i'd rather have a long argument list than a config object.
+        # pylint: disable=too-many-arguments
 
+        self.path = path
+        self.hits = 0
+        self.misses = 0
 
-    def lint_whitespace(self):
-        """Check whitespace rules for the current line."""
+        # any change to this script invalidates the whole cache.
+        with open(__file__, 'rb') as script_file:
+            linter_version = hashlib.sha256(script_file.read()).hexdigest()
 
-        if '\r' in self.end:
-            self.warn('Found Windows line ending. Expected UNIX line ending.')
+        segment_types = sorted((name, seg.name) for name, seg in segments.items())
+        variant_settings = [
+            [name, sorted((seg_name, seg.name) for seg_name, seg in seg_table.items()),
+                sorted(defines)]
+            for name, seg_table, defines in variants or ()
+        ]
+        settings = json.dumps(
+            [CACHE_VERSION, linter_version, segment_types, strict, variant_settings, tier.name])
+        self.settings = hashlib.sha256(settings.encode('utf-8')).digest()
 
-        if '\t' in self.indent:
-            self.warn('Found tab char in indent. Only spaces are allowed.')
 
-        # nothing more to check for blank lines.
-        if self.type == LineType.BLANK:
-            return
+    def _entry_path(self, source):
+        """
+        Return the path of the cache entry for some source content.
 
-        indent_size = TAB_SIZE * len(self.blocks)
+        Arguments:
+        source -- source file content as bytes.
+        """
 
-        # labels should be indented 1 tab less than everything else.
-        if self.label:
-            indent_size -= TAB_SIZE
+        key = hashlib.sha256(self.settings + source).hexdigest()
+        return os.path.join(self.path, key[:2], key[2:] + '.json')
 
-        indent = ' ' * indent_size
 
-        # check indent depth.
-        if self.indent != indent:
-            if self.type == LineType.COMMENT:
-                # sometimes it's appropriate for comments to disobey indent rules.
-                self.cry(f'Incorrect indent depth. Expected {indent_size} spaces.')
-            else:
-                self.warn(f'Incorrect indent depth. Expected {indent_size} spaces.')
+    def get(self, source):
+        """
+        Return cached warnings for some source content or None on a cache miss.
 
-        # blank line rules are more complex after an ".endproc" command.
-        # those rules will be enforced by "lint_command_endproc"
-        if self.type == LineType.COMMAND and self.command == '.endproc':
-            return
+        Arguments:
+        source -- source file content as bytes.
+        """
 
-        count = 0
+        try:
+            with open(self._entry_path(source), 'r', encoding='utf-8') as entry_file:
+                warnings = json.load(entry_file)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
 
-        # count the number of blank lines after the current line.
-        # the current line is necessarily not blank.
-        for line in (self.lines[i] for i in range(self.index+1, len(self.lines))):
-            if line.type == LineType.BLANK:
-                count += 1
-                line_num = line.num
-            else:
-                break
+        self.hits += 1
+        return warnings
 
-        if count > 1:
-            self.warn(f'Too many blank lines. Found {count}, Expected 1.', line_num)
 
+    def put(self, source, warnings):
+        """
+        Store the warnings for some source content.
 
-    def lint_command(self):
-        """Check ca65 command rules for the current line."""
+        Arguments:
+        source -- source file content as bytes.
+        warnings -- list of warning messages.
+        """
 
-        if self.type != LineType.COMMAND:
-            return
+        entry_path = self._entry_path(source)
+        os.makedirs(os.path.dirname(entry_path), exist_ok=True)
 
-        if not self.instr.islower():
-            self.warn(f'Command "{self.instr}" should be lowercase.')
+        # write to a temporary file first so that readers never see partial entries.
+        temp_path = f'{entry_path}.{os.getpid()}.tmp'
 
-        alias = self.get_command_alias()
+        with open(temp_path, 'w', encoding='utf-8') as entry_file:
+            json.dump(warnings, entry_file)
 
-        if alias:
-            self.warn(f'Illegal command "{self.command}". Use "{alias}" instead.')
+        os.replace(temp_path, entry_path)
 
-        # lint the specific commands that we care about.
-        self.lint_command_segment()
-        self.lint_command_struct()
-        self.lint_command_union()
-        self.lint_command_enum()
-        self.lint_command_scope()
-        self.lint_command_repeat()
-        self.lint_command_macro()
-        self.lint_command_proc()
-        self.lint_command_if()
-        self.lint_command_define()
 
+def find_sources(paths):
+    """
+    Expand source paths into a sorted list of unique source files.
 
-    def lint_command_segment(self):
-        """Check .segment command rules for the current line."""
+    Arguments:
+    paths -- list of file paths, directories, or glob patterns.
+             directories are searched recursively for *.s and *.inc files.
+    """
 
-        illegal = [
-            '.zeropage',
-            '.bss',
-            '.data',
-            '.rodata',
-            '.code',
-        ]
+    sources = set()
 
-        if self.command == '.segment':
-            segment = self.args.split('"')[1]
-        elif self.command in illegal:
-            segment = self.command[1:].upper()
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                for name in files:
+                    if name.endswith(('.s', '.inc')):
+                        sources.add(os.path.join(root, name))
+        elif glob.has_magic(path):
+            sources.update(glob.glob(path, recursive=True))
         else:
-            return
-
-        self.set_segment(segment)
+            sources.add(path)
+
+    # sorting keeps the output order stable between runs.
+    return sorted(sources)
+
+
+def parse_diff(text):
+    """
+    Return a dictionary that maps the real path of each file changed by a unified diff
+    to a set of its changed line numbers.
+
+    Added lines count as changed. So do the lines right after removed lines.
+    Hunks that only remove lines start at the line before the removal when they have no context,
+    like in "git diff -U0", so they're moved down a line.
+    Paths are relative to the current directory like "git diff" run from the top of the repo.
+
+    Arguments:
+    text -- text of a unified diff.
+    """
+
+    changed = {}
+    nums = None
+    num = old_left = new_left = 0
+
+    for line in text.splitlines():
+        if old_left > 0 or new_left > 0:
+            if line.startswith('+'):
+                nums.add(num)
+                num += 1
+                new_left -= 1
+            elif line.startswith('-'):
+                nums.add(num)
+                old_left -= 1
+            elif line.startswith(' ') or not line:
+                num += 1
+                old_left -= 1
+                new_left -= 1
+
+        elif line.startswith('+++ '):
+            path = line[4:].split('\t')[0]
+
+            if path == '/dev/null':
+                nums = None
+                continue
 
+            if path.startswith('b/'):
+                path = path[2:]
 
-    def lint_command_struct(self):
-        """Check .struct command rules for the current line."""
+            nums = changed.setdefault(os.path.realpath(path), set())
 
-        if self.command != '.struct':
-            return
+        elif nums is not None:
+            matches = HUNK_REGEX.match(line)
 
-        ident = self.args
+            if matches:
+                old_count, start, new_count = matches.groups()
+                old_left = int(old_count) if old_count is not None else 1
+                new_left = int(new_count) if new_count is not None else 1
+                num = int(start) if new_left else int(start) + 1
 
-        if ident:
-            prefix, name = self.get_prefix_name(ident)
+    return changed
 
-            if not prefix:
-                self.warn(f'Struct "{ident}" has no prefix.')
 
-            if 's' not in prefix:
-                self.warn(f'Struct "{ident}" is missing "s" prefix.')
+def tokenize_text(text):
+    """
+    Tokenize the text of a source file.
+    Return a Tokenizer instance or a TokenStore instance for large sources.
 
-            if len(set(prefix)) != len(prefix) not in prefix:
-                self.warn(f'Struct "{ident}" has repeated prefix characters.')
+    Arguments:
+    text -- text of a ca65 source file.
+    """
 
-            if not all(ch == 's' for ch in prefix):
-                self.warn(f'Struct "{ident}" has invalid prefix.')
+    if len(text) > COMPACT_SIZE:
+        return TokenStore(text=text)
 
-            if not self.is_pascal_case(name):
-                self.warn(f'Struct "{ident}" name is not pascal case.')
-        else:
-            self.cry('Unnamed struct.')
+    return Tokenizer(text=text)
 
-        self.blocks.append(self.command)
 
-        while self.next_line():
-            if self.command == '.endstruct':
-                self.blocks.pop()
-                self.lint_line()
-                break
+def read_source(source_path):
+    """
+    Read and tokenize a source file.
+    Return a tuple of the file's text and its tokenized lines.
 
-            self.lint_line()
+    Arguments:
+    source_path -- path to a ca65 source file.
+    """
 
+    with open(source_path, 'r', encoding='utf-8', newline='') as source_file:
+        text = source_file.read()
 
-    def lint_command_union(self):
-        """Check .union command rules for the current line."""
+    return text, tokenize_text(text)
 
-        if self.command != '.union':
-            return
 
-        ident = self.args
+def find_tail_calls(lines, physical):
+    """
+    Return a list of (jsr index, rts index, endproc index) tuples of tail calls
+    that can be rewritten safely. See fix_tail_calls.
 
-        if ident:
-            prefix, name = self.get_prefix_name(ident)
+    Only tail calls with nothing but blank lines and comments between the "jsr" and "rts"
+    are included. Neither those lines nor the "rts" can have a label, not even an unnamed
+    ":" label, since something else could jump to it.
+    The ".endproc" index is -1 unless the "rts" is the end of a procedure
+    that needs a "tail_jump" linter tag once the "jsr" becomes a "jmp".
 
-            if not prefix:
-                self.warn(f'Union "{ident}" has no prefix.')
+    Arguments:
+    lines -- list of TokenizedLine instances.
+    physical -- list of the physical lines of the file without their line feeds.
+    """
 
-            if 'u' not in prefix:
-                self.warn(f'Union "{ident}" is missing "u" prefix.')
+    # continued lines can't be rewritten one physical line at a time.
+    line_map = getattr(lines, 'line_map', {})
+    gap_types = (LineType.BLANK, LineType.WHITESPACE, LineType.COMMENT)
+    calls = []
 
-            if len(set(prefix)) != len(prefix) not in prefix:
-                self.warn(f'Union "{ident}" has repeated prefix characters.')
+    def skip_gap(index):
+        # unnamed labels and lines that don't tokenize look blank. the raw line tells.
+        while index < len(lines) and lines[index].type in gap_types:
+            if not TAIL_CALL_GAP_REGEX.fullmatch(physical[lines[index].num - 1]):
+                return -1
 
-            if not all(ch == 'u' for ch in prefix):
-                self.warn(f'Union "{ident}" has invalid prefix.')
+            index += 1
 
-            if not self.is_pascal_case(name):
-                self.warn(f'Union "{ident}" name is not pascal case.')
-        else:
-            self.cry('Unnamed union.')
+        return index
 
-        self.blocks.append(self.command)
+    for index, line in enumerate(lines):
+        if line.type != LineType.MNEMONIC or line.tokens.instr.lower() != 'jsr':
+            continue
 
-        while self.next_line():
-            if self.command == '.endunion':
-                self.blocks.pop()
-                self.lint_line()
-                break
+        rts = skip_gap(index + 1)
 
-            self.lint_line()
+        if rts in (-1, len(lines)):
+            continue
 
+        tokens = lines[rts].tokens
 
-    def lint_command_enum(self):
-        """Check .enum command rules for the current line."""
+        # a comment on the "rts" would be lost when it's removed.
+        if (lines[rts].type != LineType.MNEMONIC or tokens.instr.lower() != 'rts'
+                or tokens.label or tokens.args or tokens.comment):
+            continue
 
-        if self.command != '.enum':
-            return
+        if line.num in line_map or lines[rts].num in line_map:
+            continue
 
-        ident = self.args
+        end = skip_gap(rts + 1)
 
-        if ident:
-            prefix, name = self.get_prefix_name(ident)
+        if end == -1:
+            continue
 
-            if not prefix:
-                self.warn(f'Enum "{ident}" has no prefix.')
+        if end == len(lines) or lines[end].type != LineType.COMMAND:
+            calls.append((index, rts, -1))
+            continue
 
-            if 'e' not in prefix:
-                self.warn(f'Enum "{ident}" is missing "e" prefix.')
+        if lines[end].tokens.instr.lower() != '.endproc':
+            calls.append((index, rts, -1))
+            continue
 
-            if len(set(prefix)) != len(prefix) not in prefix:
-                self.warn(f'Enum "{ident}" has repeated prefix characters.')
+        # the "rts" is removed so the line before it will come right before the ".endproc".
+        previous = lines[end - 1 if end - 1 != rts else rts - 1]
+        matches = LINTER_TAG_REGEX.fullmatch(previous.tokens.comment)
 
-            if not all(ch == 'e' for ch in prefix):
-                self.warn(f'Enum "{ident}" has invalid prefix.')
+        if matches is None:
+            calls.append((index, rts, end))
+        elif matches.group(1).lower() == 'tail_jump':
+            calls.append((index, rts, -1))
 
-            if not self.is_pascal_case(name):
-                self.warn(f'Enum "{ident}" name is not pascal case.')
-        else:
-            self.cry('Unnamed enum.')
+        # any other tag is already wrong and needs a human to sort it out.
 
-        self.blocks.append(self.command)
+    return calls
 
-        while self.next_line():
-            if self.command == '.endenum':
-                self.blocks.pop()
-                self.lint_line()
-                break
 
-            self.lint_line()
+def fix_tail_calls(text):
+    """
+    Rewrite unoptimized tail calls in the text of a source file.
+    Return a tuple of the new text and the number of tail calls that were rewritten.
 
+    Each "jsr" is replaced with a "jmp" and the "rts" after it is removed.
+    A "tail_jump" linter tag is added before the ".endproc" of procedures that now end
+    with the "jmp". Callees that look at the return address on the stack will break,
+    but the "Unoptimized tail call." warning has the same blind spot.
 
-    def lint_command_scope(self):
-        """Check .scope command rules for the current line."""
+    The "rts" is left alone when a branch could land on it:
 
-        if self.command != '.scope':
-            return
+    >>> fix_tail_calls('.proc foo\\n    beq :+\\n    jsr bar\\n:\\n    rts\\n.endproc\\n')
+    ('.proc foo\\n    beq :+\\n    jsr bar\\n:\\n    rts\\n.endproc\\n', 0)
 
-        name = self.args
+    Arguments:
+    text -- text of a ca65 source file.
+    """
 
-        if not name:
-            self.cry(f'Scope has no name.')
-        elif not self.is_pascal_case(name):
-            self.warn(f'Scope "{name}" name is not pascal case.')
+    lines = tokenize_text(text)
+    physical = text.split('\n')
+    calls = find_tail_calls(lines, physical)
 
-        self.blocks.append(self.command)
+    if not calls:
+        return text, 0
+    removed = set()
+    tags = {}
 
-        while self.next_line():
-            if self.command == '.endscope':
-                self.blocks.pop()
-                self.lint_line()
-                break
+    for jsr, rts, endproc in calls:
+        index = lines[jsr].num - 1
+        start, stop = Tokenizer.lex(physical[index]).span(3)
+        jmp = 'JMP' if physical[index][start:stop].isupper() else 'jmp'
+        physical[index] = physical[index][:start] + jmp + physical[index][stop:]
+        removed.add(lines[rts].num - 1)
 
-            self.lint_line()
+        if endproc >= 0:
+            # the "rts" was indented like the rest of the procedure's body.
+            ending = '\r' if physical[index].endswith('\r') else ''
+            tags[lines[endproc].num - 1] = f'{lines[rts].tokens.indent}; [tail_jump]{ending}'
 
+    fixed = []
 
-    def lint_command_repeat(self):
-        """Check .rep command rules for the current line."""
+    for index, line in enumerate(physical):
+        if index in tags:
+            fixed.append(tags[index])
 
-        if self.command != '.repeat':
-            return
+        if index not in removed:
+            fixed.append(line)
 
-        magic = self.get_magic_numbers()
+    return '\n'.join(fixed), len(calls)
 
-        for num in magic:
-            self.cry(f'Magic number "{num}" in .repeat arguments.')
 
-        self.blocks.append(self.command)
+class IncludeGraph:
+    """
+    Graph of source files and the headers that they .include.
 
-        while self.next_line():
-            if self.command == '.endrepeat':
-                self.blocks.pop()
-                self.lint_line()
-                break
+    Every file in the graph is read and tokenized exactly once
+    and the tokenized lines are shared with anything that lints the file.
+    """
 
-            self.lint_line()
+    def __init__(self, include_dirs, load=read_source, cwd='.'):
+        """
+        Initialize an empty graph.
 
+        Arguments:
+        include_dirs -- list of directories to search for included files like ca65's -I option.
+        load -- function that returns the text and tokenized lines of a source path.
+        cwd -- directory that ca65 would be run from.
+               relative include directories are relative to this directory.
+        """
+        self.include_dirs = [os.path.join(cwd, path) for path in include_dirs]
+        self.load = load
+        self.cwd = cwd
+        # real path -> (text, tokenized lines)
+        self.sources = {}
+        # real path -> list of included paths
+        self.includes = {}
 
-    def lint_command_macro(self):
-        """Check .mac* command rules for the current line."""
 
-        if self.command not in ('.mac', '.macro'):
-            return
+    def get_source(self, source_path):
+        """
+        Return the text and tokenized lines of a source file.
 
-        # args will contain a macro name and possibly macro arguments.
-        # strip off arguments since we don't need them.
-        name = self.args.split()[0]
+        Arguments:
+        source_path -- path to a ca65 source file.
+        """
 
-        if not self.is_snake_case(name):
-            self.warn(f'Macro name "{name}" is not snake case.')
+        key = os.path.realpath(source_path)
+        source = self.sources.get(key)
 
-        if not self.is_documented():
-            self.warn(f'Macro "{name}" is not documented.')
+        if source is None:
+            source = self.load(source_path)
+            self.sources[key] = source
 
-        self.blocks.append(self.command)
+        return source
 
-        while self.next_line():
-            if self.command in ('.endmac', '.endmacro'):
-                self.blocks.pop()
-                self.lint_line()
-                break
 
-            self.lint_line()
+    def resolve(self, name):
+        """
+        Return the path of an included file or None if it can't be found.
 
+        Arguments:
+        name -- file name argument of an .include command.
+        """
 
-    def lint_command_proc(self):
-        """Check .proc command rules for the current line."""
+        # ca65 looks in the current directory before the include directories.
+        for directory in [self.cwd] + self.include_dirs:
+            path = os.path.normpath(os.path.join(directory, name))
 
-        if not self.command == '.proc':
-            return
+            if os.path.isfile(path):
+                return path
 
-        name = self.args
+        return None
 
-        if not self.is_snake_case(name):
-            self.warn(f'Procedure name "{name}" is not snake case.')
 
-        if not self.is_documented():
-            self.warn(f'Procedure "{name}" is not documented.')
+    def get_includes(self, source_path):
+        """
+        Return the paths of the files that a source file includes.
+        Files that can't be found are skipped since ca65 will complain about them anyway.
 
-        self.blocks.append(self.command)
+        Arguments:
+        source_path -- path to a ca65 source file.
+        """
 
-        while self.next_line():
-            if self.command == '.endproc':
-                self.lint_command_endproc()
-                self.blocks.pop()
-                self.lint_line()
-                break
+        key = os.path.realpath(source_path)
+        includes = self.includes.get(key)
 
-            self.lint_line()
+        if includes is not None:
+            return includes
 
+        includes = []
 
-    def lint_command_endproc(self):
-        """Check linter tags at the end of a procedure."""
+        for line in self.get_source(source_path)[1]:
+            if line.type != LineType.COMMAND or line.tokens.instr.lower() != '.include':
+                continue
 
-        # can't be bothered to fix these.
-        # pylint: disable=too-many-branches
-        # pylint: disable=too-many-statements
+            matches = INCLUDE_REGEX.match(line.tokens.args)
+            path = self.resolve(matches.group(1)) if matches else None
 
-        if self.command != '.endproc':
-            return
+            if path is not None:
+                includes.append(path)
 
-        # we have a ".endproc" at the start of the file.
-        # this code probable doesn't even assemble.
-        # ignore it.
-        if not self.index:
-            return
+        self.includes[key] = includes
+        return includes
 
-        index = self.index - 1
-        line = self.lines[index]
 
-        # get a linter tag from the end of the procedure if there is one.
-        # we will only consider the line immediately preceding the current line.
-        linter_tag = self.get_linter_tag(line)
+    def walk(self, source_paths):
+        """
+        Return a sorted list of source files and every file that they include, each only once.
 
-        valid_tags = [
-            LinterTag.NONE,
-            LinterTag.FALL_THROUGH,
-            LinterTag.TAIL_JUMP,
-            LinterTag.TAIL_BRANCH,
-        ]
+        Arguments:
+        source_paths -- list of paths to ca65 source files.
+        """
 
-        # filter out linter tags that we don't care about.
-        if linter_tag not in valid_tags:
-            linter_tag = LinterTag.NONE
+        # paths given by the caller win over the paths that includes resolve to.
+        seen = {os.path.realpath(path): path for path in source_paths}
+        stack = list(source_paths)
 
-        tag_line = line
-        tag_name = linter_tag.name.lower()
+        while stack:
+            for path in self.get_includes(stack.pop()):
+                key = os.path.realpath(path)
 
-        if linter_tag != LinterTag.NONE and line.type != LineType.COMMENT:
-            self.warn(f'Linter tag "{tag_name}" should be on its own line ', line.num)
+                if key not in seen:
+                    seen[key] = path
+                    stack.append(path)
 
-        # iterate backwards through the lines.
-        for line in (self.lines[i] for i in range(index, -1, -1)):
-            if line.type == LineType.COMMAND and line.tokens.instr.lower() == '.proc':
-                # we reached the start of the procedure.
-                return
-            if line.type == LineType.MNEMONIC:
-                # found the last mnemonic in the procedure.
-                break
-        else:
-            # can't find a mnemonic nor the start of the procedure.
-            return
+        return sorted(seen.values())
 
-        mnemonic = line.tokens.instr.lower()
 
-        max_count = 1
+# a symbol that a source file defines, exports, or imports.
+Symbol = namedtuple(
+    'Symbol',
+    [
+        'num', # line number (1-indexed).
+        'name', # symbol name.
+        'kind', # "proc", "label", "symbol", "export", "exportzp", "import", or "importzp".
+        'segment', # name of the segment at the line.
+        'segment_type', # name of the SegmentType of the segment.
+])
 
-        # check if the correct linter tag is given for the last mnemonic.
-        if linter_tag == LinterTag.NONE:
-            if mnemonic in RETURNS:
-                max_count = 2
-            elif mnemonic == 'jmp':
-                max_count = 2
-                self.warn('Missing "tail_jump" linter tag.')
-            elif mnemonic in BRANCHES:
-                self.warn('Missing "tail_branch" linter tag.')
-            else:
-                self.warn('Missing "fall_through" linter tag.')
-        elif mnemonic in RETURNS:
-            max_count = 2
-            self.warn(f'Return incorrectly tagged as "{tag_name}".', tag_line.num)
-        elif mnemonic == 'jmp':
-            max_count = 2
-            if linter_tag != LinterTag.TAIL_JUMP:
-                self.warn(f'Tail jump incorrectly tagged as "{tag_name}".', tag_line.num)
-        elif mnemonic in BRANCHES:
-            if linter_tag != LinterTag.TAIL_BRANCH:
-                self.warn(f'Tail branch incorrectly tagged as "{tag_name}".', tag_line.num)
-        elif linter_tag != LinterTag.FALL_THROUGH:
-            self.warn(f'Fall through incorrectly tagged as "{tag_name}".', tag_line.num)
 
-        count = 0
-        line_num = self.num
+class SymbolIndex:
+    """
+    Project wide SQLite index of the symbols that each source file defines, exports, and imports.
+
+    Files are only indexed again when their content changes,
+    so rules that need to see other files are answered with indexed lookups
+    instead of tokenizing every file on every run.
+    """
+
+    # commands whose blocks hide labels from other files.
+    SCOPES = ('.proc', '.scope', '.struct', '.union', '.enum')
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+        CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, digest TEXT NOT NULL);
+        CREATE TABLE IF NOT EXISTS symbols (
+            path TEXT NOT NULL,
+            num INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            segment TEXT NOT NULL,
+            segment_type TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS symbols_path ON symbols (path);
+        CREATE INDEX IF NOT EXISTS symbols_name ON symbols (name, kind);
+    """
+
+    def __init__(self, path, segments, load=read_source, cwd='.'):
+        """
+        Open a symbol index or create it if it doesn't exist.
 
-        # count the number of blank lines after '.endproc'.
-        for line in (self.lines[i] for i in range(self.index+1, len(self.lines))):
-            if line.type == LineType.BLANK:
-                count += 1
-                line_num = line.num
-            else:
-                break
-        else:
-            # end of file.
-            max_count = 0
+        The index is emptied if it was built by a different version of this script
+        or with a different segment table.
 
-        # 1 blank line must follow procedures that tail branch or fall through.
-        # 2 blank lines must follow procedures that tail jump or return.
-        if count < max_count:
-            self.warn(f'Too few blank lines. Found {count}, Expected {max_count}.', line_num)
-        if count > max_count:
-            self.warn(f'Too many blank lines. Found {count}, Expected {max_count}.', line_num)
+        Arguments:
+        path -- path of the SQLite database file.
+        segments -- SegmentTable instance.
+        load -- function that returns the text and tokenized lines of a source path.
+        cwd -- directory that paths in warnings are relative to.
+        """
 
+        self.segments = segments
+        self.load = load
+        self.cwd = cwd
+        self.updated = 0
+        self.unchanged = 0
 
-    def lint_command_if(self):
-        """Check .if* command rules for the current line."""
+        with open(__file__, 'rb') as script_file:
+            linter_version = hashlib.sha256(script_file.read()).hexdigest()
 
-        if not self.command.startswith('.if'):
-            return
+        segment_types = sorted((name, seg.name) for name, seg in segments.items())
+        settings = json.dumps([INDEX_VERSION, linter_version, segment_types])
 
-        self.blocks.append(self.command)
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.connection = sqlite3.connect(path)
 
-        while self.next_line():
-            if self.command.startswith('.else'):
-                block = self.blocks.pop()
-                self.lint_line()
-                self.blocks.append(block)
-            elif self.command == '.endif':
-                self.blocks.pop()
-                self.lint_line()
-                break
-            else:
-                self.lint_line()
+        with self.connection as connection:
+            connection.executescript(self.SCHEMA)
+            row = connection.execute("SELECT value FROM settings WHERE key = 'version'").fetchone()
 
+            if row is None or row[0] != settings:
+                connection.execute('DELETE FROM files')
+                connection.execute('DELETE FROM symbols')
+                connection.execute(
+                    "INSERT OR REPLACE INTO settings VALUES ('version', ?)", (settings,))
 
-    def lint_command_define(self):
-        """Check .define command rules for the current line."""
 
-        if self.command != '.define':
-            return
+    def close(self):
+        """Close the database."""
+        self.connection.close()
 
-        # strip off macro value
-        name = self.args.split()[0]
 
-        # strip off macro parameters
-        name = name.split('(')[0]
+    def find_symbols(self, lines):
+        """
+        Return a list of Symbol instances for the symbols in a tokenized source file.
 
-        if not self.is_upper_case(name):
-            self.warn(f'Define-style macro "{name}" is not upper case.')
+        Only symbols that other files can see are included.
 
+        Arguments:
+        lines -- list of TokenizedLine instances.
+        """
 
-    def lint_label(self):
-        """Check label rules for the current line."""
+        symbols = []
+        # ca65 defaults to a "CODE" segment when none has been specified.
+        segment = 'CODE'
+        scopes = []
 
-        if not self.label:
-            return
+        for line in lines:
+            tokens = line.tokens
+            segment_type = self.segments.get(segment, SegmentType.UNKNOWN).name
 
-        linter_tag = self.get_linter_tag()
+            if line.type == LineType.COMMAND:
+                command = tokens.instr.lower()
 
-        # check if we are in a code block.
-        if self.block == '.proc' or "CODE" in self.segment:
-            # we are in a code block or code segment.
-            # labels should be code labels unless a linter tag says otherwise.
-            if linter_tag == LinterTag.DATA_LABEL:
-                self.lint_label_data()
-            else:
-                self.lint_label_code()
-        else:
-            # we are not in a code block nor code segment.
-            # labels should be data labels unless a linter tag says otherwise.
-            if linter_tag == LinterTag.CODE_LABEL:
-                self.lint_label_code()
-            else:
-                self.lint_label_data()
+                if command in ('.export', '.exportzp', '.import', '.importzp'):
+                    for name in SYMBOL_LIST_REGEX.findall(tokens.args):
+                        symbols.append(Symbol(line.num, name, command[1:], segment, segment_type))
 
+                elif command == '.segment':
+                    parts = tokens.args.split('"')
+                    if len(parts) > 1:
+                        segment = parts[1]
 
-    def lint_label_code(self):
-        """Check code label rules for the current line."""
+                elif command in SEGMENT_COMMANDS:
+                    segment = command[1:].upper()
 
-        # account for cheap local labels.
-        if self.label.startswith('@'):
-            label = self.label.lstrip('@')
-        else:
-            label = self.label
+                elif scopes and command in BLOCK_ENDS[scopes[-1]]:
+                    scopes.pop()
 
-        if not self.is_snake_case(label):
-            self.warn(f'Code label "{label}" is not snake case.')
+                if command in self.SCOPES:
+                    if command == '.proc' and not scopes and tokens.args:
+                        name = tokens.args.split()[0]
+                        symbols.append(Symbol(line.num, name, 'proc', segment, segment_type))
 
-        if self.type != LineType.LABEL:
-            self.warn('Only comments are allowed after code labels.')
+                    scopes.append(command)
 
+            elif line.type == LineType.SYMBOL and not scopes:
+                symbols.append(Symbol(line.num, tokens.instr, 'symbol', segment, segment_type))
 
-    def lint_label_data(self):
-        """Check data label rules for the current line."""
+            # cheap local labels can't be exported.
+            if tokens.label and not tokens.label.startswith('@') and not scopes:
+                symbols.append(Symbol(line.num, tokens.label, 'label', segment, segment_type))
 
-        # this method is kind of a cluster-fuck but it works.
-        # pylint: disable=too-many-branches
+        return symbols
 
-        # account for cheap local labels.
-        if self.label.startswith('@'):
-            self.warn(f'Cheap local data label are not allowed.')
-            label = self.label.lstrip('@')
-        else:
-            label = self.label
 
-        prefix, name = self.get_prefix_name(label)
+    def update(self, source_paths):
+        """
+        Index every source file whose content changed since it was last indexed.
+        Forget files that don't exist anymore.
 
-        if not prefix:
-            self.warn(f'Data label "{self.label}" has no prefix.')
+        Arguments:
+        source_paths -- list of paths to ca65 source files.
+        """
 
-        if not name:
-            self.warn(f'Data label "{self.label}" has no name.')
-        elif not self.is_pascal_case(name):
-            self.warn(f'Data label "{self.label}" name is not pascal case.')
+        execute = self.connection.execute
 
-        label_prefixes = 'rzbwdqasp'
+        with self.connection:
+            for source_path in source_paths:
+                path = os.path.realpath(source_path)
 
-        for char in prefix:
-            if char not in label_prefixes:
-                self.warn(f'Data label "{self.label}" uses an invalid prefix character "{char}".')
+                with open(source_path, 'rb') as source_file:
+                    digest = hashlib.sha256(source_file.read()).hexdigest()
 
-        if len(set(prefix)) != len(prefix):
-            self.warn(f'Data label "{self.label}" has repeated prefix characters.')
+                row = execute('SELECT digest FROM files WHERE path = ?', (path,)).fetchone()
 
-        prefix_order = iter(label_prefixes)
+                if row is not None and row[0] == digest:
+                    self.unchanged += 1
+                    continue
 
-        # check that prefix characters appear in the right order.
-        if not all(any(y == x for y in prefix_order) for x in prefix):
-            self.warn(f'Data label "{self.label}" has an incorrect prefix order.')
+                _, lines = self.load(source_path)
+                execute('DELETE FROM symbols WHERE path = ?', (path,))
+                self.connection.executemany(
+                    'INSERT INTO symbols VALUES (?, ?, ?, ?, ?, ?)',
+                    ((path,) + symbol for symbol in self.find_symbols(lines)))
+                execute('INSERT OR REPLACE INTO files VALUES (?, ?)', (path, digest))
+                self.updated += 1
 
-        # these prefixes are mutually exclusive
-        type_prefix = {
-            'b': 'byte',
-            'w': 'word',
-            'd': 'double word',
-            'q': 'quad word',
-            's': 'string',
-        }
+            for (path,) in execute('SELECT path FROM files').fetchall():
+                if not os.path.exists(path):
+                    execute('DELETE FROM files WHERE path = ?', (path,))
+                    execute('DELETE FROM symbols WHERE path = ?', (path,))
 
-        # check if the label contains mutually exclusive prefixes.
-        prefixes = [char for char in type_prefix if char in prefix]
-        prefixes_len = len(prefixes)
 
-        msg = f'Data label "{self.label}" is prefixed with mutually exclusive types'
+    def check(self, source_paths, strict=False, changes=None):
+        """
+        Check rules that depend on other source files.
+        Yield a source path and a warning message for each warning
+        in the same format as Linter.warn.
+
+        Files that were indexed by earlier runs are checked against too.
 
-        if prefixes_len > 1:
-            types = ', '.join(type_prefix[prefixes[:-1]])
+        Arguments:
+        source_paths -- list of paths to indexed ca65 source files.
+        strict -- Enables strict mode.
+        changes -- optional dictionary that maps source paths to sets of changed line numbers.
+                   only warnings for changed lines are yielded.
+        """
 
-            if prefixes_len > 2:
-                types = types + ','
+        execute = self.connection.execute
+
+        for source_path in source_paths:
+            path = os.path.realpath(source_path)
+            warnings = []
+
+            exports = execute(
+                "SELECT num, name, kind FROM symbols "
+                "WHERE path = ? AND kind IN ('export', 'exportzp') ORDER BY num",
+                (path,)).fetchall()
+
+            for num, name, kind in exports:
+                # check that the export matches the segment that the symbol is defined in.
+                definition = execute(
+                    "SELECT segment, segment_type FROM symbols "
+                    "WHERE path = ? AND name = ? AND kind IN ('label', 'proc') LIMIT 1",
+                    (path, name)).fetchone()
+
+                if definition is not None:
+                    segment, segment_type = definition
+
+                    if kind == 'exportzp' and segment_type != SegmentType.ZP.name:
+                        warnings.append((num, f'Symbol "{name}" is exported with ".exportzp" '
+                            f'but defined in non-zero-page segment "{segment}".'))
+
+                    if kind == 'export' and segment_type == SegmentType.ZP.name:
+                        warnings.append((num, f'Symbol "{name}" is exported with ".export" '
+                            f'but defined in zero-page segment "{segment}".'))
+
+                imported = execute(
+                    "SELECT 1 FROM symbols "
+                    "WHERE name = ? AND kind IN ('import', 'importzp') LIMIT 1",
+                    (name,)).fetchone()
+
+                if strict and imported is None:
+                    warnings.append((num, f'Strict: Exported symbol "{name}" is never imported.'))
+
+            imports = execute(
+                "SELECT num, name, kind FROM symbols "
+                "WHERE path = ? AND kind IN ('import', 'importzp') ORDER BY num",
+                (path,)).fetchall()
+
+            for num, name, kind in imports:
+                # check that the import uses the same addressing as the export.
+                expected = 'exportzp' if kind == 'import' else 'export'
+                export = execute(
+                    "SELECT path, num FROM symbols WHERE name = ? AND kind = ? LIMIT 1",
+                    (name, expected)).fetchone()
+
+                if export is not None:
+                    export_path = os.path.relpath(export[0], self.cwd)
+                    warnings.append((num, f'Symbol "{name}" is imported with ".{kind}" '
+                        f'but exported with ".{expected}" in {export_path}({export[1]}).'))
+
+            changed = changes.get(source_path) if changes else None
+
+            for num, message in sorted(warnings, key=lambda warning: warning[0]):
+                if changed is None or num in changed:
+                    yield source_path, f'({num}): Warning: Linter: {message}'
+
+
+def lint_file(segments, source_path, strict=False, profiler=None, report=None, graph=None,
+              changed=None, variants=None, tier=RuleTier.FULL, source=None):
+    """
+    Lint a single source file and return its list of warnings.
+
+    Arguments:
+    segments -- SegmentTable instance.
+    source_path -- path to a ca65 source file.
+    strict -- Enables strict mode.
+    profiler -- optional Profiler instance to record statistics in.
+    report -- optional function to call with each warning message as soon as it's found.
+    graph -- optional IncludeGraph instance to take the file's tokenized lines from.
+    changed -- optional set of changed line numbers. only the blocks around them are linted.
+    variants -- optional list of Variant instances to lint for instead of segments.
+    tier -- RuleTier of the most expensive rules to run.
+    source -- optional tuple of the file's text and tokenized lines like read_source returns.
+              takes the place of graph when the file was tokenized by another process.
+    """
+
+    # i'd rather have a long argument list than a config object.
+    # pylint: disable=too-many-arguments
+
+    if source is None and graph is not None:
+        source = graph.get_source(source_path)
+
+    # warnings can only be reported once every variant has been linted.
+    if variants:
+        text, lines = read_source(source_path) if source is None else source
+        warnings = lint_variants(variants, text, lines, strict, tier)
+
+        if report is not None:
+            for warning in warnings:
+                report(warning)
+
+        return warnings
+
+    if source is None:
+        source_file = open(source_path, 'r', encoding='utf-8', newline='')
+        lines = None
+    else:
+        text, lines = source
+        source_file = io.StringIO(text, newline='')
+
+    with source_file:
+        if changed is not None:
+            linter = DiffLinter(changed, segments, source_file, strict, lines, report, tier)
+        elif profiler is None:
+            linter = Linter(segments, source_file, strict, lines, report, tier)
+        else:
+            linter = ProfilingLinter(profiler, segments, source_file, strict, report, lines, tier)
 
-            types = types + f' and {type_prefix[prefixes[-1]]}'
-            self.warn(f'{msg} {types}.')
+    return linter.warnings
 
-        # check if the label is prefixed as a string array.
-        # this is disallowed because a sting array could be ambiguous.
-        # i.e. an array of C strings or an array of string pointers.
-        # in either case, only an array prefix should be used.
-        if all(c in prefix for c in 'sa'):
-            self.warn(f'{msg} string and array.')
 
-        # data labels have extra rules based on the segment type.
-        if self.segment_type == SegmentType.ZP and 'z' not in prefix:
-            self.warn(f'Zero-page data label "{self.label}" missing zero-page prefix.')
+# settings that every task of a worker process lints with.
+# ProcessPoolExecutor only has initializers since python 3.7, so they're sent with each task.
+WorkerSettings = namedtuple(
+    'WorkerSettings',
+    [
+        'segments', # SegmentTable instance.
+        'strict', # Enables strict mode.
+        'variants', # optional list of Variant instances. see lint_file.
+        'tier', # RuleTier of the most expensive rules to run.
+])
 
-        if self.segment_type != SegmentType.ZP and 'z' in prefix:
-            self.warn(f'Non-zero-page data label "{self.label}" prefixed as zero-page.')
 
-        if self.segment_type == SegmentType.RO and 'r' not in prefix:
-            self.warn(f'Read-only data label "{self.label}" missing read-only prefix.')
+def get_cache_counts():
+    """
+    Return a Counter of the hits and misses of the caches that every Linter in this process shares.
+    """
+
+    magic = Linter.find_magic_numbers.cache_info()
+    idents = Linter.classify_ident.cache_info()
+
+    return Counter({
+        'magic_hits': magic.hits,
+        'magic_misses': magic.misses,
+        'ident_hits': idents.hits,
+        'ident_misses': idents.misses,
+    })
+
+
+def _count_cache_hits(func, *args, **kwargs):
+    """
+    Call a function in a worker process.
+    Return a tuple of its result and a Counter of the cache hits and misses during the call.
+
+    The caches are per process so the main process adds up the counts from every worker.
+
+    Arguments:
+    func -- function to call.
+    args -- positional arguments for the function.
+    kwargs -- keyword arguments for the function.
+    """
+
+    before = get_cache_counts()
+    result = func(*args, **kwargs)
+    return result, get_cache_counts() - before
+
+
+def _lint_worker(settings, source_path, changed=None, source=None):
+    """
+    Lint a single source file in a worker process.
+    Return a tuple of its warnings and a Counter of cache hits and misses. see _count_cache_hits.
+
+    Arguments:
+    settings -- WorkerSettings instance.
+    source_path -- path to a ca65 source file.
+    changed -- optional set of changed line numbers. see lint_file.
+    source -- optional tuple of the file's text and tokenized lines. see lint_file.
+    """
+
+    return _count_cache_hits(lint_file, settings.segments, source_path, settings.strict,
+        changed=changed, variants=settings.variants, tier=settings.tier, source=source)
+
+
+def _lint_shard_worker(settings, text, shard, last):
+    """
+    Lint a shard of a source file in a worker process. See lint_shard.
+    Return a tuple of its result and a Counter of cache hits and misses. see _count_cache_hits.
+
+    Arguments:
+    settings -- WorkerSettings instance.
+    text -- text of the shard and its context line.
+    shard -- Shard instance.
+    last -- True if the shard is at the end of the file.
+    """
+    return _count_cache_hits(lint_shard, settings.segments, text, shard, last, settings.strict,
+        settings.tier)
+
+
+def lint_files(segments, source_paths, report, strict=False, jobs=1, cache=None, profiler=None,
+               graph=None, changes=None, variants=None, tier=RuleTier.FULL, cache_counts=None):
+    """
+    Lint source files and report their warnings in input order.
+
+    Files linted in this process report each warning as soon as it's found.
+    Files linted by worker processes or answered from the cache report a whole file at a time.
+    Large files are split into shards that are linted by several worker processes.
+
+    Arguments:
+    segments -- SegmentTable instance.
+    source_paths -- list of paths to ca65 source files.
+    report -- function to call with a source path and a warning message for each warning.
+              linting stops if it raises an exception.
+    strict -- Enables strict mode.
+    jobs -- number of worker processes to lint with.
+    cache -- optional LintCache instance.
+    profiler -- optional Profiler instance to record statistics in.
+    graph -- optional IncludeGraph instance to share tokenized lines with.
+             files are tokenized once in this process and their tokenized lines are sent
+             to worker processes so that no header is ever tokenized twice.
+    changes -- optional dictionary that maps source paths to sets of changed line numbers.
+               only the blocks around changed lines are linted. see parse_diff.
+    variants -- optional list of Variant instances to lint every file for. see lint_variants.
+    tier -- RuleTier of the most expensive rules to run.
+    cache_counts -- optional Counter to add the cache hits and misses of worker processes to.
+                    see get_cache_counts.
+    """
+
+    # i'd rather have a long argument list than a config object.
+    # pylint: disable=too-many-arguments
+
+    changes = changes or {}
+    cached = {}
+    sources = {}
+
+    # answer as many files as possible from the cache before doing any real work.
+    if cache is not None:
+        for source_path in source_paths:
+            with open(source_path, 'rb') as source_file:
+                source = source_file.read()
+
+            warnings = cache.get(source)
+
+            if warnings is None:
+                sources[source_path] = source
+            else:
+                cached[source_path] = warnings
 
-        # writable data is allowed to be prefixed as read-only.
-        # that is useful for exported variables
-        # which should be treated as read-only by the importer.
+    uncached_paths = [path for path in source_paths if path not in cached]
+    executor = None
+    futures = {}
 
+    # number of shards to split each large file into.
+    # files that are linted for a diff or for build variants are never split.
+    counts = {
+        path: min(jobs, os.path.getsize(path) // SHARD_SIZE)
+        for path in uncached_paths
+        if jobs > 1 and not variants and path not in changes
+    }
+    # list of Shard instances for each file that is split.
+    shards = {}
 
-    def lint_symbol(self):
-        """Check symbol rules for the current line."""
+    def get_result(future):
+        result, counts = future.result()
 
-        if self.type != LineType.SYMBOL:
-            return
+        if cache_counts is not None:
+            cache_counts.update(counts)
 
-        if not self.is_upper_case(self.instr):
-            self.warn(f'Symbol "{self.instr}" is not upper case.')
+        return result
 
+    if jobs > 1 and (len(uncached_paths) > 1 or any(count > 1 for count in counts.values())):
+        executor = concurrent.futures.ProcessPoolExecutor(max_workers=jobs)
+        settings = WorkerSettings(segments, strict, variants, tier)
 
-    def lint_mnemonic(self):
-        """Check mnemonic rules for the current line."""
+        # each file has a list of futures whose warnings are joined in line order.
+        for path in uncached_paths:
+            source = None if graph is None else graph.get_source(path)
 
-        if self.type != LineType.MNEMONIC:
-            return
+            if counts.get(path, 1) < 2:
+                futures[path] = [
+                    executor.submit(_lint_worker, settings, path, changes.get(path), source)]
+                continue
 
-        if self.block != '.proc':
-            self.warn('Found mnemonic outside of ".proc" block.')
+            if source is None:
+                with open(path, 'r', encoding='utf-8', newline='') as source_file:
+                    text = source_file.read()
+            else:
+                text = source[0]
+
+            # each worker only tokenizes its own shard.
+            shards[path] = find_shards(text, counts[path])
+            futures[path] = [
+                executor.submit(_lint_shard_worker, settings, text[shard.start:shard.end], shard,
+                    shard.stop == len(text))
+                for shard in shards[path]
+            ]
+
+    try:
+        for source_path in source_paths:
+            if source_path in cached:
+                warnings = cached[source_path]
+            elif executor is None:
+                warnings = lint_file(segments, source_path, strict, profiler,
+                    functools.partial(report, source_path), graph, changes.get(source_path),
+                    variants, tier)
+            elif source_path in shards:
+                warnings = merge_shards(
+                    [get_result(future) for future in futures[source_path]], shards[source_path])
+
+                # the shards were split in the wrong place. lint the file in one piece.
+                if warnings is None:
+                    source = None if graph is None else graph.get_source(source_path)
+                    warnings = get_result(
+                        executor.submit(_lint_worker, settings, source_path, None, source))
+            else:
+                warnings = get_result(futures[source_path][0])
 
-        if not self.instr.islower():
-            self.warn('Mnemonic should be lower case.')
+            # warnings from this process have been reported already.
+            if source_path in cached or executor is not None:
+                for warning in warnings:
+                    report(source_path, warning)
 
-        if self.mnemonic in BRANCHES and not self.comment:
-            self.cry('Branch mnemonic missing inline comment.')
+            # files are only cached once they have been completely linted and reported.
+            if source_path in sources:
+                cache.put(sources[source_path], warnings)
+    finally:
+        # don't wait for files that nobody will see the warnings for.
+        for future in (future for shard in futures.values() for future in shard):
+            future.cancel()
 
-        magic = self.get_magic_numbers()
+        if executor is not None:
+            executor.shutdown()
 
-        for num in magic:
-            self.cry(f'Magic number "{num}" in mnemonic arguments.')
 
-        # the last rule only applies to 'jsr' mnemonics.
-        if self.mnemonic != 'jsr':
-            return
+def load_segments(linker_config_path):
+    """
+    Return a SegmentTable instance built from a linker config file.
 
-        # line types to ignore while looking ahead in the file
-        ignore_line_types = (
-            LineType.BLANK,
-            LineType.WHITESPACE,
-            LineType.COMMENT,
-            LineType.SYMBOL,
-        )
+    Arguments:
+    linker_config_path -- path to a cl65 linker config file.
+    """
 
-        # look ahead for a 'rts' mnemonic to find unoptimized tail calls.
-        for line in (self.lines[i] for i in range(self.index + 1, len(self.lines))):
-            # these lines wouldn't interfere with optimizing a tail call.
-            if line.type in ignore_line_types:
-                continue
+    with open(linker_config_path, 'r', encoding='utf-8', newline='') as linker_file:
+        linker_config = LinkerConfig(linker_file)
 
-            if line.type == LineType.MNEMONIC:
-                mnemonic = line.tokens.instr.lower()
+    return SegmentTable(linker_config)
 
-                if mnemonic == 'rts':
-                    self.warn('Unoptimized tail call.')
 
-            break
+def parse_defines(defines):
+    """
+    Return a frozenset of the symbols defined by ca65 style "-D SYMBOL[=VALUE]" arguments.
 
+    Arguments:
+    defines -- iterable of "SYMBOL" or "SYMBOL=VALUE" strings.
+    """
+    return frozenset(define.split('=', 1)[0].strip() for define in defines)
 
-    def lint_macro(self):
-        """Check macro rules for the current line."""
 
-        # too lazy to fix this.
-        # pylint: disable=too-many-branches
+def variant_spec(spec):
+    """
+    Return a "NAME:LINKER_CONFIG[:SYMBOL,...]" command line argument unchanged.
+    Raises argparse.ArgumentTypeError if it's malformed. See parse_variant.
 
-        if self.type != LineType.MACRO:
-            return
+    Arguments:
+    spec -- variant command line argument.
+    """
 
-        if self.block == '.enum':
-            # enum values get classified as macros.
-            # these should be upper case.
-            if not self.is_upper_case(self.instr):
-                self.warn(f'Enum value "{self.instr}" is not upper case.')
-        elif self.block in ('.struct', '.union'):
-            # struct and union attributes get classified as macros.
-            # these have similar rules to data labels.
-            prefix, name = self.get_prefix_name(self.instr)
+    if not VARIANT_REGEX.fullmatch(spec):
+        raise argparse.ArgumentTypeError(
+            f'invalid variant "{spec}". expected NAME:LINKER_CONFIG[:SYMBOL[=VALUE],...]')
 
-            if not prefix:
-                self.warn(f'Attribute "{self.instr}" has no prefix.')
+    return spec
 
-            if not name:
-                self.warn(f'Attribute "{self.instr}" has no name.')
-            elif not self.is_pascal_case(name):
-                self.warn(f'Attribute "{self.instr}" name is not pascal case.')
 
-            attr_prefixes = 'bwdqasp'
+def parse_variant(spec, defines=()):
+    """
+    Parse a "NAME:LINKER_CONFIG[:SYMBOL,...]" command line argument.
+    Return a tuple of the variant name, linker config path, and frozenset of defined symbols.
 
-            for char in prefix:
-                if char not in attr_prefixes:
-                    self.warn((f'Attribute "{self.instr}" '
-                        'uses an invalid prefix character "{char}".'))
+    Arguments:
+    spec -- variant command line argument.
+    defines -- iterable of "SYMBOL[=VALUE]" strings that every variant defines.
+    """
 
-            if len(set(prefix)) != len(prefix):
-                self.warn(f'Attribute "{self.instr}" has repeated prefix characters.')
+    name, linker_config_path, *symbols = spec.split(':', 2)
+    symbols = symbols[0].split(',') if symbols else []
+    return name, linker_config_path, parse_defines(list(defines) + [sym for sym in symbols if sym])
 
-            prefix_order = iter(attr_prefixes)
 
-            # check that prefix characters appear in the right order.
-            if not all(any(y == x for y in prefix_order) for x in prefix):
-                self.warn(f'Attribute "{self.instr}" has an incorrect prefix order.')
+class WarningLimitError(Exception):
+    """Raised to stop linting when the maximum number of warnings has been reported."""
 
-            # these prefixes are mutually exclusive
-            type_prefix = {
-                'b': 'byte',
-                'w': 'word',
-                'd': 'double word',
-                'q': 'quad word',
-                's': 'string',
-            }
 
-            # check if the attribute contains mutually exclusive prefixes.
-            prefixes = [char for char in type_prefix if char in prefix]
-            prefixes_len = len(prefixes)
+def main(linker_config_path, source_paths, strict=False, jobs=1, cache_path=None,
+         cache_stats=False, profile=False, profile_json=None, max_warnings=0,
+         includes=False, include_dirs=(), index_path=None, diff_path=None, defines=(),
+         variant_specs=(), tier=RuleTier.FULL, fix=False):
+    """
+    Entry point for this script.
+    Return the number of warnings reported.
+    """
 
-            msg = f'Attribute "{self.instr}" is prefixed with mutually exclusive types'
+    # i'd rather have a long argument list than a config object.
+    # pylint: disable=too-many-arguments
+    # pylint: disable=too-many-locals
 
-            if prefixes_len > 1:
-                types = ', '.join(type_prefix[prefixes[:-1]])
+    profiler = Profiler() if profile or profile_json else None
 
-                if prefixes_len > 2:
-                    types = types + ','
+    if profiler is not None:
+        profiler.install()
+        start = time.perf_counter()
 
-                types = types + f' and {type_prefix[prefixes[-1]]}'
-                self.warn(f'{msg} {types}.')
+    # the linker config and segment table are shared by every source file.
+    segments = load_segments(linker_config_path)
+    source_paths = find_sources(source_paths)
+    variants = None
 
-            # check if the attribute is prefixed as a string array.
-            # this is disallowed because a sting array could be ambiguous.
-            # i.e. an array of C strings or an array of string pointers.
-            # in either case, only an array prefix should be used.
-            if all(c in prefix for c in 'sa'):
-                self.warn(f'{msg} string and array.')
+    # rewrite tail calls before anything reads the sources so that only what's left is reported.
+    if fix:
+        for source_path in source_paths:
+            with open(source_path, 'r', encoding='utf-8', newline='') as source_file:
+                text, count = fix_tail_calls(source_file.read())
 
-            # the 's' prefix is pulling double duty for strings and structs.
-            # in context, the difference should be clear.
-        else:
-            if not self.is_snake_case(self.instr):
-                self.warn(f'Macro name "{self.instr}" is not snake case.')
+            if not count:
+                continue
 
-            magic = self.get_magic_numbers()
+            with open(source_path, 'w', encoding='utf-8', newline='') as source_file:
+                source_file.write(text)
 
-            for num in magic:
-                self.cry(f'Magic number "{num}" in macro arguments.')
+            calls = 'call' if count == 1 else 'calls'
+            print(f'lint65: {source_path}: fixed {count} unoptimized tail {calls}, '
+                  f'saving {count * TAIL_CALL_CYCLES} cycles', file=sys.stderr)
 
-    def lint_args(self):
-        """Check argument rules for the current line."""
+    # the linker config and -D symbols given without a variant make up the "default" variant.
+    if defines or variant_specs:
+        variants = [Variant('default', segments, parse_defines(defines))]
+        variants += [
+            Variant(name, load_segments(path), symbols)
+            for name, path, symbols in (parse_variant(spec, defines) for spec in variant_specs)
+        ]
 
-        # we're just going to search for commands in arguments and check some basic rules.
-        # this will probably be good enough to catch common errors.
+    cache = LintCache(cache_path, segments, strict, variants, tier) if cache_path else None
 
-        # pattern match ca65 commands in arguments.
-        commands = re.findall(r'(\.[a-zA-Z0-9]+)', self.args)
+    if profiler is not None:
+        profiler.add_phase('config', time.perf_counter() - start)
+        start = time.perf_counter()
 
-        # filter matches down to valid commands.
-        commands = [c for c in commands if c.lower() in COMMANDS]
+    graph = None
 
-        for command in commands:
-            if not command.islower():
-                self.warn(f'Command "{command}" should be lowercase.')
+    # lint every header that the sources include exactly once.
+    if includes:
+        graph = IncludeGraph(include_dirs)
+        source_paths = graph.walk(source_paths)
 
-            alias = self.get_command_alias(command)
+    changes = None
 
-            if alias:
-                self.warn(f'Illegal command "{command}". Use "{alias}" instead.')
+    # only lint the files and blocks that a diff touches.
+    if diff_path:
+        if diff_path == '-':
+            diff = sys.stdin.read()
+        else:
+            with open(diff_path, 'r', encoding='utf-8') as diff_file:
+                diff = diff_file.read()
 
+        changed = parse_diff(diff)
+        changes = {
+            path: changed[os.path.realpath(path)]
+            for path in source_paths if os.path.realpath(path) in changed
+        }
+        source_paths = [path for path in source_paths if path in changes]
 
+        # results for part of a file can't be cached.
+        cache = None
 
-    def lint_comment(self):
-        """Check comment rules for the current line."""
+    index = None
 
-        if not self.comment:
-            return
+    # index symbols before linting so that the index sees every file in the run.
+    if index_path:
+        index = SymbolIndex(index_path, segments, graph.get_source if graph else read_source)
+        index.update(source_paths)
 
-        regex = r'^;\s*(TODO|NOTE):\s*(.*?)\s*'
-        matches = re.fullmatch(regex, self.comment, re.IGNORECASE)
+    if profiler is not None:
+        profiler.add_phase('tokenize', time.perf_counter() - start)
 
-        if not matches:
-            return
+        # lint every file in this process without the cache
+        # so that the statistics cover the whole run.
+        jobs = 1
+        cache = None
 
-        comment_data = []
-        comment_type, content = matches.groups()
-        comment_data.append(content)
+    reported = 0
+    cache_counts = Counter()
 
-        # comments may span multiple lines.
-        # gather those lines and join them together.
-        for index in range(self.index+1, len(self.lines)):
-            # get the next line.
-            line = self.lines[index]
+    def report(source_path, warning):
+        nonlocal reported
 
-            # the line must contain only a comment.
-            if line.type != LineType.COMMENT:
-                break
+        # flush so that warnings show up while the rest of the files are linted.
+        print(f'{source_path}{warning}', flush=True)
+        reported += 1
 
-            line_comment = line.tokens.comment
+        if reported == max_warnings:
+            raise WarningLimitError()
 
-            # check if this line starts a new TODO or NOTE comment.
-            if re.match(r'^;\s*(TODO|NOTE)', line_comment, re.IGNORECASE):
-                break
+    try:
+        lint_files(segments, source_paths, report, strict, jobs, cache, profiler, graph, changes,
+            variants, tier, cache_counts)
 
-            # this should always match. no need to check the return value.
-            matches = re.fullmatch(r'^;\s*(.*?)\s*', line_comment)
+        # rules that depend on other files run once every file has been linted on its own.
+        if index is not None:
+            for source_path, warning in index.check(source_paths, strict, changes):
+                report(source_path, warning)
+    except WarningLimitError:
+        print(f'lint65: stopped after {max_warnings} warnings', file=sys.stderr)
+    finally:
+        if profiler is not None:
+            profiler.uninstall()
 
-            content = matches.group(1)
-            comment_data.append(content)
+        if index is not None:
+            index.close()
 
-        full_comment = ' '.join(comment_data)
+    # statistics go to stderr too so that editors and make only parse warnings on stdout.
+    if cache_stats and cache is not None:
+        print(f'lint65: cache: {cache.hits} hits, {cache.misses} misses', file=sys.stderr)
 
-        if comment_type.upper() == 'TODO':
-            self.warn(f'TODO: {full_comment}')
-        else: # NOTE
-            self.cry(f'NOTE: {full_comment}')
+    if cache_stats and index is not None:
+        print(f'lint65: symbol index: {index.updated} updated, {index.unchanged} unchanged',
+            file=sys.stderr)
 
+    # worker processes have caches of their own. add up the counts from every process.
+    if cache_stats:
+        cache_counts.update(get_cache_counts())
+        print(f'lint65: magic number cache: {cache_counts["magic_hits"]} hits, '
+              f'{cache_counts["magic_misses"]} misses', file=sys.stderr)
+        print(f'lint65: identifier cache: {cache_counts["ident_hits"]} hits, '
+              f'{cache_counts["ident_misses"]} misses', file=sys.stderr)
 
-def main(linker_config_path, source_path, strict=False):
-    """Entry point for this script."""
+    # the profile goes to stderr so that it doesn't get mixed up with warnings.
+    if profile:
+        print(profiler.format_table(), file=sys.stderr)
 
-    with open(linker_config_path, 'r', encoding='utf-8', newline='') as linker_file:
-        linker_config = LinkerConfig(linker_file)
+    if profile_json:
+        with open(profile_json, 'w', encoding='utf-8') as json_file:
+            json.dump(profiler.as_dict(), json_file, indent=4)
 
-    with open(source_path, 'r', encoding='utf-8', newline='') as source_file:
-        linter = Linter(linker_config, source_file, strict)
+    return reported
 
-    for warning in linter.warnings:
-        print(f'{source_path}{warning}')
 
+def make_parser():
+    """Return the command line argument parser for this script."""
 
-if __name__ == '__main__':
     parser = argparse.ArgumentParser(
-        description='Lint a 6502 assembly file written with ca65 syntax.')
+        description='Lint 6502 assembly files written with ca65 syntax.')
 
     parser.add_argument('linker_config_path',
         help='path to the cl65 linker config file for the project')
-    parser.add_argument('source_path',
-        help='path to a ca65 *.s or *.inc source file to lint')
+    parser.add_argument('source_paths',
+        help='paths to ca65 *.s or *.inc source files, directories, or glob patterns',
+        nargs='+',
+        metavar='source_path')
     parser.add_argument('-s', '--strict',
         help='enable stricter linting rules',
         action='store_true')
+    parser.add_argument('--fast',
+        help='only run cheap rules that look at a single line, for tight edit loops. '
+             'skips magic numbers, TODO and NOTE comments, and unoptimized tail calls',
+        action='store_const',
+        const=RuleTier.FAST,
+        default=RuleTier.FULL,
+        dest='tier')
+    parser.add_argument('--full',
+        help='run every rule (default). overrides an earlier --fast, e.g. for CI',
+        action='store_const',
+        const=RuleTier.FULL,
+        dest='tier')
+    parser.add_argument('--includes',
+        help='also lint every file that the sources .include, once each',
+        action='store_true')
+    parser.add_argument('-I', '--include-dir',
+        help='directory to search for included files like ca65 -I (default: include)',
+        action='append',
+        dest='include_dirs',
+        metavar='DIR')
+    parser.add_argument('-j', '--jobs',
+        help='number of files to lint in parallel (0 uses every CPU core)',
+        type=int,
+        default=1)
+    parser.add_argument('-c', '--cache',
+        help='directory to cache lint results in (e.g. build/.lint65-cache)',
+        metavar='CACHE_DIR')
+    parser.add_argument('--index',
+        help='SQLite file to index symbols in (e.g. build/.lint65-index). '
+             'enables rules that check exports and imports across files',
+        dest='index_path',
+        metavar='PATH')
+    parser.add_argument('--diff',
+        help='only lint the .proc and .scope blocks around lines changed by a unified diff '
+             '(use - to read "git diff" output from stdin)',
+        dest='diff_path',
+        metavar='PATH')
+    parser.add_argument('-D',
+        help='define a symbol like ca65 -D. '
+             '.ifdef, .ifndef, and .if .defined() blocks that only test defined symbols '
+             'are linted for the active branch',
+        action='append',
+        dest='defines',
+        metavar='SYMBOL[=VALUE]')
+    parser.add_argument('--variant',
+        help='also lint for a build variant with its own linker config and -D symbols. '
+             'warnings that only some variants have are followed by their names',
+        action='append',
+        type=variant_spec,
+        dest='variant_specs',
+        metavar='NAME:LINKER_CONFIG[:SYMBOL,...]')
+    parser.add_argument('--fix',
+        help='rewrite unoptimized tail calls to "jmp" and add the "tail_jump" linter tags '
+             'that they need before linting. headers found by --includes are left alone',
+        action='store_true')
+    parser.add_argument('--cache-stats',
+        help='print cache hit and miss counts to stderr. '
+             'magic number and identifier counts add up the caches of every worker process',
+        action='store_true')
+    parser.add_argument('--max-warnings',
+        help='stop linting after N warnings (0 means no limit)',
+        type=int,
+        default=0,
+        metavar='N')
+    parser.add_argument('--profile',
+        help='print time spent in each phase, rule, and regex to stderr',
+        action='store_true')
+    parser.add_argument('--profile-json',
+        help='write profiling statistics to a JSON file',
+        metavar='PATH')
+
+    return parser
 
+
+if __name__ == '__main__':
+    parser = make_parser()
     args = parser.parse_args()
 
-    main(args.linker_config_path, args.source_path, args.strict)
+    # blocks in inactive branches would need to be linted for some variants and not for others.
+    if args.diff_path and (args.defines or args.variant_specs):
+        parser.error('--diff can not be combined with -D or --variant')
+
+    # fixes move lines around so the diff's line numbers would be wrong.
+    if args.diff_path and args.fix:
+        parser.error('--diff can not be combined with --fix')
+
+    jobs = args.jobs if args.jobs > 0 else os.cpu_count() or 1
+
+    warning_count = main(args.linker_config_path, args.source_paths, args.strict, jobs,
+        args.cache, args.cache_stats, args.profile, args.profile_json, args.max_warnings,
+        args.includes, args.include_dirs or ['include'], args.index_path, args.diff_path,
+        args.defines or (), args.variant_specs or (), args.tier, args.fix)
+
+    # fail the build if there is anything to fix.
+    sys.exit(1 if warning_count else 0)
@@ -0,0 +1,620 @@
+#!/usr/bin/env python3.6
+
+"""
+A language server for lint65.
+Publishes linter warnings as diagnostics while a ca65 assembly file is being edited.
+Edits only re-tokenize the lines they touch
+and only re-lint the procedure or lines around them.
+Speaks JSON-RPC over stdin and stdout.
+"""
+
+import argparse
+import io
+import json
+import statistics
+import sys
+import time
+
+from bisect import bisect_right
+
+from lint65 import (
+    LinkerConfig,
+    Linter,
+    SegmentTable,
+    StructureIndex,
+    Tokenizer,
+    TokenizedLine,
+)
+
+# LSP diagnostic severity for warnings.
+SEVERITY_WARNING = 2
+
+# LSP text document sync kind for incremental changes.
+SYNC_INCREMENTAL = 2
+
+# JSON-RPC error code for unknown methods.
+METHOD_NOT_FOUND = -32601
+
+
+def split_lines(text):
+    """
+    Split text into lines while keeping line endings.
+    Unlike str.splitlines, only "\\n" ends a line. That is how Tokenizer reads files.
+
+    Arguments:
+    text -- text to split.
+    """
+
+    lines = text.split('\n')
+    last = lines.pop()
+    lines = [line + '\n' for line in lines]
+
+    if last:
+        lines.append(last)
+
+    return lines
+
+
+class DocumentLinter(Linter):
+    """Linter that keeps per-line state and warnings so that lines can be re-linted."""
+
+    def __init__(self, segments, lines, strict=False):
+        """
+        Initialize the linter and lint a list of tokenized lines.
+
+        Arguments:
+        segments -- SegmentTable instance.
+        lines -- list of TokenizedLine instances.
+        strict -- Enables strict mode.
+        """
+
+        # LinterState before each line plus the state after the last line.
+        self.states = [None] * len(lines)
+        # (line number offset, message) tuples for each line.
+        self.line_warnings = [[] for _ in lines]
+        # (line number, message) tuples for warnings raised outside of lint_line.
+        self.pending = []
+        self.bucket = None
+
+        super().__init__(segments, None, strict, lines)
+
+
+    def warn(self, message, num=None):
+        """
+        Record a warning for the current line.
+
+        Warnings are stored relative to the current line
+        so that they stay correct when lines above them are added or removed.
+
+        Arguments:
+        message -- warning message.
+        num -- line number associated with the warning message.
+        """
+        if num is None:
+            num = self.num
+
+        if self.bucket is None:
+            self.pending.append((num, message))
+        else:
+            self.bucket.append((num - self.num, message))
+
+
+    def collect(self, func, *args):
+        """
+        Call a method and return the warnings that it raised outside of lint_line.
+
+        Arguments:
+        func -- method to call.
+        args -- arguments to pass to func.
+        """
+        self.pending = []
+        func(*args)
+        pending, self.pending = self.pending, []
+        return pending
+
+
+    def lint(self):
+        """Lint each tokenized line and record the state after the last line."""
+        self.lint_range(0, len(self.lines))
+        self.states.append(self.get_state())
+
+
+    def lint_line(self):
+        """Lint a single tokenized line and record its state and warnings."""
+        self.states[self.index] = self.get_state()
+        self.bucket = self.line_warnings[self.index] = []
+
+        # half-typed lines can trip up rules that expect code that assembles.
+        # report the problem instead of taking the whole server down.
+        # pylint: disable=broad-except
+        try:
+            super().lint_line()
+        except Exception as error:
+            self.bucket.append((0, f'Linter error: {error!r}'))
+
+        self.bucket = None
+
+
+class Document:
+    """A ca65 assembly file that is re-tokenized and re-linted incrementally."""
+
+    def __init__(self, segments, text, strict=False):
+        """
+        Tokenize and lint a whole document.
+
+        Arguments:
+        segments -- SegmentTable instance.
+        text -- document content.
+        strict -- Enables strict mode.
+        """
+
+        self.text_lines = split_lines(text)
+        self.lines = list(Tokenizer.tokenize(io.StringIO(text)))
+        self.nums = [line.num for line in self.lines]
+        self.linter = DocumentLinter(segments, self.lines, strict)
+        self.raw_warnings = [self._lint_raw_line(line) for line in self.text_lines]
+
+
+    def _lint_raw_line(self, line):
+        """
+        Return a list of warning messages for an untokenized line.
+
+        Arguments:
+        line -- a single line of the document.
+        """
+        return [msg for _, msg in self.linter.collect(self.linter.lint_raw_line, line, 0)]
+
+
+    def _logical_index(self, physical):
+        """
+        Return the index of the tokenized line that contains a physical line.
+
+        Arguments:
+        physical -- physical line index (0-indexed).
+        """
+        return max(bisect_right(self.nums, physical + 1) - 1, 0)
+
+
+    def apply_change(self, change):
+        """
+        Apply an LSP content change to the document and re-lint the affected lines.
+
+        Return the range of tokenized lines that was re-linted as a (start, stop) tuple.
+
+        Arguments:
+        change -- TextDocumentContentChangeEvent dictionary.
+        """
+
+        # can't be bothered to split this up.
+        # pylint: disable=too-many-locals
+
+        if 'range' not in change or not self.lines:
+            self.__init__(self.linter.segments, change['text'], self.linter.strict)
+            return 0, len(self.lines)
+
+        start = change['range']['start']
+        end = change['range']['end']
+        text_lines = self.text_lines
+
+        # replace the physical lines touched by the change.
+        first = min(start['line'], len(text_lines))
+        last = min(end['line'], len(text_lines) - 1)
+        prefix = text_lines[first][:start['character']] if first < len(text_lines) else ''
+        suffix = text_lines[last][end['character']:] if last >= first else ''
+        new_lines = split_lines(prefix + change['text'] + suffix)
+        old_count = max(last - first + 1, 0)
+        delta = len(new_lines) - old_count
+
+        text_lines[first:first + old_count] = new_lines
+        self.raw_warnings[first:first + old_count] = [self._lint_raw_line(l) for l in new_lines]
+
+        # find the tokenized lines that contain the changed physical lines.
+        # continued lines may extend that range in either direction.
+        start_index = self._logical_index(first)
+        stop_index = self._logical_index(first + max(old_count - 1, 0)) + 1
+        physical_start = self.nums[start_index] - 1
+
+        while True:
+            if stop_index < len(self.nums):
+                physical_stop = self.nums[stop_index] - 1 + delta
+            else:
+                physical_stop = len(text_lines)
+
+            if physical_stop >= len(text_lines):
+                break
+
+            if not text_lines[physical_stop - 1].endswith('\\\n'):
+                break
+
+            stop_index += 1
+
+        # re-tokenize only the affected lines.
+        chunk = io.StringIO(''.join(text_lines[physical_start:physical_stop]))
+        tokens = [
+            TokenizedLine(line.num + physical_start, line.tokens, line.type)
+            for line in Tokenizer.tokenize(chunk)
+        ]
+
+        self.lines[start_index:stop_index] = tokens
+        self.nums[start_index:stop_index] = (line.num for line in tokens)
+
+        # shift the line numbers of the lines after the change.
+        if delta:
+            for i in range(start_index + len(tokens), len(self.lines)):
+                line = self.lines[i]
+                self.lines[i] = TokenizedLine(line.num + delta, line.tokens, line.type)
+                self.nums[i] += delta
+
+        linter = self.linter
+        start_state = linter.states[start_index]
+        linter.states[start_index:stop_index] = [None] * len(tokens)
+        linter.line_warnings[start_index:stop_index] = [[] for _ in tokens]
+        linter.structure.update(self.lines, start_index, stop_index, start_index + len(tokens))
+
+        return self._relint(start_index, start_index + len(tokens), start_state)
+
+
+    def _relint(self, start, stop, start_state):
+        """
+        Re-lint the lines around a range of re-tokenized lines.
+
+        Linting starts at the innermost enclosing .proc, .scope, or .if block
+        or at the lines whose rules look ahead into the range. Linting continues past the range
+        until that block has ended and the carried state matches the state from the previous lint.
+
+        Return the range of tokenized lines that was re-linted as a (start, stop) tuple.
+
+        Arguments:
+        start -- index of the first re-tokenized line.
+        stop -- index of the line after the last re-tokenized line.
+        start_state -- LinterState before the first re-tokenized line.
+        """
+
+        linter = self.linter
+        structure = linter.structure
+        lines = self.lines
+        first = start
+
+        # rules for blank line counts, TODO comments, and tail calls
+        # look ahead past insignificant lines.
+        while first > 0 and lines[first - 1].type in StructureIndex.INSIGNIFICANT_TYPES:
+            first -= 1
+
+        if first > 0:
+            first -= 1
+
+        # rules for blocks depend on the whole block.
+        first = min(first, self._block_start(start, start_state))
+
+        # rules for the end of a procedure depend on the whole procedure.
+        proc_start = structure.proc_start(first)
+
+        if proc_start >= 0 and structure.proc_end(proc_start) >= first:
+            first = proc_start
+
+        linter.set_state(start_state if first == start else linter.states[first])
+        depth = len(linter.blocks)
+        index = first
+
+        while index < len(lines):
+            linter.select_line(index)
+            linter.lint_line()
+            index += 1
+
+            if index <= stop or len(linter.blocks) > depth:
+                continue
+
+            # the rest of the document will lint the same as before.
+            if index < len(lines) and linter.get_state() == linter.states[index]:
+                return first, index
+        else:
+            linter.states[-1] = linter.get_state()
+
+        return first, index
+
+
+    def _block_start(self, index, state):
+        """
+        Return the index of the line that opens the innermost .proc, .scope, or .if block
+        around a line, or the index of the line itself if it isn't in one of those blocks.
+
+        Arguments:
+        index -- index of a tokenized line. the states of the lines before it must be up to date.
+        state -- LinterState before the line.
+        """
+
+        depth = len(state.blocks)
+
+        while depth > 0:
+            block = state.blocks[depth - 1]
+
+            if block in ('.proc', '.scope') or block.startswith('.if'):
+                break
+
+            depth -= 1
+        else:
+            return index
+
+        # the block was opened by the last line before which fewer blocks were open.
+        states = self.linter.states
+
+        while index > 0 and len(states[index - 1].blocks) >= depth:
+            index -= 1
+
+        return max(index - 1, 0)
+
+
+    def diagnostics(self):
+        """Return a list of LSP diagnostics for the document."""
+
+        warnings = []
+
+        for num, messages in enumerate(self.raw_warnings, 1):
+            if messages:
+                warnings.extend((num, msg) for msg in messages)
+
+        for line, line_warnings in zip(self.lines, self.linter.line_warnings):
+            if line_warnings:
+                warnings.extend((line.num + offset, msg) for offset, msg in line_warnings)
+
+        if self.lines:
+            warnings.extend(self.linter.collect(self.linter.lint_end))
+
+        diagnostics = []
+
+        for num, message in warnings:
+            index = min(max(num - 1, 0), max(len(self.text_lines) - 1, 0))
+            text = self.text_lines[index] if self.text_lines else ''
+            diagnostics.append({
+                'range': {
+                    'start': {'line': index, 'character': 0},
+                    'end': {'line': index, 'character': len(text.rstrip('\r\n'))},
+                },
+                'severity': SEVERITY_WARNING,
+                'source': 'lint65',
+                'message': message,
+            })
+
+        return diagnostics
+
+
+class LanguageServer:
+    """Minimal LSP server that lints ca65 assembly documents."""
+
+    def __init__(self, segments, strict=False, reader=None, writer=None):
+        """
+        Initialize the language server.
+
+        Arguments:
+        segments -- SegmentTable instance.
+        strict -- Enables strict mode.
+        reader -- binary file object to read messages from. defaults to stdin.
+        writer -- binary file object to write messages to. defaults to stdout.
+        """
+        self.segments = segments
+        self.strict = strict
+        self.reader = reader or sys.stdin.buffer
+        self.writer = writer or sys.stdout.buffer
+        self.documents = {}
+        self.running = True
+
+
+    def read_message(self):
+        """Read a JSON-RPC message. Return None at the end of the input."""
+
+        length = None
+
+        while True:
+            header = self.reader.readline()
+
+            if not header:
+                return None
+
+            header = header.strip()
+
+            if not header:
+                break
+
+            name, _, value = header.decode('ascii').partition(':')
+
+            if name.lower() == 'content-length':
+                length = int(value)
+
+        if length is None:
+            return None
+
+        return json.loads(self.reader.read(length).decode('utf-8'))
+
+
+    def write_message(self, message):
+        """
+        Write a JSON-RPC message.
+
+        Arguments:
+        message -- dictionary to send.
+        """
+        message['jsonrpc'] = '2.0'
+        body = json.dumps(message).encode('utf-8')
+        self.writer.write(f'Content-Length: {len(body)}\r\n\r\n'.encode('ascii') + body)
+        self.writer.flush()
+
+
+    def publish(self, uri):
+        """
+        Publish the diagnostics for a document.
+
+        Arguments:
+        uri -- document URI.
+        """
+        document = self.documents.get(uri)
+        diagnostics = document.diagnostics() if document else []
+        self.write_message({
+            'method': 'textDocument/publishDiagnostics',
+            'params': {'uri': uri, 'diagnostics': diagnostics},
+        })
+
+
+    def run(self):
+        """Handle messages until the client exits."""
+
+        while self.running:
+            message = self.read_message()
+
+            if message is None:
+                break
+
+            method = message.get('method', '')
+            params = message.get('params', {})
+            handler = getattr(self, 'on_' + method.replace('/', '_'), None)
+
+            if handler is None:
+                # requests need a response. notifications don't.
+                if 'id' in message:
+                    self.write_message({
+                        'id': message['id'],
+                        'error': {'code': METHOD_NOT_FOUND, 'message': f'Unknown method "{method}"'},
+                    })
+                continue
+
+            result = handler(params)
+
+            if 'id' in message:
+                self.write_message({'id': message['id'], 'result': result})
+
+
+    # LSP method names don't follow our naming conventions.
+    # pylint: disable=invalid-name
+    # pylint: disable=unused-argument
+
+    def on_initialize(self, params):
+        """Handle the "initialize" request."""
+        return {
+            'capabilities': {
+                'textDocumentSync': {'openClose': True, 'change': SYNC_INCREMENTAL},
+            },
+            'serverInfo': {'name': 'lint65'},
+        }
+
+
+    def on_shutdown(self, params):
+        """Handle the "shutdown" request."""
+        return None
+
+
+    def on_exit(self, params):
+        """Handle the "exit" notification."""
+        self.running = False
+
+
+    def on_textDocument_didOpen(self, params):
+        """Handle the "textDocument/didOpen" notification."""
+        item = params['textDocument']
+        self.documents[item['uri']] = Document(self.segments, item['text'], self.strict)
+        self.publish(item['uri'])
+
+
+    def on_textDocument_didChange(self, params):
+        """Handle the "textDocument/didChange" notification."""
+        uri = params['textDocument']['uri']
+        document = self.documents.get(uri)
+
+        if document is None:
+            return
+
+        for change in params['contentChanges']:
+            document.apply_change(change)
+
+        self.publish(uri)
+
+
+    def on_textDocument_didClose(self, params):
+        """Handle the "textDocument/didClose" notification."""
+        uri = params['textDocument']['uri']
+        self.documents.pop(uri, None)
+        self.publish(uri)
+
+
+def benchmark(segments, source_path, strict=False, edits=200):
+    """
+    Measure the latency of single-line edits and compare it to a full lint.
+    Return a dictionary of timings in milliseconds.
+
+    Every edit appends a character to a line and then removes it again.
+    The edited lines are spread evenly across the file.
+
+    Arguments:
+    segments -- SegmentTable instance.
+    source_path -- path to a ca65 source file.
+    strict -- Enables strict mode.
+    edits -- number of lines to edit.
+    """
+
+    with open(source_path, 'r', encoding='utf-8', newline='') as source_file:
+        text = source_file.read()
+
+    start = time.perf_counter()
+    document = Document(segments, text, strict)
+    full = time.perf_counter() - start
+
+    line_count = len(document.text_lines)
+    latencies = []
+    relinted = []
+
+    for i in range(edits):
+        line = i * line_count // edits
+        column = len(document.text_lines[line].rstrip('\r\n'))
+        position = {'line': line, 'character': column}
+        changes = [
+            {'range': {'start': position, 'end': position}, 'text': ' '},
+            {'range': {'start': position, 'end': dict(position, character=column + 1)}, 'text': ''},
+        ]
+
+        for change in changes:
+            start = time.perf_counter()
+            first, stop = document.apply_change(change)
+            document.diagnostics()
+            latencies.append(time.perf_counter() - start)
+            relinted.append(stop - first)
+
+    return {
+        'lines': line_count,
+        'full_lint_ms': full * 1000,
+        'edit_mean_ms': statistics.mean(latencies) * 1000,
+        'edit_median_ms': statistics.median(latencies) * 1000,
+        'edit_max_ms': max(latencies) * 1000,
+        'relinted_lines_mean': statistics.mean(relinted),
+    }
+
+
+def main(linker_config_path, strict=False, benchmark_path=None):
+    """Entry point for this script."""
+
+    with open(linker_config_path, 'r', encoding='utf-8', newline='') as linker_file:
+        segments = SegmentTable(LinkerConfig(linker_file))
+
+    if benchmark_path:
+        results = benchmark(segments, benchmark_path, strict)
+
+        for name, value in results.items():
+            print(f'{name}: {value:.3f}' if isinstance(value, float) else f'{name}: {value}')
+        return
+
+    LanguageServer(segments, strict).run()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Language server that lints 6502 assembly files written with ca65 syntax.')
+
+    parser.add_argument('linker_config_path',
+        help='path to the cl65 linker config file for the project')
+    parser.add_argument('-s', '--strict',
+        help='enable stricter linting rules',
+        action='store_true')
+    parser.add_argument('--benchmark',
+        help='measure single-line edit latency on a source file instead of serving',
+        metavar='SOURCE_PATH')
+
+    args = parser.parse_args()
+
+    main(args.linker_config_path, args.strict, args.benchmark)
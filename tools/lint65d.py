@@ -0,0 +1,723 @@
+#!/usr/bin/env python3.6
+
+"""
+A resident lint65 daemon and its thin client.
+
+The daemon keeps parsed linker configs, tokenized source files, and lint results in memory.
+It watches the source directories and re-lints changed files before anyone asks.
+It restarts itself with the new rules when lint65.py changes.
+The client sends lint requests to the daemon over a Unix socket
+and falls back to running lint65.py directly if the daemon isn't running.
+
+Usage:
+lint65d.py start            start the daemon in the background.
+lint65d.py serve            run the daemon in the foreground.
+lint65d.py stop             stop the daemon.
+lint65d.py lint ARGS...     lint files. ARGS are the same as for lint65.py.
+"""
+
+# the client should start fast so lint65 is only imported by the daemon.
+# pylint: disable=import-outside-toplevel
+
+import argparse
+import collections
+import ctypes
+import ctypes.util
+import io
+import json
+import os
+import socket
+import struct
+import subprocess
+import sys
+import threading
+import time
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+TOP_DIR = os.path.dirname(TOOLS_DIR)
+
+# where the daemon listens by default.
+SOCKET_PATH = os.path.join(TOP_DIR, 'build', '.lint65d.sock')
+
+# directories that the daemon watches by default.
+WATCH_DIRS = [os.path.join(TOP_DIR, 'src'), os.path.join(TOP_DIR, 'include')]
+
+# seconds between scans when inotify isn't available.
+POLL_INTERVAL = 0.5
+
+# seconds that "start" waits for the daemon to come up.
+START_TIMEOUT = 5.0
+
+# file extensions that the daemon lints.
+SOURCE_EXTENSIONS = ('.s', '.inc')
+
+# most lint results that the daemon keeps in memory. the least recently used are dropped first.
+MAX_RESULTS = 4096
+
+# lint65.py options that the daemon can't answer for. the client runs lint65.py directly instead.
+# the diff may come from the client's stdin, which the daemon can't read.
+# files should be fixed by the client rather than the daemon.
+# profiles and cache statistics are about a lint65.py run of their own.
+DIRECT_OPTIONS = ('--diff', '--fix', '--profile', '--profile-json', '--cache-stats')
+
+# inotify event masks. see inotify(7).
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_ISDIR = 0x40000000
+IN_WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+# struct inotify_event without the trailing name.
+INOTIFY_EVENT = struct.Struct('iIII')
+
+
+def file_stamp(path):
+    """
+    Return a value that changes whenever a file changes or None if it doesn't exist.
+
+    Arguments:
+    path -- path to a file.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+class LintDaemon:
+    """In-memory lint state shared by client requests and the file watcher."""
+
+    def __init__(self):
+        """Initialize an empty daemon state."""
+
+        import lint65
+
+        self.lint65 = lint65
+        # the rules are only loaded once. see stale.
+        self.lint65_stamp = file_stamp(lint65.__file__)
+        self.lock = threading.Lock()
+        # linker config path -> (stamp, SegmentTable)
+        self.configs = {}
+        # source path -> (stamp, source text, list of TokenizedLine)
+        self.sources = {}
+        # (source path, linker config path, strict, variants, tier) ->
+        # (source stamp, config stamps, warnings), least recently used first.
+        self.results = collections.OrderedDict()
+        # (cache path, linker config path, strict, variants, tier) -> (config stamps, LintCache)
+        self.caches = {}
+        # (linker config path, strict, variants, tier, cache path) tuples
+        # that clients have asked for.
+        self.modes = set()
+
+
+    def stale(self):
+        """
+        Return True if lint65.py has changed since the daemon imported it.
+        The daemon's rules and results are out of date then.
+        """
+        return file_stamp(self.lint65.__file__) != self.lint65_stamp
+
+
+    def get_segments(self, config_path):
+        """
+        Return the segment table for a linker config and the config's stamp.
+
+        Arguments:
+        config_path -- absolute path to a linker config.
+        """
+
+        stamp = file_stamp(config_path)
+        cached = self.configs.get(config_path)
+
+        if cached is not None and cached[0] == stamp:
+            return cached[1], stamp
+
+        with open(config_path, 'r', encoding='utf-8', newline='') as linker_file:
+            segments = self.lint65.SegmentTable(self.lint65.LinkerConfig(linker_file))
+
+        self.configs[config_path] = (stamp, segments)
+        return segments, stamp
+
+
+    def get_source(self, source_path):
+        """
+        Return the stamp, text, and tokenized lines of a source file.
+
+        Arguments:
+        source_path -- absolute path to a source file.
+        """
+
+        stamp = file_stamp(source_path)
+        cached = self.sources.get(source_path)
+
+        if cached is not None and cached[0] == stamp:
+            return cached
+
+        with open(source_path, 'r', encoding='utf-8', newline='') as source_file:
+            text = source_file.read()
+
+        lines = self.lint65.tokenize_text(text)
+        cached = (stamp, text, lines)
+        self.sources[source_path] = cached
+        return cached
+
+
+    def get_cache(self, cache_path, mode, config_stamps, segments, variants):
+        """
+        Return the on-disk LintCache for a lint mode.
+
+        Arguments:
+        cache_path -- absolute path of the cache directory.
+        mode -- (linker config path, strict, variants, tier) tuple.
+        config_stamps -- stamps of the linker configs of the mode.
+        segments -- SegmentTable instance of the linker config.
+        variants -- list of lint65.Variant instances.
+        """
+
+        # i'd rather have a long argument list than a config object.
+        # pylint: disable=too-many-arguments
+
+        key = (cache_path,) + mode
+        cached = self.caches.get(key)
+
+        if cached is not None and cached[0] == config_stamps:
+            return cached[1]
+
+        _, strict, _, tier = mode
+        cache = self.lint65.LintCache(cache_path, segments, strict, variants, tier)
+        self.caches[key] = (config_stamps, cache)
+        return cache
+
+
+    def lint(self, source_path, config_path, strict=False, variants=(), tier=None,
+             cache_path=None):
+        """
+        Return the warnings for a source file.
+
+        Arguments:
+        source_path -- absolute path to a source file.
+        config_path -- absolute path to a linker config.
+        strict -- Enables strict mode.
+        variants -- optional tuple of (name, absolute linker config path, frozenset of symbols)
+                    tuples to lint for. see lint65.lint_variants.
+        tier -- lint65.RuleTier of the most expensive rules to run. defaults to every rule.
+        cache_path -- optional absolute path of an on-disk cache directory like lint65.py --cache.
+                      results that aren't in memory are looked up there and stored there.
+        """
+
+        # i'd rather have a long argument list than a config object.
+        # pylint: disable=too-many-arguments
+        # pylint: disable=too-many-locals
+
+        tier = tier or self.lint65.RuleTier.FULL
+
+        with self.lock:
+            self.modes.add((config_path, strict, variants, tier, cache_path))
+            segments, config_stamp = self.get_segments(config_path)
+            variant_segments = [self.get_segments(path) for _, path, _ in variants]
+            config_stamps = (config_stamp,) + tuple(stamp for _, stamp in variant_segments)
+            source_stamp, text, lines = self.get_source(source_path)
+
+            key = (source_path, config_path, strict, variants, tier)
+            cached = self.results.get(key)
+
+            if cached is not None and cached[:2] == (source_stamp, config_stamps):
+                self.results.move_to_end(key)
+                return cached[2]
+
+            variant_list = [
+                self.lint65.Variant(name, variant_table, defines)
+                for (name, _, defines), (variant_table, _) in zip(variants, variant_segments)
+            ]
+            cache = None
+            warnings = None
+
+            if cache_path:
+                cache = self.get_cache(cache_path, (config_path, strict, variants, tier),
+                    config_stamps, segments, variant_list)
+                warnings = cache.get(text.encode('utf-8'))
+
+            if warnings is None:
+                if variants:
+                    warnings = self.lint65.lint_variants(variant_list, text, lines, strict, tier)
+                else:
+                    source_file = io.StringIO(text, newline='')
+                    warnings = self.lint65.Linter(
+                        segments, source_file, strict, lines, None, tier).warnings
+
+                if cache is not None:
+                    cache.put(text.encode('utf-8'), warnings)
+
+            self.results[key] = (source_stamp, config_stamps, warnings)
+            self.results.move_to_end(key)
+
+            while len(self.results) > MAX_RESULTS:
+                self.results.popitem(last=False)
+
+            return warnings
+
+
+    def refresh(self, source_path):
+        """
+        Re-lint a changed source file for every mode that clients have asked for.
+
+        Arguments:
+        source_path -- absolute path to a source file.
+        """
+
+        if file_stamp(source_path) is None:
+            with self.lock:
+                self.sources.pop(source_path, None)
+            return
+
+        for config_path, strict, variants, tier, cache_path in list(self.modes):
+            # errors will be reported when a client asks for this file.
+            # pylint: disable=broad-except
+            try:
+                self.lint(source_path, config_path, strict, variants, tier, cache_path)
+            except Exception:
+                pass
+
+
+    def add_includes(self, sources, cwd, include_dirs):
+        """
+        Add every file that the sources include to a dictionary of sources.
+
+        Arguments:
+        sources -- dictionary of display paths and absolute source paths.
+        cwd -- client's working directory.
+        include_dirs -- list of directories to search for included files.
+        """
+
+        def load(source_path):
+            return self.get_source(os.path.realpath(source_path))[1:]
+
+        graph = self.lint65.IncludeGraph(include_dirs, load, cwd)
+        known = set(sources.values())
+        relative = all(not os.path.isabs(path) for path in sources)
+
+        with self.lock:
+            paths = graph.walk(list(sources.values()))
+
+        for path in paths:
+            source_path = os.path.realpath(path)
+
+            if source_path not in known:
+                display_path = os.path.relpath(path, cwd) if relative else path
+                sources[display_path] = source_path
+
+
+    def check_index(self, sources, cwd, index_path, config_path, strict=False):
+        """
+        Return the warnings for rules that depend on other files. See lint65.SymbolIndex.
+
+        Arguments:
+        sources -- dictionary of display paths and absolute source paths.
+        cwd -- client's working directory.
+        index_path -- path of the symbol index relative to cwd.
+        config_path -- absolute path to a linker config.
+        strict -- Enables strict mode.
+        """
+
+        # i'd rather have a long argument list than a config object.
+        # pylint: disable=too-many-arguments
+
+        def load(source_path):
+            return self.get_source(source_path)[1:]
+
+        display_paths = {source_path: display_path for display_path, source_path in sources.items()}
+        source_paths = [sources[display_path] for display_path in sorted(sources)]
+
+        with self.lock:
+            segments, _ = self.get_segments(config_path)
+            index = self.lint65.SymbolIndex(os.path.join(cwd, index_path), segments, load, cwd)
+
+            try:
+                index.update(source_paths)
+
+                return [
+                    f'{display_paths[source_path]}{warning}'
+                    for source_path, warning in index.check(source_paths, strict)
+                ]
+            finally:
+                index.close()
+
+
+    def handle(self, request):
+        """
+        Handle a client request and return a response.
+
+        Arguments:
+        request -- request dictionary.
+        """
+
+        if request.get('command') == 'ping':
+            return {}
+
+        # parse the arguments exactly like lint65.py would.
+        # --jobs is ignored since the daemon lints in memory. see DIRECT_OPTIONS for the rest.
+        try:
+            args = self.lint65.make_parser().parse_args(request['args'])
+        except SystemExit:
+            return {'error': 'invalid arguments'}
+
+        cwd = request['cwd']
+        config_path = os.path.realpath(os.path.join(cwd, args.linker_config_path))
+        cache_path = os.path.realpath(os.path.join(cwd, args.cache)) if args.cache else None
+        strict = args.strict
+        sources = {}
+        variants = ()
+
+        # the linker config and -D symbols given without a variant make up the "default" variant.
+        if args.defines or args.variant_specs:
+            variants = (('default', config_path, self.lint65.parse_defines(args.defines or ())),)
+            variants += tuple(
+                (name, os.path.realpath(os.path.join(cwd, path)), symbols)
+                for name, path, symbols in (
+                    self.lint65.parse_variant(spec, args.defines or ())
+                    for spec in args.variant_specs or ()))
+
+        # expand directories and globs the same way lint65.py does
+        # but keep paths relative to the client if the client gave relative paths.
+        for path in args.source_paths:
+            for source_path in self.lint65.find_sources([os.path.join(cwd, path)]):
+                display_path = source_path if os.path.isabs(path) else os.path.relpath(source_path, cwd)
+                sources[display_path] = os.path.realpath(source_path)
+
+        if args.includes:
+            self.add_includes(sources, cwd, args.include_dirs or ['include'])
+
+        output = []
+
+        for display_path in sorted(sources):
+            for warning in self.lint(sources[display_path], config_path, strict, variants,
+                    args.tier, cache_path):
+                output.append(f'{display_path}{warning}')
+
+            if args.max_warnings and len(output) >= args.max_warnings:
+                return {'output': output[:args.max_warnings], 'stopped': True}
+
+        if args.index_path:
+            output += self.check_index(sources, cwd, args.index_path, config_path, strict)
+
+            if args.max_warnings and len(output) >= args.max_warnings:
+                return {'output': output[:args.max_warnings], 'stopped': True}
+
+        return {'output': output}
+
+
+class InotifyWatcher:
+    """Watch directory trees for changed source files with Linux inotify."""
+
+    def __init__(self, dirs, callback):
+        """
+        Start watching directory trees.
+
+        Raises OSError if inotify isn't available.
+
+        Arguments:
+        dirs -- list of directories to watch recursively.
+        callback -- function to call with the path of each changed source file.
+        """
+
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or None, use_errno=True)
+
+        if not hasattr(libc, 'inotify_init1'):
+            raise OSError('inotify is not available')
+
+        self.libc = libc
+        self.callback = callback
+        self.fd = libc.inotify_init1(os.O_CLOEXEC)
+        self.dirs = {}
+
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+
+        for path in dirs:
+            for root, _, _ in os.walk(path):
+                self.add_watch(root)
+
+
+    def add_watch(self, path):
+        """
+        Watch a single directory.
+
+        Arguments:
+        path -- directory to watch.
+        """
+        watch = self.libc.inotify_add_watch(self.fd, os.fsencode(path), IN_WATCH_MASK)
+
+        if watch >= 0:
+            self.dirs[watch] = path
+
+
+    def run(self):
+        """Report changed files forever."""
+
+        while True:
+            data = os.read(self.fd, 64 * 1024)
+            offset = 0
+
+            while offset < len(data):
+                watch, mask, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+                offset += INOTIFY_EVENT.size
+                name = data[offset:offset + length].rstrip(b'\0').decode('utf-8', 'replace')
+                offset += length
+
+                directory = self.dirs.get(watch)
+
+                if directory is None or not name:
+                    continue
+
+                path = os.path.join(directory, name)
+
+                if mask & IN_ISDIR:
+                    if mask & (IN_CREATE | IN_MOVED_TO):
+                        self.add_watch(path)
+                elif name.endswith(SOURCE_EXTENSIONS):
+                    self.callback(os.path.realpath(path))
+
+
+class PollingWatcher:
+    """Watch directory trees for changed source files by scanning them."""
+
+    def __init__(self, dirs, callback, interval=POLL_INTERVAL):
+        """
+        Start watching directory trees.
+
+        Arguments:
+        dirs -- list of directories to watch recursively.
+        callback -- function to call with the path of each changed source file.
+        interval -- seconds between scans.
+        """
+        self.dirs = dirs
+        self.callback = callback
+        self.interval = interval
+        self.stamps = self.scan()
+
+
+    def scan(self):
+        """Return a dictionary of source file paths and their stamps."""
+
+        stamps = {}
+
+        for path in self.dirs:
+            for root, _, files in os.walk(path):
+                for name in files:
+                    if name.endswith(SOURCE_EXTENSIONS):
+                        source_path = os.path.join(root, name)
+                        stamps[source_path] = file_stamp(source_path)
+
+        return stamps
+
+
+    def run(self):
+        """Report changed files forever."""
+
+        while True:
+            time.sleep(self.interval)
+            stamps = self.scan()
+
+            for path in set(stamps) | set(self.stamps):
+                if stamps.get(path) != self.stamps.get(path):
+                    self.callback(os.path.realpath(path))
+
+            self.stamps = stamps
+
+
+def serve(socket_path, watch_dirs):
+    """
+    Run the daemon until a client asks it to stop.
+
+    Arguments:
+    socket_path -- path of the Unix socket to listen on.
+    watch_dirs -- list of directories to watch for changed source files.
+    """
+
+    daemon = LintDaemon()
+
+    try:
+        watcher = InotifyWatcher(watch_dirs, daemon.refresh)
+    except OSError:
+        watcher = PollingWatcher(watch_dirs, daemon.refresh)
+
+    threading.Thread(target=watcher.run, daemon=True).start()
+
+    os.makedirs(os.path.dirname(socket_path), exist_ok=True)
+
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(socket_path)
+    server.listen()
+    restart = False
+
+    try:
+        while True:
+            connection, _ = server.accept()
+
+            with connection, connection.makefile('rwb') as stream:
+                request = json.loads(stream.readline().decode('utf-8'))
+
+                if request.get('command') == 'stop':
+                    stream.write(b'{}\n')
+                    break
+
+                # the rules changed. let the client lint without the daemon this time
+                # and start over with the new rules.
+                if daemon.stale():
+                    stream.write(b'{"stale": true}\n')
+                    restart = True
+                    break
+
+                # report errors to the client instead of dying.
+                # pylint: disable=broad-except
+                try:
+                    response = daemon.handle(request)
+                except Exception as error:
+                    response = {'error': f'{type(error).__name__}: {error}'}
+
+                stream.write(json.dumps(response).encode('utf-8') + b'\n')
+    finally:
+        server.close()
+        os.unlink(socket_path)
+
+    if restart:
+        os.execv(sys.executable, [sys.executable] + sys.argv)
+
+
+def send(socket_path, request):
+    """
+    Send a request to the daemon and return its response.
+
+    Raises OSError if the daemon isn't running.
+
+    Arguments:
+    socket_path -- path of the daemon's Unix socket.
+    request -- request dictionary.
+    """
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(socket_path)
+
+        with client.makefile('rwb') as stream:
+            stream.write(json.dumps(request).encode('utf-8') + b'\n')
+            stream.flush()
+            return json.loads(stream.readline().decode('utf-8'))
+
+
+def start(socket_path, watch_dirs):
+    """
+    Start the daemon in the background and wait for it to accept connections.
+
+    Arguments:
+    socket_path -- path of the Unix socket to listen on.
+    watch_dirs -- list of directories to watch for changed source files.
+    """
+
+    args = [sys.executable, os.path.abspath(__file__), '--socket', socket_path, 'serve']
+
+    for path in watch_dirs:
+        args += ['--watch', path]
+
+    subprocess.Popen(args,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True)
+
+    deadline = time.monotonic() + START_TIMEOUT
+
+    while time.monotonic() < deadline:
+        try:
+            send(socket_path, {'command': 'ping'})
+            return
+        except (OSError, ValueError):
+            time.sleep(0.05)
+
+    sys.exit('lint65d: daemon did not start')
+
+
+def lint(socket_path, lint_args):
+    """
+    Ask the daemon to lint files and print the warnings.
+    Run lint65.py directly if the daemon isn't running.
+
+    Arguments:
+    socket_path -- path of the daemon's Unix socket.
+    lint_args -- lint65.py command line arguments.
+    """
+
+    # the daemon parses the arguments so that the client doesn't need to import lint65.
+    request = {'cwd': os.getcwd(), 'args': lint_args}
+    lint65_path = os.path.join(TOOLS_DIR, 'lint65.py')
+
+    if any(arg.split('=', 1)[0] in DIRECT_OPTIONS for arg in lint_args):
+        os.execv(sys.executable, [sys.executable, lint65_path] + lint_args)
+
+    try:
+        response = send(socket_path, request)
+    except OSError:
+        os.execv(sys.executable, [sys.executable, lint65_path] + lint_args)
+
+    # the daemon is restarting with changed rules.
+    if response.get('stale'):
+        os.execv(sys.executable, [sys.executable, lint65_path] + lint_args)
+
+    if 'error' in response:
+        sys.exit(f'lint65d: {response["error"]}')
+
+    for line in response['output']:
+        print(line)
+
+    if response.get('stopped'):
+        print(f'lint65: stopped after {len(response["output"])} warnings', file=sys.stderr)
+
+    # exit like lint65.py would.
+    sys.exit(1 if response['output'] else 0)
+
+
+def main():
+    """Entry point for this script."""
+
+    parser = argparse.ArgumentParser(
+        description='Resident lint65 daemon and client.')
+
+    parser.add_argument('--socket',
+        help='path of the daemon\'s Unix socket',
+        default=os.environ.get('LINT65D_SOCKET', SOCKET_PATH))
+    parser.add_argument('--watch',
+        help='directory to watch for changed files (may be repeated)',
+        action='append',
+        metavar='DIR')
+    parser.add_argument('command',
+        help='daemon command',
+        choices=['start', 'serve', 'stop', 'lint'])
+    parser.add_argument('lint_args',
+        help='lint65.py arguments for the "lint" command',
+        nargs=argparse.REMAINDER)
+
+    args = parser.parse_args()
+    watch_dirs = [os.path.abspath(path) for path in args.watch or WATCH_DIRS]
+
+    if args.command == 'start':
+        start(args.socket, watch_dirs)
+    elif args.command == 'serve':
+        serve(args.socket, watch_dirs)
+    elif args.command == 'stop':
+        try:
+            send(args.socket, {'command': 'stop'})
+        except OSError:
+            pass
+    else:
+        lint(args.socket, args.lint_args)
+
+
+if __name__ == '__main__':
+    main()